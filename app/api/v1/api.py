@@ -2,7 +2,8 @@
 API v1 router aggregation
 """
 from fastapi import APIRouter, Depends
-from app.core.dependencies import get_current_user
+from app.core.config import settings
+from app.core.dependencies import get_current_user, get_current_user_async
 
 from app.api.v1.endpoints.auth import router as auth_router
 from app.api.v1.endpoints.users import router as users_router
@@ -12,9 +13,11 @@ from app.api.v1.endpoints.payments import router as payments_router
 from app.api.v1.endpoints.invoices import router as invoices_router
 from app.api.v1.endpoints.dashboard import router as dashboard_router
 from app.api.v1.endpoints.print_management import router as print_management_router
+from app.api.v1.endpoints.monitoring import router as monitoring_router
 
 api_router = APIRouter()
-protected_router = APIRouter(dependencies=[Depends(get_current_user)])
+# Async mode authenticates on the AsyncSession; sync endpoints reuse that principal
+protected_router = APIRouter(dependencies=[Depends(get_current_user_async if settings.ASYNC_DB_ENABLED else get_current_user)])
 
 # API v1 index route
 @api_router.get("/", tags=["Meta"])
@@ -32,7 +35,8 @@ def api_v1_index():
             "payments": "/api/v1/payments/",
             "invoices": "/api/v1/invoices/",
             "dashboard": "/api/v1/dashboard/",
-            "print": "/api/v1/print/"
+            "print": "/api/v1/print/",
+            "monitoring": "/api/v1/monitoring/"
         }
     }
 
@@ -47,6 +51,7 @@ protected_router.include_router(payments_router, prefix="/payments", tags=["Paym
 protected_router.include_router(invoices_router, prefix="/invoices", tags=["Invoices"])
 protected_router.include_router(dashboard_router, prefix="/dashboard", tags=["Dashboard & Reports"])
 protected_router.include_router(print_management_router, prefix="/print", tags=["Print Management"])
+protected_router.include_router(monitoring_router, prefix="/monitoring", tags=["Monitoring"])
 
 # Mount protected router under /api/v1
 api_router.include_router(protected_router)
\ No newline at end of file
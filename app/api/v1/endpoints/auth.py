@@ -1,25 +1,50 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import timedelta, datetime
+from typing import Optional
 import os
 import uuid
 
-from app.core.dependencies import get_db, get_current_user
+from app.core.config import settings
+from app.core.dependencies import get_db, get_async_db, get_current_user, prefer_async, rate_limiter
 from app.core.security import (
-    verify_password, create_access_token, get_password_hash, verify_token,
+    verify_password, verify_password_and_update, verify_password_and_update_async,
+    create_access_token, get_password_hash, verify_token,
     create_refresh_token, verify_refresh_token
 )
 from app.core.responses import success_response, created_response, error_response
+from app.core.auth_cache import principal_cache
 from app.models import User, UserRole, PasswordResetToken
 from app.schemas import (
     LoginRequest, Token, UserCreate, UserResponse,
     ChangePasswordRequest, ForgotPasswordRequest, ResetPasswordRequest
 )
-from app.services.email_service import EmailService
+from app.services.email_service import get_email_service
 
 router = APIRouter()
 
+# Dùng chung cho bản sync và async của /login
+login_rate_limit = rate_limiter(limit=settings.LOGIN_RATE_LIMIT, window_seconds=60, scope="login")
+
+
+async def login_async(request: LoginRequest, db: AsyncSession = Depends(get_async_db), _: bool = Depends(login_rate_limit)):
+    """Đăng nhập và trả về access token (async: bcrypt chạy trong pool hash, không chặn event loop)"""
+    user = await db.scalar(select(User).where(User.email == request.email))
+    
+    _check_login_role(user)
+    password_ok, new_hash = await verify_password_and_update_async(request.password, user.hashed_password)
+    _check_login_result(user, password_ok)
+    if new_hash:
+        # BCRYPT_ROUNDS đã đổi: lưu hash theo cost mới khi còn mật khẩu gốc trong tay
+        user.hashed_password = new_hash
+        await db.commit()
+        principal_cache.invalidate(user.email)
+    return _login_response(user)
+
+
 @router.post("/login", summary="Cấp token (Admin)", description="Đăng nhập bằng tài khoản Admin để nhận Bearer token. Tất cả API khác yêu cầu token này.", openapi_extra={
     "x-codeSamples": [
         {
@@ -36,16 +61,31 @@ router = APIRouter()
         }
     ]
 })
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+@prefer_async(login_async)
+def login(request: LoginRequest, db: Session = Depends(get_db), _: bool = Depends(login_rate_limit)):
     """Đăng nhập và trả về access token"""
     # Tìm user
     user = db.query(User).filter(User.email == request.email).first()
     
+    _check_login_role(user)
+    password_ok, new_hash = verify_password_and_update(request.password, user.hashed_password)
+    _check_login_result(user, password_ok)
+    if new_hash:
+        # BCRYPT_ROUNDS đã đổi: lưu hash theo cost mới khi còn mật khẩu gốc trong tay
+        user.hashed_password = new_hash
+        db.commit()
+        principal_cache.invalidate(user.email)
+    return _login_response(user)
+
+
+def _check_login_role(user: Optional[User]):
     # Chỉ cho phép Admin lấy token hệ thống
     if not user or user.role != UserRole.ADMIN:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Chỉ Admin được phép lấy token")
-    
-    if not user or not verify_password(request.password, user.hashed_password):
+
+
+def _check_login_result(user: User, password_ok: bool):
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email hoặc mật khẩu không đúng"
@@ -56,8 +96,9 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Tài khoản đã bị vô hiệu hóa"
         )
-    
-    from app.core.config import settings
+
+
+def _login_response(user: User):
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.email, "user_id": user.id, "role": user.role.value},
@@ -176,11 +217,16 @@ def change_password(payload: ChangePasswordRequest, current_user: User = Depends
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Mật khẩu hiện tại không đúng")
     current_user.hashed_password = get_password_hash(payload.new_password)
     db.commit()
+    principal_cache.invalidate(current_user.email)
     return success_response(message="Đổi mật khẩu thành công")
 
 
 @router.post("/forgot-password", summary="Quên mật khẩu")
-def forgot_password(payload: ForgotPasswordRequest, db: Session = Depends(get_db)):
+def forgot_password(
+    payload: ForgotPasswordRequest,
+    db: Session = Depends(get_db),
+    _: bool = Depends(rate_limiter(limit=settings.FORGOT_PASSWORD_RATE_LIMIT, window_seconds=60, scope="forgot-password"))
+):
     user = db.query(User).filter(User.email == payload.email).first()
     # Không tiết lộ tồn tại hay không
     if user:
@@ -188,12 +234,12 @@ def forgot_password(payload: ForgotPasswordRequest, db: Session = Depends(get_db
         expires = datetime.utcnow() + timedelta(hours=1)
         token = PasswordResetToken(user_id=user.id, token=token_str, expires_at=expires)
         db.add(token)
-        db.commit()
         reset_url = f"{os.getenv('BASE_URL', 'http://localhost:5000')}/reset-password?token={token_str}"
-        try:
-            EmailService().send_password_reset(user.email, user.name, reset_url)
-        except Exception:
-            pass
+        # Token và email được ghi cùng transaction; worker gửi email sau khi commit
+        get_email_service().queue_email(
+            db, "password_reset", recipient_email=user.email, recipient_name=user.name, reset_url=reset_url
+        )
+        db.commit()
     return success_response(message="Nếu email tồn tại, đường dẫn đặt lại đã được gửi")
 
 
@@ -208,6 +254,7 @@ def reset_password(payload: ResetPasswordRequest, db: Session = Depends(get_db))
     user.hashed_password = get_password_hash(payload.new_password)
     token.used = True
     db.commit()
+    principal_cache.invalidate(user.email)
     return success_response(message="Đặt lại mật khẩu thành công")
 
 
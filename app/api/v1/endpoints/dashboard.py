@@ -3,19 +3,26 @@ Router cho Dashboard và Báo cáo
 Cung cấp dữ liệu dashboard cho các role khác nhau
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime, timedelta
-from app.core.dependencies import get_db, get_current_user
-from app.models import User, UserRole
+from app.core.dependencies import get_read_db, get_async_db, get_current_user, get_current_user_async, prefer_async
+from app.core.cache import result_cache, invalidate_on_commit
+from app.models import User, UserRole, Order, Payment, Invoice, Student
 from app.services.dashboard_service import DashboardService
 
 router = APIRouter()
 
+# Dashboard/báo cáo của nhân viên được cache ngắn hạn (DASHBOARD_CACHE_TTL)
+# và bị xóa ngay khi có giao dịch ghi orders/payments/invoices/students được commit
+DASHBOARD_CACHE = "dashboard"
+invalidate_on_commit(result_cache, DASHBOARD_CACHE, Order, Payment, Invoice, Student)
+
 @router.get("/admin")
 def get_admin_dashboard(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Dashboard cho Admin - tổng quan toàn hệ thống"""
     if current_user.role != UserRole.ADMIN:
@@ -26,7 +33,7 @@ def get_admin_dashboard(
     
     try:
         dashboard_service = DashboardService(db)
-        return dashboard_service.get_admin_dashboard()
+        return result_cache.get_or_set(DASHBOARD_CACHE, "admin", dashboard_service.get_admin_dashboard)
     except Exception as e:
         print(f"Error getting admin dashboard: {e}")
         raise HTTPException(
@@ -37,7 +44,7 @@ def get_admin_dashboard(
 @router.get("/accountant")
 def get_accountant_dashboard(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Dashboard cho Kế toán - tập trung vào hóa đơn và doanh thu"""
     if current_user.role not in [UserRole.ADMIN, UserRole.ACCOUNTANT]:
@@ -48,7 +55,7 @@ def get_accountant_dashboard(
     
     try:
         dashboard_service = DashboardService(db)
-        return dashboard_service.get_accountant_dashboard()
+        return result_cache.get_or_set(DASHBOARD_CACHE, "accountant", dashboard_service.get_accountant_dashboard)
     except Exception as e:
         print(f"Error getting accountant dashboard: {e}")
         raise HTTPException(
@@ -59,7 +66,7 @@ def get_accountant_dashboard(
 @router.get("/teacher")
 def get_teacher_dashboard(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Dashboard cho Giáo vụ - tập trung vào học sinh và khoản phí"""
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
@@ -70,7 +77,7 @@ def get_teacher_dashboard(
     
     try:
         dashboard_service = DashboardService(db)
-        return dashboard_service.get_teacher_dashboard()
+        return result_cache.get_or_set(DASHBOARD_CACHE, "teacher", dashboard_service.get_teacher_dashboard)
     except Exception as e:
         print(f"Error getting teacher dashboard: {e}")
         raise HTTPException(
@@ -78,10 +85,34 @@ def get_teacher_dashboard(
             detail="Lỗi hệ thống khi tải dashboard"
         )
 
+async def get_parent_dashboard_async(
+    compact: bool = Query(False, description="Chỉ trả về tổng quan và thông tin từng con"),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Dashboard cho Phụ huynh (async: truy vấn qua AsyncSession)"""
+    if current_user.role != UserRole.PARENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Chỉ phụ huynh mới có quyền xem dashboard này"
+        )
+    
+    try:
+        dashboard_service = DashboardService(db)
+        return await dashboard_service.get_parent_dashboard_async(current_user.id, compact=compact)
+    except Exception as e:
+        print(f"Error getting parent dashboard: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Lỗi hệ thống khi tải dashboard"
+        )
+
 @router.get("/parent")
+@prefer_async(get_parent_dashboard_async)
 def get_parent_dashboard(
+    compact: bool = Query(False, description="Chỉ trả về tổng quan và thông tin từng con"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Dashboard cho Phụ huynh - chỉ xem thông tin của con mình"""
     if current_user.role != UserRole.PARENT:
@@ -92,7 +123,7 @@ def get_parent_dashboard(
     
     try:
         dashboard_service = DashboardService(db)
-        return dashboard_service.get_parent_dashboard(current_user.id)
+        return dashboard_service.get_parent_dashboard(current_user.id, compact=compact)
     except Exception as e:
         print(f"Error getting parent dashboard: {e}")
         raise HTTPException(
@@ -106,7 +137,7 @@ def get_revenue_report(
     end_date: datetime = Query(..., description="Ngày kết thúc"),
     group_by: str = Query("day", description="Nhóm theo: day, week, month"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Báo cáo doanh thu theo khoảng thời gian"""
     if current_user.role not in [UserRole.ADMIN, UserRole.ACCOUNTANT]:
@@ -123,7 +154,14 @@ def get_revenue_report(
     
     try:
         dashboard_service = DashboardService(db)
-        return dashboard_service.generate_revenue_report(start_date, end_date, group_by)
+        cache_key = result_cache.make_key(
+            "revenue", start_date=start_date.isoformat(), end_date=end_date.isoformat(), group_by=group_by
+        )
+        return result_cache.get_or_set(
+            DASHBOARD_CACHE,
+            cache_key,
+            lambda: dashboard_service.generate_revenue_report(start_date, end_date, group_by)
+        )
     except Exception as e:
         print(f"Error generating revenue report: {e}")
         raise HTTPException(
@@ -135,7 +173,7 @@ def get_revenue_report(
 def get_collection_report(
     class_name: Optional[str] = Query(None, description="Lớp cụ thể (để trống để xem tất cả)"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Báo cáo thu học phí theo lớp"""
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER, UserRole.ACCOUNTANT]:
@@ -146,7 +184,11 @@ def get_collection_report(
     
     try:
         dashboard_service = DashboardService(db)
-        return dashboard_service.get_collection_report(class_name)
+        return result_cache.get_or_set(
+            DASHBOARD_CACHE,
+            result_cache.make_key("collection", class_name=class_name),
+            lambda: dashboard_service.get_collection_report(class_name)
+        )
     except Exception as e:
         print(f"Error generating collection report: {e}")
         raise HTTPException(
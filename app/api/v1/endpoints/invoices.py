@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import FileResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.core.responses import paginated_response
-from app.core.dependencies import get_db, get_current_user
+from app.core.responses import PaginatedResponse
+from app.core.pagination import PageParams, page_params, paginate
+from app.core.dependencies import get_db, get_read_db, open_read_session, get_current_user
+from app.core.export import stream_export
 from app.models import User, Order, Payment, Invoice, UserRole, OrderStatus, PaymentStatus
 from app.schemas import InvoiceResponse
 from app.services.invoice_service import InvoiceService
-from app.services.email_service import EmailService
 import os
 from datetime import datetime
 
@@ -36,33 +38,13 @@ def generate_invoice(
         # Lấy thông tin hóa đơn vừa tạo
         invoice = db.query(Invoice).filter(Invoice.id == invoice_result["invoice_id"]).first()
         
-        # Gửi email nếu yêu cầu
+        # Xếp email hóa đơn vào hàng đợi nếu yêu cầu (worker gửi, request không chờ SMTP)
         if send_email:
             try:
-                from app.models import Student, Order
-                order = db.query(Order).filter(Order.id == order_id).first()
-                student = db.query(Student).filter(Student.id == order.student_id).first()
-                parent = db.query(User).filter(User.id == student.user_id).first()
-                
-                email_service = EmailService()
-                email_service.send_invoice_email(
-                    recipient_email=parent.email,
-                    recipient_name=parent.name,
-                    invoice_data={
-                        'invoice_number': invoice.invoice_number,
-                        'invoice_code': invoice.invoice_code,
-                        'lookup_code': invoice.e_invoice_code,
-                        'student_name': student.name,
-                        'class_name': student.class_name,
-                        'description': order.description,
-                        'total_amount': invoice.total_amount
-                    },
-                    pdf_path=invoice.pdf_path,
-                    xml_path=invoice.xml_path
-                )
+                invoice_service.queue_invoice_email(invoice.id)
             except Exception as email_error:
                 # Log error nhưng không fail việc tạo hóa đơn
-                print(f"Error sending invoice email: {email_error}")
+                print(f"Error queueing invoice email: {email_error}")
         
         return invoice
         
@@ -78,26 +60,40 @@ def generate_invoice(
             detail="Lỗi hệ thống khi tạo hóa đơn"
         )
 
-@router.get("/")
+@router.get("/", response_model=PaginatedResponse[InvoiceResponse])
 def get_invoices(
-    skip: int = 0,
-    limit: int = 100,
+    paging: PageParams = Depends(page_params),
     q: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách hóa đơn"""
-    query = db.query(Invoice)
+    return paginate(db, _invoices_statement(q, current_user), Invoice.id, paging, InvoiceResponse)
+
+@router.get("/export")
+def export_invoices(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    q: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Xuất toàn bộ hóa đơn (NDJSON/CSV, stream theo lô)"""
+    columns = [Invoice.id, Invoice.invoice_number, Invoice.invoice_code, Invoice.e_invoice_code, Invoice.order_id,
+               Invoice.customer_name, Invoice.customer_tax_code, Invoice.amount, Invoice.tax_amount,
+               Invoice.total_amount, Invoice.issued_at]
+    return stream_export(lambda: open_read_session(request), _invoices_statement(q, current_user), columns, format, "invoices")
+
+def _invoices_statement(q: Optional[str], current_user: User):
+    """Câu truy vấn hóa đơn dùng chung cho danh sách và xuất file"""
+    stmt = select(Invoice)
     if q:
         like = f"%{q}%"
-        query = query.filter((Invoice.invoice_number.ilike(like)) | (Invoice.e_invoice_code.ilike(like)))
+        stmt = stmt.where((Invoice.invoice_number.ilike(like)) | (Invoice.e_invoice_code.ilike(like)))
     if current_user.role == UserRole.PARENT:
         # Phụ huynh chỉ xem hóa đơn của học sinh mình
         from app.models import Student
-        query = query.join(Order).join(Student).filter(Student.user_id == current_user.id)
-    total = query.count()
-    data = query.offset(skip).limit(limit).all()
-    return paginated_response(data=data, total=total, page=(skip // max(limit,1)) + 1, per_page=limit)
+        stmt = stmt.join(Order).join(Student).where(Student.user_id == current_user.id)
+    return stmt
 
 @router.get("/lookup/{code}")
 def lookup_invoice_by_code(
@@ -148,10 +144,10 @@ def resend_invoice(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền")
     try:
         service = InvoiceService(db)
-        ok = service.resend_invoice_email(invoice_id)
+        ok = service.queue_invoice_email(invoice_id)
         if not ok:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Không thể gửi email hóa đơn")
-        return {"message": "Đã gửi lại email hóa đơn"}
+        return {"message": "Đã xếp email hóa đơn vào hàng đợi gửi lại"}
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
@@ -0,0 +1,102 @@
+"""
+Router cho giám sát hệ thống (chỉ admin)
+Cung cấp số liệu cache, xác thực, hàng đợi webhook, SMTP và connection pool để theo dõi hiệu năng
+"""
+from fastapi import APIRouter, Depends
+from app.core.dependencies import require_admin
+from app.core.cache import result_cache
+from app.core.qr_cache import qr_image_cache
+from app.core.auth_cache import principal_cache
+from app.core.auth_metrics import auth_metrics
+from app.core.config import settings
+from app.core.security import password_hasher
+from app.core.rate_limit import limiter
+from app.core.read_routing import read_router
+from app.core.smtp_pool import smtp_pool_stats
+from app.services.email_worker import email_worker
+from app.services.webhook_worker import webhook_worker
+from app.database import (
+    engine, pool_metrics, async_engine, async_pool_metrics, replica_engine, replica_pool_metrics
+)
+from app.models import User
+
+router = APIRouter()
+
+@router.get("/cache")
+def get_cache_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Số lần hit/miss/invalidate của cache kết quả theo namespace"""
+    return result_cache.stats()
+
+@router.get("/qr-cache")
+def get_qr_cache_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Cache ảnh QR: số lần lấy từ bộ nhớ/đĩa, số lần phải vẽ lại và số ảnh đang giữ"""
+    return qr_image_cache.stats()
+
+@router.get("/auth")
+def get_auth_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Số lần hit/miss của cache người dùng, số lần giải mã token / tải user mỗi request và hàng đợi hash mật khẩu"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "resolution": auth_metrics.stats(),
+        "password_hashing": {"bcrypt_rounds": settings.BCRYPT_ROUNDS, **password_hasher.stats()}
+    }
+
+@router.get("/rate-limit")
+def get_rate_limit_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Số request được chấp nhận/bị chặn theo từng nhóm giới hạn và số IP đang theo dõi"""
+    return limiter.stats()
+
+@router.get("/webhooks")
+def get_webhook_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Hàng đợi webhook: số sự kiện theo trạng thái, tuổi sự kiện chờ lâu nhất, độ trễ xử lý, số lần thử lại/thất bại"""
+    return webhook_worker.stats()
+
+@router.get("/email")
+def get_email_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Hàng đợi email (số email theo trạng thái, email chờ lâu nhất, các email thất bại gần nhất)
+    và phiên SMTP dùng chung: số kết nối mở/tái sử dụng/kết nối lại, số email gửi và tốc độ gửi theo lô"""
+    return {"outbox": email_worker.stats(), "smtp_pools": smtp_pool_stats()}
+
+@router.get("/db-pool")
+def get_db_pool_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Trạng thái connection pool: số kết nối đang dùng, thời gian chờ lấy kết nối, số lần timeout"""
+    result = {
+        "config": {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "pool_recycle": settings.DB_POOL_RECYCLE,
+            "pool_pre_ping": settings.DB_POOL_PRE_PING,
+            "isolation_level": settings.DB_ISOLATION_LEVEL
+        },
+        "sync": {
+            "pool": engine.pool.status(),
+            **pool_metrics.stats()
+        }
+    }
+    if replica_engine is not None:
+        result["replica"] = {
+            "pool": replica_engine.pool.status(),
+            **replica_pool_metrics.stats(),
+            "routing": read_router.stats()
+        }
+    if async_engine is not None:
+        result["async"] = {
+            "pool": async_engine.pool.status(),
+            **async_pool_metrics.stats()
+        }
+    return result
@@ -1,35 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.core.responses import paginated_response
-from app.core.dependencies import get_db, get_current_user
-from app.models import User, Student, Order, UserRole, OrderStatus
+from app.core.responses import PaginatedResponse
+from app.core.pagination import PageParams, page_params, count_statement, page_statement, page_response, paginate
+from app.core.dependencies import get_db, get_read_db, open_read_session, get_async_db, get_current_user, get_current_user_async, prefer_async
+from app.core.export import stream_export
+from app.models import User, Student, Order, UserRole, OrderStatus, JobState
 from app.schemas import OrderCreate, OrderResponse
+from app.services.reminder_service import reminder_engine
+from app.services.rollup_service import RollupService
 import uuid
 
 router = APIRouter()
 
-@router.get("/")
+def _orders_statement(status_filter: Optional[str], class_name: Optional[str], current_user: User):
+    """Câu truy vấn danh sách đơn hàng dùng chung cho bản sync và async"""
+    stmt = select(Order)
+    if status_filter:
+        stmt = stmt.where(Order.status == status_filter)
+    if class_name or current_user.role == UserRole.PARENT:
+        stmt = stmt.join(Student, Order.student_id == Student.id)
+    if class_name:
+        stmt = stmt.where(Student.class_name == class_name)
+    if current_user.role == UserRole.PARENT:
+        # Phụ huynh chỉ xem đơn hàng của học sinh mình
+        stmt = stmt.where(Student.user_id == current_user.id)
+    return stmt
+
+
+async def get_orders_async(
+    paging: PageParams = Depends(page_params),
+    status_filter: Optional[str] = None,
+    class_name: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lấy danh sách đơn hàng (async)"""
+    stmt = _orders_statement(status_filter, class_name, current_user)
+    count_stmt = count_statement(stmt, paging)
+    total = await db.scalar(count_stmt) if count_stmt is not None else None
+    data = (await db.scalars(page_statement(stmt, Order.id, paging, OrderResponse))).all()
+    return page_response(data, total, paging)
+
+
+@router.get("/", response_model=PaginatedResponse[OrderResponse])
+@prefer_async(get_orders_async)
 def get_orders(
-    skip: int = 0,
-    limit: int = 100,
+    paging: PageParams = Depends(page_params),
     status_filter: Optional[str] = None,
     class_name: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách đơn hàng"""
-    query = db.query(Order)
-    if status_filter:
-        query = query.filter(Order.status == status_filter)
-    if class_name:
-        query = query.join(Student).filter(Student.class_name == class_name)
-    if current_user.role == UserRole.PARENT:
-        # Phụ huynh chỉ xem đơn hàng của học sinh mình
-        query = query.join(Student).filter(Student.user_id == current_user.id)
-    total = query.count()
-    data = query.offset(skip).limit(limit).all()
-    return paginated_response(data=data, total=total, page=(skip // max(limit,1)) + 1, per_page=limit)
+    stmt = _orders_statement(status_filter, class_name, current_user)
+    return paginate(db, stmt, Order.id, paging, OrderResponse)
+
+@router.get("/export")
+def export_orders(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status_filter: Optional[str] = None,
+    class_name: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Xuất toàn bộ đơn hàng (NDJSON/CSV, stream theo lô)"""
+    stmt = _orders_statement(status_filter, class_name, current_user)
+    columns = [Order.id, Order.order_code, Order.student_id, Order.description, Order.amount,
+               Order.status, Order.due_date, Order.created_at]
+    return stream_export(lambda: open_read_session(request), stmt, columns, format, "orders")
 
 @router.post("/", response_model=OrderResponse)
 def create_order(
@@ -67,6 +108,7 @@ def create_order(
     )
     
     db.add(db_order)
+    RollupService(db).record_order_created(db_order, student.class_name)
     db.commit()
     db.refresh(db_order)
     
@@ -81,6 +123,7 @@ def bulk_create_orders(
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền")
     created = []
+    created_by_class = {}
     for data in orders:
         student = db.query(Student).filter(Student.id == data.student_id).first()
         if not student:
@@ -97,45 +140,38 @@ def bulk_create_orders(
         )
         db.add(db_order)
         created.append(db_order)
+        created_by_class.setdefault(student.class_name, []).append(db_order)
+    RollupService(db).record_orders_created(created_by_class)
     db.commit()
     for o in created:
         db.refresh(o)
     return {"created": len(created), "orders": created}
 
-@router.post("/reminders")
+@router.post("/reminders", status_code=status.HTTP_202_ACCEPTED)
 def send_overdue_reminders(
     class_name: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Bắt đầu job nhắc nhở các khoản quá hạn (mỗi phụ huynh một email tổng hợp); theo dõi qua /reminders/{job_id}"""
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER, UserRole.ACCOUNTANT]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền")
-    from app.services.email_service import EmailService
-    from sqlalchemy import and_
-    from datetime import datetime
-    q = db.query(Order, Student, User).join(Student, Order.student_id == Student.id).join(User, Student.user_id == User.id).filter(
-        and_(Order.status == OrderStatus.PENDING, Order.due_date != None, Order.due_date < datetime.now())
-    )
-    if class_name:
-        q = q.filter(Student.class_name == class_name)
-    rows = q.all()
-    by_parent = {}
-    for order, student, parent in rows:
-        by_parent.setdefault(parent.email, []).append({
-            'parent_email': parent.email,
-            'parent_name': parent.name,
-            'student_name': student.name,
-            'class_name': student.class_name,
-            'description': order.description,
-            'amount': float(order.amount),
-            'due_date': order.due_date.strftime('%d/%m/%Y') if order.due_date else None
-        })
-    email = EmailService()
-    sent = 0
-    for parent_email, orders_list in by_parent.items():
-        if email.send_payment_reminder([parent_email], orders_list):
-            sent += 1
-    return {"parents_notified": sent}
+    job_id = reminder_engine.submit(db, class_name=class_name, requested_by=current_user.id)
+    return {"job_id": job_id, "state": JobState.PENDING.value}
+
+@router.get("/reminders/{job_id}")
+def get_reminder_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Tiến độ job nhắc nhở: số phụ huynh đã xử lý/xếp email/bỏ qua (đã nhắc gần đây) và trạng thái gửi email"""
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER, UserRole.ACCOUNTANT]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền")
+    progress = reminder_engine.progress(db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy job nhắc nhở")
+    return progress
 
 @router.get("/{order_id}", response_model=OrderResponse)
 def get_order(
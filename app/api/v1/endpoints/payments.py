@@ -1,19 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
+from sqlalchemy import select
 from typing import List, Optional
-from app.core.responses import paginated_response
-from fastapi import Request
-from app.core.dependencies import get_db, get_current_user, rate_limiter
-from app.models import User, Order, Payment, UserRole, PaymentStatus, OrderStatus
+from app.core.config import settings
+from app.core.responses import PaginatedResponse
+from app.core.pagination import PageParams, page_params, paginate
+from app.core.dependencies import get_db, get_read_db, open_read_session, get_async_db, get_current_user, get_current_user_async, rate_limiter, prefer_async
+from app.core.export import stream_export
+from app.models import User, Student, Order, Payment, UserRole, PaymentStatus, OrderStatus
 from app.schemas import PaymentCreate, PaymentResponse, QRCodeResponse
-from app.services.payment_service import PaymentService
-from app.services.email_service import EmailService
+from app.services.payment_service import PaymentService, WebhookResult
+from app.services.webhook_worker import webhook_worker
 import uuid
 from decimal import Decimal
 
 router = APIRouter()
 
+async def create_qr_payment_async(
+    payment_data: PaymentCreate,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Tạo QR code cho thanh toán (async: truy vấn qua AsyncSession, vẽ QR trong threadpool)"""
+    row = (await db.execute(_payable_order_statement(payment_data.order_id))).first()
+    _check_payable(row, current_user)
+    
+    try:
+        payment_response = await PaymentService(db).create_payment_request_async(
+            order_id=payment_data.order_id,
+            amount=payment_data.amount
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Lỗi hệ thống khi tạo thanh toán"
+        )
+    return _qr_response(payment_response, payment_data)
+
+
 @router.post(
     "/create-qr",
     response_model=QRCodeResponse,
@@ -36,29 +63,63 @@ router = APIRouter()
         ]
     }
 )
+@prefer_async(create_qr_payment_async)
 def create_qr_payment(
     payment_data: PaymentCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Tạo QR code cho thanh toán sử dụng PaymentService"""
+    return _create_qr_payment(db, payment_data, current_user)
+
+
+def _create_qr_payment(db: Session, payment_data: PaymentCreate, current_user: User) -> QRCodeResponse:
+    """Logic tạo QR của bản sync"""
+    row = db.execute(_payable_order_statement(payment_data.order_id)).first()
+    _check_payable(row, current_user)
+    
+    try:
+        # Sử dụng PaymentService để tạo thanh toán
+        payment_service = PaymentService(db)
+        payment_response = payment_service.create_payment_request(
+            order_id=payment_data.order_id,
+            amount=payment_data.amount
+        )
+        
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Lỗi hệ thống khi tạo thanh toán"
+        )
+    return _qr_response(payment_response, payment_data)
+
+
+def _payable_order_statement(order_id: int):
+    """(order, học sinh) trong một truy vấn"""
+    return select(Order, Student).outerjoin(Student, Student.id == Order.student_id).where(Order.id == order_id)
+
+
+def _check_payable(row, current_user: User) -> None:
+    """Kiểm tra (order, học sinh) trước khi tạo QR, dùng chung cho bản sync và async"""
     # Kiểm tra đơn hàng tồn tại
-    order = db.query(Order).filter(Order.id == payment_data.order_id).first()
-    if not order:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy đơn hàng"
         )
+    order, student = row
     
     # Kiểm tra quyền thanh toán (phụ huynh chỉ thanh toán cho con mình)
-    if current_user.role == UserRole.PARENT:
-        from app.models import Student
-        student = db.query(Student).filter(Student.id == order.student_id).first()
-        if student and student.user_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Không có quyền thanh toán đơn hàng này"
-            )
+    if current_user.role == UserRole.PARENT and student and student.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Không có quyền thanh toán đơn hàng này"
+        )
     
     # Kiểm tra đơn hàng chưa được thanh toán
     if order.status != OrderStatus.PENDING:
@@ -66,37 +127,38 @@ def create_qr_payment(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Đơn hàng đã được thanh toán hoặc đã có hóa đơn"
         )
-    
+
+
+def _qr_response(payment_response: dict, payment_data: PaymentCreate) -> QRCodeResponse:
+    return QRCodeResponse(
+        payment_id=payment_response["payment_id"],
+        qr_code_data=payment_response["qr_code_image"],
+        amount=payment_data.amount,
+        order_code=payment_response["order_code"]
+    )
+
+async def payment_webhook_async(webhook_data: dict, request: Request, db: AsyncSession = Depends(get_async_db), _: bool = Depends(rate_limiter(limit=settings.WEBHOOK_RATE_LIMIT, window_seconds=60, scope="webhook"))):
+    """Webhook nhận thông báo thanh toán (async: ghi outbox qua AsyncSession)"""
     try:
-        # Sử dụng PaymentService để tạo thanh toán
         payment_service = PaymentService(db)
-        payment_response = payment_service.create_payment_request(
-            order_id=payment_data.order_id,
-            amount=payment_data.amount
-        )
+        _verify_webhook_signature(payment_service, webhook_data, request.headers.get("X-Signature", ""))
+        result = _accept_webhook(await payment_service.enqueue_webhook_async(webhook_data))
+        return _webhook_response(result)
         
-        return QRCodeResponse(
-            payment_id=payment_response["payment_id"],
-            qr_code_data=payment_response["qr_code_image"],
-            amount=payment_data.amount,
-            order_code=payment_response["order_code"]
-        )
-        
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+    except HTTPException:
+        raise
     except Exception as e:
+        print(f"Error processing webhook: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Lỗi hệ thống khi tạo thanh toán"
+            detail="Lỗi hệ thống khi xử lý webhook"
         )
 
+
 @router.post(
     "/webhook",
     summary="Webhook thanh toán",
-    description="Cổng thanh toán gọi vào endpoint này để báo kết quả giao dịch (server-to-server).",
+    description="Cổng thanh toán gọi vào endpoint này để báo kết quả giao dịch (server-to-server). Sự kiện được ghi vào hàng đợi và trả 200 ngay; đơn hàng được cập nhật và email được gửi bởi worker nền.",
     openapi_extra={
         "x-codeSamples": [
             {
@@ -106,56 +168,15 @@ def create_qr_payment(
         ]
     }
 )
-def payment_webhook(webhook_data: dict, request: Request, db: Session = Depends(get_db), _: bool = Depends(rate_limiter(limit=60, window_seconds=60))):
+@prefer_async(payment_webhook_async)
+def payment_webhook(webhook_data: dict, request: Request, db: Session = Depends(get_db), _: bool = Depends(rate_limiter(limit=settings.WEBHOOK_RATE_LIMIT, window_seconds=60, scope="webhook"))):
     """Webhook nhận thông báo thanh toán từ cổng thanh toán"""
     try:
-        # Verify signature header
-        signature = request.headers.get("X-Signature", "")
-        if not PaymentService(db).gateway.verify_webhook(webhook_data, signature):
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
-        # Sử dụng PaymentService để xử lý webhook
-        payment_service = PaymentService(db)
-        success = payment_service.process_webhook(webhook_data)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Không thể xử lý webhook"
-            )
-        
-        # Nếu thanh toán thành công, gửi email thông báo
-        if webhook_data.get("status") == "success":
-            try:
-                payment = db.query(Payment).filter(
-                    Payment.payment_code == webhook_data.get("payment_code")
-                ).first()
-                
-                if payment:
-                    order = db.query(Order).filter(Order.id == payment.order_id).first()
-                    if order:
-                        from app.models import Student
-                        student = db.query(Student).filter(Student.id == order.student_id).first()
-                        parent = db.query(User).filter(User.id == student.user_id).first()
-                        
-                        # Gửi email xác nhận thanh toán
-                        email_service = EmailService()
-                        email_service.send_payment_confirmation(
-                            recipient_email=parent.email,
-                            recipient_name=parent.name,
-                            payment_data={
-                                'payment_code': payment.payment_code,
-                                'amount': payment.amount,
-                                'student_name': student.name,
-                                'description': order.description,
-                                'paid_at': payment.paid_at.strftime('%d/%m/%Y %H:%M') if payment.paid_at else None
-                            }
-                        )
-            except Exception as email_error:
-                # Log error nhưng không fail webhook
-                print(f"Error sending payment confirmation email: {email_error}")
-        
-        return {"message": "Webhook xử lý thành công"}
+        result = _enqueue_webhook(db, webhook_data, request.headers.get("X-Signature", ""))
+        return _webhook_response(result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing webhook: {e}")
         raise HTTPException(
@@ -163,32 +184,83 @@ def payment_webhook(webhook_data: dict, request: Request, db: Session = Depends(
             detail="Lỗi hệ thống khi xử lý webhook"
         )
 
+
+def _enqueue_webhook(db: Session, webhook_data: dict, signature: str) -> WebhookResult:
+    """Xác minh chữ ký và ghi webhook vào outbox; worker nền cập nhật đơn hàng và gửi email"""
+    payment_service = PaymentService(db)
+    _verify_webhook_signature(payment_service, webhook_data, signature)
+    return _accept_webhook(payment_service.enqueue_webhook(webhook_data))
+
+
+def _verify_webhook_signature(payment_service: PaymentService, webhook_data: dict, signature: str) -> None:
+    if not payment_service.gateway.verify_webhook(webhook_data, signature):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
+
+
+def _accept_webhook(result: WebhookResult) -> WebhookResult:
+    """Báo lỗi nếu webhook bị từ chối, đánh thức worker nếu vừa xếp hàng"""
+    if result == WebhookResult.REJECTED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Không thể xử lý webhook"
+        )
+    if result == WebhookResult.QUEUED:
+        webhook_worker.notify()
+    return result
+
+
+def _webhook_response(result: WebhookResult) -> dict:
+    if result == WebhookResult.DUPLICATE:
+        return {"message": "Webhook đã được tiếp nhận trước đó", "result": result.value}
+    return {"message": "Webhook đã được tiếp nhận", "result": result.value}
+
 @router.get(
     "/",
+    response_model=PaginatedResponse[PaymentResponse],
     summary="Danh sách thanh toán",
     description="Trả về danh sách giao dịch thanh toán. Phụ huynh chỉ xem được giao dịch của con mình."
 )
 def get_payments(
-    skip: int = 0,
-    limit: int = 100,
+    paging: PageParams = Depends(page_params),
     status_filter: Optional[str] = None,
     q: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách thanh toán"""
-    query = db.query(Payment)
+    stmt = _payments_statement(status_filter, q, current_user)
+    return paginate(db, stmt, Payment.id, paging, PaymentResponse)
+
+@router.get(
+    "/export",
+    summary="Xuất danh sách thanh toán",
+    description="Xuất toàn bộ giao dịch thanh toán dạng NDJSON hoặc CSV, stream theo lô nên không giới hạn số dòng."
+)
+def export_payments(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status_filter: Optional[str] = None,
+    q: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Xuất toàn bộ thanh toán (NDJSON/CSV, stream theo lô)"""
+    stmt = _payments_statement(status_filter, q, current_user)
+    columns = [Payment.id, Payment.payment_code, Payment.order_id, Payment.gateway_txn_id, Payment.amount,
+               Payment.status, Payment.payment_method, Payment.paid_at, Payment.created_at]
+    return stream_export(lambda: open_read_session(request), stmt, columns, format, "payments")
+
+def _payments_statement(status_filter: Optional[str], q: Optional[str], current_user: User):
+    """Câu truy vấn thanh toán dùng chung cho danh sách và xuất file"""
+    stmt = select(Payment)
     if status_filter:
-        query = query.filter(Payment.status == status_filter)
+        stmt = stmt.where(Payment.status == status_filter)
     if q:
-        query = query.filter(Payment.payment_code.ilike(f"%{q}%"))
+        stmt = stmt.where(Payment.payment_code.ilike(f"%{q}%"))
     if current_user.role == UserRole.PARENT:
         # Phụ huynh chỉ xem thanh toán của học sinh mình
         from app.models import Student
-        query = query.join(Order).join(Student).filter(Student.user_id == current_user.id)
-    total = query.count()
-    data = query.offset(skip).limit(limit).all()
-    return paginated_response(data=data, total=total, page=(skip // max(limit,1)) + 1, per_page=limit)
+        stmt = stmt.join(Order).join(Student).where(Student.user_id == current_user.id)
+    return stmt
 
 @router.get(
     "/{payment_id}",
@@ -232,16 +304,13 @@ def manual_confirm_payment(
 ):
     if current_user.role not in [UserRole.ADMIN, UserRole.ACCOUNTANT]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền")
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    payment_service = PaymentService(db)
+    payment = payment_service.lock_payment(payment_id)
     if not payment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy giao dịch")
     if payment.status == PaymentStatus.SUCCESS:
         return {"message": "Giao dịch đã ở trạng thái thành công"}
-    payment.status = PaymentStatus.SUCCESS
-    payment.paid_at = func.now()
-    order = db.query(Order).filter(Order.id == payment.order_id).first()
-    if order and order.status == OrderStatus.PENDING:
-        order.status = OrderStatus.PAID
+    payment_service.confirm_payment(payment)
     db.commit()
     return {"message": "Đã xác nhận thanh toán thành công"}
 
@@ -255,10 +324,11 @@ def refund_payment_mock(
 ):
     if current_user.role not in [UserRole.ADMIN, UserRole.ACCOUNTANT]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền")
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    payment_service = PaymentService(db)
+    payment = payment_service.lock_payment(payment_id)
     if not payment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy giao dịch")
-    payment.status = PaymentStatus.FAILED
+    payment_service.reverse_payment(payment)
     note = f"REFUND:{reason or 'manual'}"
     payment.gateway_txn_id = (payment.gateway_txn_id or '') + (f"|{note}" if payment.gateway_txn_id else note)
     db.commit()
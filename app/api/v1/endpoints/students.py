@@ -1,32 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.core.responses import paginated_response
-from app.core.dependencies import get_db, get_current_user
+from app.core.responses import PaginatedResponse
+from app.core.pagination import PageParams, page_params, paginate
+from app.core.dependencies import get_db, get_read_db, open_read_session, get_current_user
+from app.core.export import stream_export
 from app.models import User, Student, UserRole
 from app.schemas import StudentCreate, StudentResponse
 
 router = APIRouter()
 
-@router.get("/")
+@router.get("/", response_model=PaginatedResponse[StudentResponse])
 def get_students(
-    skip: int = 0,
-    limit: int = 100,
+    paging: PageParams = Depends(page_params),
     q: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách học sinh"""
-    query = db.query(Student)
+    return paginate(db, _students_statement(q, current_user), Student.id, paging, StudentResponse)
+
+@router.get("/export")
+def export_students(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    q: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Xuất toàn bộ học sinh (NDJSON/CSV, stream theo lô)"""
+    columns = [Student.id, Student.student_code, Student.name, Student.class_name, Student.grade,
+               Student.user_id, Student.created_at]
+    return stream_export(lambda: open_read_session(request), _students_statement(q, current_user), columns, format, "students")
+
+def _students_statement(q: Optional[str], current_user: User):
+    """Câu truy vấn học sinh dùng chung cho danh sách và xuất file"""
+    stmt = select(Student)
     if q:
         like = f"%{q}%"
-        query = query.filter((Student.name.ilike(like)) | (Student.student_code.ilike(like)) | (Student.class_name.ilike(like)))
+        stmt = stmt.where((Student.name.ilike(like)) | (Student.student_code.ilike(like)) | (Student.class_name.ilike(like)))
     if current_user.role == UserRole.PARENT:
         # Phụ huynh chỉ xem được học sinh của mình
-        query = query.filter(Student.user_id == current_user.id)
-    total = query.count()
-    data = query.offset(skip).limit(limit).all()
-    return paginated_response(data=data, total=total, page=(skip // max(limit,1)) + 1, per_page=limit)
+        stmt = stmt.where(Student.user_id == current_user.id)
+    return stmt
 
 @router.post("/", response_model=StudentResponse)
 def create_student(
@@ -1,30 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.core.dependencies import get_db, get_current_user, require_admin
 from app.models import User, UserRole
 from app.schemas import UserCreate, UserResponse
 from app.core.security import get_password_hash
-from app.core.responses import paginated_response, success_response
+from app.core.auth_cache import principal_cache
+from app.core.pagination import PageParams, page_params, paginate
+from app.core.responses import PaginatedResponse, success_response
 
 router = APIRouter()
 
-@router.get("/")
+@router.get("/", response_model=PaginatedResponse[UserResponse])
 def get_users(
-    skip: int = 0, 
-    limit: int = 100,
+    paging: PageParams = Depends(page_params),
     q: Optional[str] = None,
     current_user: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """Lấy danh sách tất cả users (chỉ admin)"""
-    query = db.query(User)
+    stmt = select(User)
     if q:
         like = f"%{q}%"
-        query = query.filter((User.name.ilike(like)) | (User.email.ilike(like)))
-    total = query.count()
-    data = query.offset(skip).limit(limit).all()
-    return paginated_response(data=data, total=total, page=(skip // max(limit,1)) + 1, per_page=limit)
+        stmt = stmt.where((User.name.ilike(like)) | (User.email.ilike(like)))
+    return paginate(db, stmt, User.id, paging, UserResponse)
 
 @router.post("/", response_model=UserResponse)
 def create_user(
@@ -90,6 +90,7 @@ def update_user(
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy user")
+    old_email = user.email
     user.name = user_data.name
     user.email = user_data.email
     user.phone = user_data.phone
@@ -97,6 +98,7 @@ def update_user(
     if user_data.password:
         user.hashed_password = get_password_hash(user_data.password)
     db.commit()
+    principal_cache.invalidate(old_email, user_data.email)
     db.refresh(user)
     return user
 
@@ -109,6 +111,8 @@ def delete_user(
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy user")
+    email = user.email
     db.delete(user)
     db.commit()
+    principal_cache.invalidate(email)
     return {"message": "Đã xóa user"}
\ No newline at end of file
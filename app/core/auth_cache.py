@@ -0,0 +1,95 @@
+"""
+Short-lived cache of authenticated principals keyed by token subject
+"""
+import threading
+from typing import Any, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.cache import InMemoryCacheBackend
+from app.core.config import settings
+from app.models import User
+
+
+# Column attributes copied into the cache; relationships are lazy-loaded on demand
+_PRINCIPAL_COLUMNS = (
+    "id", "name", "email", "phone", "role", "hashed_password", "is_active", "created_at"
+)
+
+
+class PrincipalCache:
+    """Per-process, size-bounded TTL cache of User column snapshots.
+
+    A hit is re-attached to the request session with merge(load=False), so it
+    behaves like a loaded User (updates flush, relationships lazy-load) without a
+    SELECT. Entries are invalidated explicitly when the user is modified; other
+    worker processes see the change once their TTL expires.
+    """
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.backend = InMemoryCacheBackend(max_entries=max_entries)
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, subject: str, db: Session) -> Optional[User]:
+        """Return the cached principal attached to db, or None on a miss"""
+        user = self._detached(subject)
+        return db.merge(user, load=False) if user is not None else None
+
+    async def get_async(self, subject: str, db: AsyncSession) -> Optional[User]:
+        """Same as get() for an AsyncSession (merge with load=False does no IO)"""
+        user = self._detached(subject)
+        return await db.merge(user, load=False) if user is not None else None
+
+    def _detached(self, subject: str) -> Optional[User]:
+        if not self.enabled:
+            return None
+        snapshot = self.backend.get(subject)
+        if snapshot is None:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return user
+
+    def set(self, subject: str, user: User) -> None:
+        if self.enabled:
+            self.backend.set(subject, {c: getattr(user, c) for c in _PRINCIPAL_COLUMNS}, self.ttl)
+
+    def invalidate(self, *subjects: Optional[str]) -> None:
+        """Drop cached principals; call after the commit that changed them"""
+        for subject in subjects:
+            if subject:
+                self.backend.delete(subject)
+                self._count("invalidations")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["entries"] = len(self.backend)
+        stats["ttl"] = self.ttl
+        return stats
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+
+# Global principal cache instance
+principal_cache = PrincipalCache(
+    ttl=settings.AUTH_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,81 @@
+"""
+Per-request instrumentation of principal resolution (token decodes and user loads)
+"""
+import threading
+from typing import Any, Dict
+
+
+class AuthMetrics:
+    """Aggregates the per-request counters that get_current_user writes to request.state"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {
+                "requests": 0,
+                "authenticated_requests": 0,
+                "token_decodes": 0,
+                "user_loads": 0,
+                "max_decodes_per_request": 0,
+                "max_user_loads_per_request": 0,
+                "duplicate_resolutions": 0
+            }
+
+    @staticmethod
+    def record_decode(state) -> None:
+        state.auth_decodes = getattr(state, "auth_decodes", 0) + 1
+
+    @staticmethod
+    def record_user_load(state) -> None:
+        state.auth_user_loads = getattr(state, "auth_user_loads", 0) + 1
+
+    def observe(self, state: Dict[str, Any]) -> None:
+        """Fold one finished request's counters (raw scope["state"] dict) into the totals"""
+        decodes = state.get("auth_decodes", 0)
+        loads = state.get("auth_user_loads", 0)
+        with self._lock:
+            stats = self._stats
+            stats["requests"] += 1
+            if decodes:
+                stats["authenticated_requests"] += 1
+            stats["token_decodes"] += decodes
+            stats["user_loads"] += loads
+            stats["max_decodes_per_request"] = max(stats["max_decodes_per_request"], decodes)
+            stats["max_user_loads_per_request"] = max(stats["max_user_loads_per_request"], loads)
+            if decodes > 1 or loads > 1:
+                stats["duplicate_resolutions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        authenticated = stats["authenticated_requests"]
+        stats["decodes_per_request"] = round(stats["token_decodes"] / authenticated, 4) if authenticated else 0.0
+        stats["user_loads_per_request"] = round(stats["user_loads"] / authenticated, 4) if authenticated else 0.0
+        return stats
+
+
+class AuthMetricsMiddleware:
+    """ASGI middleware that reports each HTTP request's auth counters to AuthMetrics"""
+
+    def __init__(self, app, metrics: AuthMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # request.state reads and writes this same dict
+        state = scope.setdefault("state", {})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.metrics.observe(state)
+
+
+# Global metrics instance
+auth_metrics = AuthMetrics()
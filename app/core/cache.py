@@ -0,0 +1,262 @@
+"""
+Result cache with pluggable backends and commit-driven invalidation
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+
+class CacheBackend:
+    """Minimal key/value interface shared by all cache backends"""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Atomically increment an integer counter that never expires"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Per-process LRU cache with per-entry TTL.
+
+    Counters created by incr() are kept outside the LRU so they are never evicted.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Backend for any client exposing the redis-py get/set/delete/incr/scan_iter API.
+
+    Values are stored as JSON, so only JSON-serializable payloads can be cached.
+    """
+
+    def __init__(self, client, prefix: str = "school-payment:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+class ResultCache:
+    """Namespaced result cache.
+
+    Each namespace has a generation counter stored in the backend; invalidating a
+    namespace bumps the counter so every key built on the old generation is
+    skipped (and later evicted by LRU/TTL) without having to enumerate keys.
+    """
+
+    def __init__(self, backend: CacheBackend, default_ttl: int = 30):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: Any, **params: Any) -> str:
+        """Build a stable key from positional parts and sorted keyword parameters"""
+        key = ":".join(str(p) for p in parts)
+        if params:
+            key += "?" + "&".join(f"{k}={params[k]}" for k in sorted(params) if params[k] is not None)
+        return key
+
+    def get_or_set(
+        self,
+        namespace: str,
+        key: str,
+        factory: Callable[[], Any],
+        ttl: Optional[int] = None
+    ) -> Any:
+        """Return the cached value or compute, store and return it.
+
+        Falsy results (e.g. the empty dict services return on error) are not cached.
+        """
+        try:
+            full_key = self._full_key(namespace, key)
+            value = self.backend.get(full_key)
+        except Exception as e:
+            # Backend unavailable: serve uncached rather than failing the request
+            print(f"Cache get error: {e}")
+            self._count(namespace, "errors")
+            return factory()
+
+        if value is not None:
+            self._count(namespace, "hits")
+            return value
+
+        self._count(namespace, "misses")
+        value = factory()
+        if value:
+            try:
+                self.backend.set(full_key, value, self.default_ttl if ttl is None else ttl)
+                self._count(namespace, "sets")
+            except Exception as e:
+                print(f"Cache set error: {e}")
+                self._count(namespace, "errors")
+        return value
+
+    def invalidate(self, namespace: str) -> None:
+        """Drop every cached entry of a namespace"""
+        try:
+            self.backend.incr(self._generation_key(namespace))
+        except Exception as e:
+            print(f"Cache invalidate error: {e}")
+        self._count(namespace, "invalidations")
+
+    def clear(self) -> None:
+        self.backend.clear()
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters per namespace for monitoring"""
+        with self._lock:
+            namespaces = {name: dict(counters) for name, counters in self._stats.items()}
+        for counters in namespaces.values():
+            lookups = counters.get("hits", 0) + counters.get("misses", 0)
+            counters["hit_rate"] = round(counters.get("hits", 0) / lookups, 4) if lookups else 0.0
+        return {
+            "backend": type(self.backend).__name__,
+            "default_ttl": self.default_ttl,
+            "namespaces": namespaces
+        }
+
+    def _full_key(self, namespace: str, key: str) -> str:
+        generation = self.backend.get(self._generation_key(namespace)) or 0
+        return f"{namespace}:{generation}:{key}"
+
+    @staticmethod
+    def _generation_key(namespace: str) -> str:
+        return f"__generation__:{namespace}"
+
+    def _count(self, namespace: str, counter: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(
+                namespace, {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0, "errors": 0}
+            )
+            counters[counter] += 1
+
+
+def invalidate_on_commit(cache: ResultCache, namespace: str, *models) -> None:
+    """Invalidate a namespace whenever a session commits writes to any of the given models"""
+    flag = f"cache_dirty:{namespace}"
+
+    def _after_flush(session, flush_context):
+        if session.info.get(flag):
+            return
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, models):
+                session.info[flag] = True
+                return
+
+    def _after_commit(session):
+        # Releasing a SAVEPOINT also fires after_commit; only the outermost commit counts
+        if session.in_nested_transaction():
+            return
+        if session.info.pop(flag, False):
+            cache.invalidate(namespace)
+
+    def _after_soft_rollback(session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(flag, None)
+
+    event.listen(Session, "after_flush", _after_flush)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_soft_rollback", _after_soft_rollback)
+
+
+def build_backend(max_entries: Optional[int] = None) -> CacheBackend:
+    """Create the backend selected by CACHE_BACKEND (memory or redis)
+
+    max_entries bounds the in-memory fallback (defaults to CACHE_MAX_ENTRIES).
+    """
+    if settings.CACHE_BACKEND == "redis" and settings.REDIS_URL:
+        try:
+            import redis
+            return RedisCacheBackend(redis.Redis.from_url(settings.REDIS_URL))
+        except ImportError:
+            print("redis package not installed, falling back to in-memory cache")
+    return InMemoryCacheBackend(max_entries=max_entries or settings.CACHE_MAX_ENTRIES)
+
+
+# Global cache instance
+result_cache = ResultCache(build_backend(), default_ttl=settings.DASHBOARD_CACHE_TTL)
@@ -22,10 +22,58 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production-at-least-32-chars-long")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    AUTH_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))  # 0 = disabled
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))  # changing it rehashes passwords at next login
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))  # 0 = min(4, CPU count)
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "100"))  # waiting beyond this -> 503
     
     # Database
     DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
     DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() == "true"
+    # Connection pool (per process: total connections ~ workers * (pool size + overflow))
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds waiting for a free connection
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "300"))  # seconds, -1 = never
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_ISOLATION_LEVEL: Optional[str] = os.getenv("DB_ISOLATION_LEVEL")  # e.g. READ COMMITTED
+    # Read replica for reports/dashboards/lists; falls back to the primary when unavailable
+    DATABASE_REPLICA_URL: Optional[str] = os.getenv("DATABASE_REPLICA_URL")
+    REPLICA_RETRY_SECONDS: int = int(os.getenv("REPLICA_RETRY_SECONDS", "30"))  # skip replica after a failure
+    READ_YOUR_WRITES_SECONDS: int = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))  # primary reads after own writes
+    # Async engine for the hot endpoints (login, orders list, create-qr, webhook, parent dashboard)
+    ASYNC_DB_ENABLED: bool = os.getenv("ASYNC_DB_ENABLED", "false").lower() == "true"
+    ASYNC_DATABASE_URL: Optional[str] = os.getenv("ASYNC_DATABASE_URL")  # default: derived from DATABASE_URL
+    
+    # Cache
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")  # memory | redis
+    REDIS_URL: Optional[str] = os.getenv("REDIS_URL")
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+    DASHBOARD_CACHE_TTL: int = int(os.getenv("DASHBOARD_CACHE_TTL", "30"))  # seconds
+    
+    # Rate limiting (requests per minute per client IP)
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis (shared by all workers)
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))  # memory backend only
+    LOGIN_RATE_LIMIT: int = int(os.getenv("LOGIN_RATE_LIMIT", "20"))
+    FORGOT_PASSWORD_RATE_LIMIT: int = int(os.getenv("FORGOT_PASSWORD_RATE_LIMIT", "5"))
+    WEBHOOK_RATE_LIMIT: int = int(os.getenv("WEBHOOK_RATE_LIMIT", "60"))
+    
+    # Webhook outbox: the endpoint stores the event and returns, a background worker applies it
+    WEBHOOK_WORKER_ENABLED: bool = os.getenv("WEBHOOK_WORKER_ENABLED", "true").lower() == "true"  # in-process worker thread
+    WEBHOOK_WORKER_POLL_SECONDS: float = float(os.getenv("WEBHOOK_WORKER_POLL_SECONDS", "1"))
+    WEBHOOK_WORKER_BATCH_SIZE: int = int(os.getenv("WEBHOOK_WORKER_BATCH_SIZE", "50"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))  # then the event is marked failed
+    WEBHOOK_RETRY_BASE_SECONDS: float = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", "5"))  # doubled per attempt
+    WEBHOOK_LEASE_SECONDS: float = float(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))  # unfinished claims are retried
+    
+    # JSON responses: fast = orjson-backed FastJSONResponse (stdlib json if orjson is missing), default = Starlette JSONResponse
+    JSON_RESPONSE_CLASS: str = os.getenv("JSON_RESPONSE_CLASS", "fast")
+    
+    # Pagination
+    PAGINATION_COUNT_CAP: int = int(os.getenv("PAGINATION_COUNT_CAP", "10000"))  # rows counted with count=estimate
+    MAX_PAGE_SIZE: int = int(os.getenv("MAX_PAGE_SIZE", "500"))  # larger result sets go through /export
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))  # rows fetched per round trip in exports
     
     # CORS
     ALLOWED_ORIGINS: list = []  # set via ENV: comma-separated
@@ -34,6 +82,9 @@ class Settings(BaseSettings):
     PAYMENT_GATEWAY_URL: str = os.getenv("PAYMENT_GATEWAY_URL", "https://api.demo-payment.com")
     PAYMENT_API_KEY: str = os.getenv("PAYMENT_API_KEY", "demo-key")
     MERCHANT_ID: str = os.getenv("MERCHANT_ID", "demo-merchant")
+    PAYMENT_QR_TTL_MINUTES: int = int(os.getenv("PAYMENT_QR_TTL_MINUTES", "15"))  # a pending QR payment is reused this long
+    QR_CACHE_MAX_ENTRIES: int = int(os.getenv("QR_CACHE_MAX_ENTRIES", "512"))  # rendered QR images kept per process
+    QR_CACHE_DIR: str = os.getenv("QR_CACHE_DIR", "")  # optional disk tier shared by workers (empty: memory only)
     
     EINVOICE_API_URL: str = os.getenv("EINVOICE_API_URL", "https://api.demo-einvoice.com")
     EINVOICE_API_KEY: str = os.getenv("EINVOICE_API_KEY", "demo-key")
@@ -48,6 +99,29 @@ class Settings(BaseSettings):
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
     SMTP_USER: str = os.getenv("SMTP_USER", "")
     SMTP_PASSWORD: str = os.getenv("SMTP_PASSWORD", "")
+    SMTP_USE_TLS: bool = os.getenv("SMTP_USE_TLS", "true").lower() == "true"  # STARTTLS after connecting
+    SMTP_TIMEOUT: float = float(os.getenv("SMTP_TIMEOUT", "10"))  # seconds per SMTP command / waiting for a session
+    # Pooled SMTP sessions (per process), reused across emails instead of one handshake per message
+    SMTP_POOL_SIZE: int = int(os.getenv("SMTP_POOL_SIZE", "2"))
+    SMTP_MAX_IDLE_SECONDS: float = float(os.getenv("SMTP_MAX_IDLE_SECONDS", "60"))  # reconnect after this idle time
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+    # Email outbox: requests queue emails, the worker sends them through the SMTP pool
+    EMAIL_WORKER_ENABLED: bool = os.getenv("EMAIL_WORKER_ENABLED", "true").lower() == "true"  # in-process worker threads
+    EMAIL_WORKER_CONCURRENCY: int = int(os.getenv("EMAIL_WORKER_CONCURRENCY", "2"))  # emails sent at once (<= SMTP_POOL_SIZE)
+    EMAIL_WORKER_POLL_SECONDS: float = float(os.getenv("EMAIL_WORKER_POLL_SECONDS", "1"))
+    EMAIL_WORKER_BATCH_SIZE: int = int(os.getenv("EMAIL_WORKER_BATCH_SIZE", "50"))
+    EMAIL_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))  # then the email is marked failed
+    EMAIL_RETRY_BASE_SECONDS: float = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))  # doubled per attempt
+    EMAIL_LEASE_SECONDS: float = float(os.getenv("EMAIL_LEASE_SECONDS", "120"))  # unfinished claims are retried
+    # Compiled email templates are cached here across processes (empty: Jinja's per-user temp directory)
+    EMAIL_TEMPLATE_CACHE_DIR: str = os.getenv("EMAIL_TEMPLATE_CACHE_DIR", "")
+    # Overdue reminders: a background job streams overdue orders and queues one digest email per parent
+    REMINDER_WORKERS: int = int(os.getenv("REMINDER_WORKERS", "4"))  # threads queueing digests of one job
+    REMINDER_BATCH_SIZE: int = int(os.getenv("REMINDER_BATCH_SIZE", "100"))  # parents per transaction
+    REMINDER_BUFFER_SIZE: int = int(os.getenv("REMINDER_BUFFER_SIZE", "8"))  # batches waiting for a worker
+    REMINDER_FETCH_SIZE: int = int(os.getenv("REMINDER_FETCH_SIZE", "1000"))  # rows fetched per round trip
+    REMINDER_DEDUP_HOURS: float = float(os.getenv("REMINDER_DEDUP_HOURS", "24"))  # a parent is reminded at most once per window
+    REMINDER_JOB_LEASE_SECONDS: int = int(os.getenv("REMINDER_JOB_LEASE_SECONDS", "120"))  # jobs silent this long are failed as orphans
     
     # File Upload
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
@@ -1,14 +1,23 @@
 """
 Common dependencies for FastAPI endpoints
 """
-from typing import Generator, Callable
+from typing import AsyncGenerator, Generator, Callable
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import SessionLocal
+from app.core.config import settings
+from sqlalchemy.exc import DBAPIError
+
+from app.database import SessionLocal, AsyncSessionLocal, ReplicaSessionLocal
+from app.core.read_routing import read_router
+from app.core.rate_limit import limiter
 from app.models import User, UserRole
 from app.core.security import verify_token
+from app.core.auth_cache import principal_cache
+from app.core.auth_metrics import auth_metrics
 
 
 security = HTTPBearer()
@@ -23,36 +32,142 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+def open_read_session(request: Request) -> Session:
+    """Open a read-only session for the request.
+
+    Uses the read replica when one is configured, reachable, and the caller has not
+    written within READ_YOUR_WRITES_SECONDS; otherwise the primary. The principal is
+    read from request.state, so call this after the current_user dependency ran.
+    """
+    if ReplicaSessionLocal is not None:
+        subject = getattr(request.state, "principal_subject", None)
+        if read_router.wrote_recently(subject):
+            read_router.record("primary_reads_recent_write")
+        elif not read_router.replica_available():
+            read_router.record("primary_reads_unavailable")
+        else:
+            db = ReplicaSessionLocal()
+            try:
+                # Check out a connection now so an unreachable replica falls back before the endpoint runs
+                db.connection()
+                read_router.record("replica_reads")
+                return db
+            except DBAPIError as e:
+                db.close()
+                read_router.mark_replica_down(e)
+                read_router.record("primary_reads_unavailable")
+    return SessionLocal()
+
+
+def get_read_db(request: Request) -> Generator[Session, None, None]:
+    """Read-only database dependency (see open_read_session); declare it after current_user"""
+    db = open_read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    """Async database dependency (only available when ASYNC_DB_ENABLED)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def prefer_async(async_endpoint: Callable) -> Callable:
+    """Register async_endpoint instead of the decorated sync endpoint when ASYNC_DB_ENABLED.
+
+    Place it directly under the @router decorator so both variants share path,
+    summary and response model.
+    """
+    def decorator(sync_endpoint: Callable) -> Callable:
+        return async_endpoint if settings.ASYNC_DB_ENABLED else sync_endpoint
+    return decorator
+
+
+def _token_subject(request: Request, credentials: HTTPAuthorizationCredentials) -> str:
+    """Decode the bearer token (once per request) and return its subject"""
+    subject = getattr(request.state, "principal_subject", None)
+    if subject is not None:
+        return subject
+
+    auth_metrics.record_decode(request.state)
+    try:
+        subject = verify_token(credentials.credentials).get("sub")
+    except Exception:
+        subject = None
+    if subject is None:
+        raise _invalid_credentials()
+    request.state.principal_subject = subject
+    return subject
+
+
+def _invalid_credentials() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
 def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
-    """Get current authenticated user"""
-    try:
-        payload = verify_token(credentials.credentials)
-        email = payload.get("sub")
-        
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
-        
-        user = db.query(User).filter(User.email == email).first()
+    """Get current authenticated user.
+
+    The principal is resolved once per request and kept on request.state, so the
+    router-level dependency, the endpoint parameter and require_* all share it.
+    Database errors propagate (500) instead of being reported as bad credentials.
+    """
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+
+    async_principal = getattr(request.state, "async_principal", None)
+    if async_principal is not None:
+        # Already resolved by get_current_user_async (router level in async mode)
+        user = db.merge(async_principal, load=False)
+    else:
+        email = _token_subject(request, credentials)
+        user = principal_cache.get(email, db)
         if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-            
-        return user
-        
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+            auth_metrics.record_user_load(request.state)
+            user = db.query(User).filter(User.email == email).first()
+            if user is None:
+                raise _invalid_credentials()
+            principal_cache.set(email, user)
+
+    request.state.principal = user
+    return user
+
+
+async def get_current_user_async(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Async variant of get_current_user for endpoints registered with prefer_async.
+
+    The user is bound to the request's AsyncSession and kept on
+    request.state.async_principal; sync dependencies merge it into their own session.
+    """
+    principal = getattr(request.state, "async_principal", None)
+    if principal is not None:
+        return principal
+
+    email = _token_subject(request, credentials)
+    user = await principal_cache.get_async(email, db)
+    if user is None:
+        auth_metrics.record_user_load(request.state)
+        user = await db.scalar(select(User).where(User.email == email))
+        if user is None:
+            raise _invalid_credentials()
+        principal_cache.set(email, user)
+
+    request.state.async_principal = user
+    return user
 
 
 def get_current_active_user(
@@ -102,26 +217,14 @@ def require_staff(
         )
     return current_user
 
-# Simple in-memory rate limiter (per-process)
-_rate_limit_store = {}
+def rate_limiter(limit: int = 30, window_seconds: int = 60, scope: str = "default") -> Callable:
+    """Return a dependency that rate-limits by client IP for given window.
 
-def rate_limiter(limit: int = 30, window_seconds: int = 60) -> Callable:
-    """Return a dependency that rate-limits by client IP for given window."""
-    from time import time
+    Counters live in the RATE_LIMIT_BACKEND (shared across workers with redis);
+    use a distinct scope per endpoint so limits do not add up.
+    """
     def _dep(request: Request):
         client_ip = request.client.host if request.client else "unknown"
-        now = int(time())
-        window_start = now - window_seconds
-        records = _rate_limit_store.setdefault(client_ip, [])
-        # Remove old entries
-        while records and records[0] < window_start:
-            records.pop(0)
-        if len(records) >= limit:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded"
-            )
-        records.append(now)
-        _rate_limit_store[client_ip] = records
+        limiter.check(scope, client_ip, limit, window_seconds)
         return True
-    return _dep
\ No newline at end of file
+    return _dep
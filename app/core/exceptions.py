@@ -7,6 +7,8 @@ from fastapi import HTTPException, Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
+from app.core.responses import DefaultJSONResponse
+
 logger = logging.getLogger(__name__)
 
 
@@ -99,7 +101,7 @@ class InvoiceException(AppException):
 # Exception handlers
 async def app_exception_handler(request: Request, exc: AppException) -> JSONResponse:
     """Handle custom application exceptions"""
-    return JSONResponse(
+    return DefaultJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
@@ -112,19 +114,21 @@ async def app_exception_handler(request: Request, exc: AppException) -> JSONResp
 
 async def http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
     """Handle HTTP exceptions"""
-    return JSONResponse(
+    return DefaultJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
             "message": exc.detail,
             "error_type": "HTTPException"
-        }
+        },
+        # Keep Retry-After / WWW-Authenticate set by the raiser
+        headers=getattr(exc, "headers", None)
     )
 
 
 async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
     """Handle request validation exceptions"""
-    return JSONResponse(
+    return DefaultJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
             "success": False,
@@ -139,7 +143,7 @@ async def generic_exception_handler(request: Request, exc: Exception) -> JSONRes
     """Handle all other uncaught exceptions"""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
     
-    return JSONResponse(
+    return DefaultJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "success": False,
@@ -0,0 +1,92 @@
+"""
+Streaming NDJSON/CSV exports for large result sets
+"""
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Iterator, List
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.core.config import settings
+
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+
+def _plain(value: Any) -> Any:
+    """Convert column values to JSON/CSV friendly scalars"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_lines(names: List[str], batch) -> str:
+    return "".join(
+        json.dumps(dict(zip(names, (_plain(v) for v in row))), ensure_ascii=False) + "\n"
+        for row in batch
+    )
+
+
+def _csv_lines(batch) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([["" if v is None else _plain(v) for v in row] for row in batch])
+    return buffer.getvalue()
+
+
+def iter_export(
+    session_factory: Callable[[], Session],
+    stmt: Select,
+    columns: List,
+    export_format: str
+) -> Iterator[str]:
+    """Yield the export body in EXPORT_BATCH_SIZE chunks.
+
+    Only the listed columns are selected (no ORM objects, no identity map) and rows
+    are fetched with yield_per, which streams from a server-side cursor where the
+    driver supports it, so memory stays flat regardless of the result size. The
+    generator owns its session because request-scoped sessions are closed before
+    a streaming body is sent.
+    """
+    names = [column.key for column in columns]
+    stmt = stmt.with_only_columns(*columns).order_by(columns[0])
+    if export_format == "csv":
+        # BOM so Excel opens Vietnamese text as UTF-8
+        yield "\ufeff" + _csv_lines([names])
+
+    db = session_factory()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            yield _csv_lines(batch) if export_format == "csv" else _ndjson_lines(names, batch)
+    finally:
+        db.close()
+
+
+def stream_export(
+    session_factory: Callable[[], Session],
+    stmt: Select,
+    columns: List,
+    export_format: str,
+    filename: str
+) -> StreamingResponse:
+    """StreamingResponse for iter_export with a download filename"""
+    extension = "csv" if export_format == "csv" else "ndjson"
+    return StreamingResponse(
+        iter_export(session_factory, stmt, columns, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+    )
@@ -0,0 +1,248 @@
+"""
+Database-backed outbox tables processed by background polling workers
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models import OutboxState
+
+
+# Upper bound for the exponential retry delay
+RETRY_MAX_SECONDS = 3600
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp used for every outbox time column"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class OutboxWorker:
+    """Claims due rows of an outbox table and processes them one at a time.
+
+    The model needs state, attempts, available_at, last_error, processed_at and
+    created_at columns. A row is claimed with a conditional UPDATE, so any number
+    of threads or processes can poll the same table without handling a row twice.
+    A claim is a lease: a row left in PROCESSING by a crashed worker becomes due
+    again after lease_seconds. Failed rows are retried with exponential backoff
+    and end up FAILED after max_attempts.
+
+    Subclasses set ``model`` and implement process(). start() runs `concurrency`
+    polling threads, which bounds how many rows are processed at once.
+    """
+
+    model = None
+    name = "outbox"
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        poll_seconds: float = 1.0,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 5,
+        lease_seconds: float = 60,
+        concurrency: int = 1
+    ):
+        self.session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.concurrency = concurrency
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def process(self, db: Session, item) -> Optional[Callable[[], None]]:
+        """Apply one claimed row inside db's transaction; the worker commits.
+
+        May return a callback that runs only after the commit succeeded, for side
+        effects such as notifications. Raising marks the attempt as failed.
+        """
+        raise NotImplementedError
+
+    # -- Worker loop ---------------------------------------------------------
+
+    def start(self) -> None:
+        """Run the polling loop on `concurrency` daemon threads (no-op if already running)"""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self.run_forever, name=f"{self.name}-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def serve(self) -> None:
+        """Run the polling threads in the foreground until Ctrl+C (separate worker process)"""
+        self.start()
+        try:
+            while self.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def notify(self) -> None:
+        """Wake the polling loop now instead of at the next poll interval"""
+        self._wakeup.set()
+
+    def run_forever(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                handled = self.run_once()
+            except Exception as e:
+                # Database unavailable: keep polling, the rows stay in the table
+                print(f"{self.name} worker error: {e}")
+                handled = 0
+            if handled < self.batch_size:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def run_once(self) -> int:
+        """Process the rows due now (at most batch_size); return how many were handled"""
+        db = self.session_factory()
+        try:
+            ids = db.scalars(
+                select(self.model.id).where(self._due(utcnow())).order_by(self.model.id).limit(self.batch_size)
+            ).all()
+            db.rollback()
+            handled = 0
+            for item_id in ids:
+                if self._claim(db, item_id):
+                    self._handle(db, item_id)
+                    handled += 1
+            with self._lock:
+                self._stats["last_run_at"] = utcnow().isoformat()
+            return handled
+        finally:
+            db.close()
+
+    def _due(self, now: datetime):
+        model = self.model
+        return model.state.in_([OutboxState.PENDING, OutboxState.PROCESSING]) & (model.available_at <= now)
+
+    def _claim(self, db: Session, item_id: int) -> bool:
+        now = utcnow()
+        model = self.model
+        result = db.execute(
+            update(model)
+            .where(model.id == item_id, self._due(now))
+            .values(
+                state=OutboxState.PROCESSING,
+                attempts=model.attempts + 1,
+                available_at=now + timedelta(seconds=self.lease_seconds)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def _handle(self, db: Session, item_id: int) -> None:
+        item = db.get(self.model, item_id)
+        try:
+            after_commit = self.process(db, item)
+            item.state = OutboxState.DONE
+            item.processed_at = utcnow()
+            item.last_error = None
+            lag = (item.processed_at - item.created_at).total_seconds()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._fail(db, item_id, e)
+            return
+
+        with self._lock:
+            stats = self._stats
+            stats["processed"] += 1
+            stats["lag_total_seconds"] += lag
+            stats["lag_max_seconds"] = max(stats["lag_max_seconds"], lag)
+        if after_commit is not None:
+            try:
+                after_commit()
+            except Exception as e:
+                print(f"{self.name} worker: post-commit action failed for #{item_id}: {e}")
+
+    def _fail(self, db: Session, item_id: int, error: Exception) -> None:
+        item = db.get(self.model, item_id)
+        attempts = item.attempts
+        item.last_error = str(error)[:500]
+        dead = attempts >= self.max_attempts
+        if dead:
+            item.state = OutboxState.FAILED
+        else:
+            item.state = OutboxState.PENDING
+            item.available_at = utcnow() + timedelta(seconds=self.retry_delay(attempts))
+        db.commit()
+        print(f"{self.name} worker: #{item_id} attempt {attempts} failed: {error}")
+        with self._lock:
+            self._stats["failed" if dead else "retried"] += 1
+
+    def retry_delay(self, attempts: int) -> float:
+        """Seconds before the next attempt after `attempts` failed ones"""
+        return min(self.retry_base_seconds * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+    # -- Metrics -------------------------------------------------------------
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {
+                "processed": 0,
+                "retried": 0,
+                "failed": 0,
+                "lag_total_seconds": 0.0,
+                "lag_max_seconds": 0.0,
+                "last_run_at": None
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """Worker counters plus the current queue (rows per state, age of the oldest waiting row)"""
+        with self._lock:
+            stats = dict(self._stats)
+        processed = stats["processed"]
+        stats["lag_avg_seconds"] = round(stats["lag_total_seconds"] / processed, 3) if processed else 0.0
+        stats["lag_max_seconds"] = round(stats["lag_max_seconds"], 3)
+        del stats["lag_total_seconds"]
+        stats["running"] = self.running
+        stats["concurrency"] = self.concurrency
+        stats["queue"] = self.queue_stats()
+        return stats
+
+    def queue_stats(self) -> Dict[str, Any]:
+        model = self.model
+        db = self.session_factory()
+        try:
+            counts = dict(db.execute(select(model.state, func.count()).group_by(model.state)).all())
+            oldest = db.scalar(
+                select(func.min(model.created_at)).where(
+                    model.state.in_([OutboxState.PENDING, OutboxState.PROCESSING])
+                )
+            )
+        finally:
+            db.close()
+        result: Dict[str, Any] = {state.value: counts.get(state, 0) for state in OutboxState}
+        # Queue lag: how long the oldest unprocessed row has been waiting
+        result["oldest_pending_age_seconds"] = round((utcnow() - oldest).total_seconds(), 3) if oldest else 0.0
+        return result
@@ -0,0 +1,136 @@
+"""
+Offset and keyset (cursor) pagination for list endpoints
+"""
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, load_only, raiseload
+from sqlalchemy.sql import Select
+
+from app.core.config import settings
+from app.core.responses import paginated_response
+
+
+# exact: full COUNT(*); estimate: COUNT(*) capped at PAGINATION_COUNT_CAP rows; none: no count
+COUNT_MODES = ("exact", "estimate", "none")
+
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque cursor pointing after the row with the given id"""
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the id encoded in a cursor; raise 400 for anything malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["id"]
+        if not isinstance(last_id, int):
+            raise ValueError(last_id)
+        return last_id
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor phân trang không hợp lệ"
+        )
+
+
+@dataclass
+class PageParams:
+    """Pagination parameters shared by all list endpoints.
+
+    Offset mode (default) keeps the existing skip/limit behaviour. Keyset mode
+    (``keyset=true`` for the first page, then ``after=<next_cursor>``) orders by id
+    descending and seeks with ``id < last_id``, so every page costs the same no
+    matter how deep the client scrolls.
+    """
+    skip: int = 0
+    limit: int = 100
+    after_id: Optional[int] = None
+    keyset: bool = False
+    count: str = "exact"
+
+    @property
+    def page(self) -> Optional[int]:
+        return None if self.keyset else (self.skip // max(self.limit, 1)) + 1
+
+
+def page_params(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(min(100, settings.MAX_PAGE_SIZE), ge=1, le=settings.MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Cursor next_cursor của trang trước (phân trang keyset)"),
+    keyset: bool = Query(False, description="Phân trang keyset theo id giảm dần (tự bật khi có after)"),
+    count: str = Query("exact", pattern="^(exact|estimate|none)$", description="Cách tính tổng: exact | estimate | none")
+) -> PageParams:
+    """Dependency parsing the pagination query parameters"""
+    after_id = decode_cursor(after) if after else None
+    return PageParams(skip=skip, limit=limit, after_id=after_id, keyset=keyset or after_id is not None, count=count)
+
+
+def count_statement(stmt: Select, params: PageParams) -> Optional[Select]:
+    """COUNT query for the filtered statement, or None when counting is skipped"""
+    if params.count == "none":
+        return None
+    if params.count == "estimate":
+        # Stop counting after the cap: large tables report "at least N" instead of a full scan
+        stmt = stmt.limit(settings.PAGINATION_COUNT_CAP)
+    return select(func.count()).select_from(stmt.order_by(None).subquery())
+
+
+def schema_options(model, schema) -> tuple:
+    """Loader options limiting an ORM select to the columns a response schema declares.
+
+    Columns outside the schema (password hashes, QR images on lists that do not show
+    them, ...) are never fetched, and relationship access raises instead of issuing a
+    lazy load per row during serialization.
+    """
+    columns = [getattr(model, name) for name in schema.model_fields if name in model.__table__.columns]
+    return load_only(*columns), raiseload("*")
+
+
+def page_statement(stmt: Select, id_column, params: PageParams, schema=None) -> Select:
+    """Statement selecting one page; keyset mode fetches one extra row to detect the next page"""
+    if schema is not None:
+        stmt = stmt.options(*schema_options(id_column.class_, schema))
+    if not params.keyset:
+        return stmt.offset(params.skip).limit(params.limit)
+    if params.after_id is not None:
+        stmt = stmt.where(id_column < params.after_id)
+    return stmt.order_by(id_column.desc()).limit(params.limit + 1)
+
+
+def page_response(rows: List[Any], total: Optional[int], params: PageParams) -> Dict[str, Any]:
+    """Build the paginated response for rows fetched with page_statement"""
+    total_is_estimate = params.count == "estimate" and total is not None and total >= settings.PAGINATION_COUNT_CAP
+    if not params.keyset:
+        return paginated_response(
+            data=rows, total=total, page=params.page, per_page=params.limit,
+            has_next=None if total is not None else len(rows) == params.limit,
+            total_is_estimate=total_is_estimate
+        )
+
+    has_next = len(rows) > params.limit
+    rows = rows[:params.limit]
+    return paginated_response(
+        data=rows, total=total, page=None, per_page=params.limit,
+        has_next=has_next, has_prev=params.after_id is not None,
+        next_cursor=encode_cursor(rows[-1].id) if has_next else None,
+        total_is_estimate=total_is_estimate
+    )
+
+
+def paginate(db: Session, stmt: Select, id_column, params: PageParams, schema=None) -> Dict[str, Any]:
+    """Count (per params.count) and fetch one page of an ORM select statement.
+
+    Pass the item schema used in the endpoint's PaginatedResponse[...] response_model
+    to load only its columns.
+    """
+    count_stmt = count_statement(stmt, params)
+    total = db.scalar(count_stmt) if count_stmt is not None else None
+    rows = db.scalars(page_statement(stmt, id_column, params, schema)).all()
+    return page_response(rows, total, params)
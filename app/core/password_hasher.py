@@ -0,0 +1,112 @@
+"""
+Bounded worker pool for bcrypt hashing and verification
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from fastapi import HTTPException, status
+
+
+class PasswordHasher:
+    """Runs bcrypt work on a fixed number of threads.
+
+    bcrypt releases the GIL while hashing, so a thread pool gives real parallelism
+    without the pickling/startup cost of a process pool. At most `workers` hashes
+    run at once, whatever the number of request threads; up to `max_queue` more
+    wait their turn, and beyond that requests fail fast with 503 instead of piling
+    up behind a login storm.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {
+                "completed": 0,
+                "rejected": 0,
+                "queue_wait_total_ms": 0.0,
+                "queue_wait_max_ms": 0.0,
+                "work_total_ms": 0.0,
+                "max_queue_depth": 0
+            }
+            self._queued = 0
+            self._running = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Schedule fn(*args) on the pool; raise 503 when the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Hệ thống đang bận, vui lòng thử lại sau",
+                headers={"Retry-After": "1"}
+            )
+        with self._lock:
+            self._queued += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+        try:
+            future = self._executor.submit(self._run, time.perf_counter(), fn, *args)
+        except Exception:
+            self._release_queued()
+            raise
+        # _run gives the slot back when it finishes; a job cancelled while still queued
+        # (a disconnected client cancels it through asyncio.wrap_future) never reaches _run
+        future.add_done_callback(lambda f: f.cancelled() and self._release_queued())
+        return future
+
+    def _release_queued(self) -> None:
+        self._slots.release()
+        with self._lock:
+            self._queued -= 1
+
+    def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the pool and wait for the result (for sync callers)"""
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable, *args) -> Any:
+        """Await fn(*args) on the pool without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _run(self, submitted_at: float, fn: Callable, *args) -> Any:
+        started_at = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            finished_at = time.perf_counter()
+            self._slots.release()
+            with self._lock:
+                self._running -= 1
+                stats = self._stats
+                wait_ms = (started_at - submitted_at) * 1000
+                stats["completed"] += 1
+                stats["queue_wait_total_ms"] += wait_ms
+                stats["queue_wait_max_ms"] = max(stats["queue_wait_max_ms"], wait_ms)
+                stats["work_total_ms"] += (finished_at - started_at) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._queued
+            stats["running"] = self._running
+        completed = stats["completed"]
+        stats["workers"] = self.workers
+        stats["max_queue"] = self.max_queue
+        stats["queue_wait_avg_ms"] = round(stats["queue_wait_total_ms"] / completed, 3) if completed else 0.0
+        stats["work_avg_ms"] = round(stats["work_total_ms"] / completed, 3) if completed else 0.0
+        for key in ("queue_wait_total_ms", "queue_wait_max_ms", "work_total_ms"):
+            stats[key] = round(stats[key], 3)
+        return stats
@@ -0,0 +1,124 @@
+"""
+Connection pool instrumentation: checkout counts, wait time for a free connection, hold time
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+# Waits longer than this are counted as "slow" (the pool was exhausted)
+SLOW_WAIT_MS = 10.0
+
+
+class PoolMetrics:
+    """Thread-safe counters for one engine's connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {
+                "checkouts": 0,
+                "checkins": 0,
+                "connects": 0,
+                "invalidations": 0,
+                "timeouts": 0,
+                "slow_waits": 0,
+                "wait_total_ms": 0.0,
+                "wait_max_ms": 0.0,
+                "hold_total_ms": 0.0,
+                "hold_max_ms": 0.0,
+                "max_checked_out": 0
+            }
+            self._checked_out = 0
+
+    def record_wait(self, wait_ms: float, timed_out: bool = False) -> None:
+        with self._lock:
+            stats = self._stats
+            stats["wait_total_ms"] += wait_ms
+            stats["wait_max_ms"] = max(stats["wait_max_ms"], wait_ms)
+            if wait_ms >= SLOW_WAIT_MS:
+                stats["slow_waits"] += 1
+            if timed_out:
+                stats["timeouts"] += 1
+
+    def record_checkout(self) -> None:
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._checked_out += 1
+            self._stats["max_checked_out"] = max(self._stats["max_checked_out"], self._checked_out)
+
+    def record_checkin(self, hold_ms: float) -> None:
+        with self._lock:
+            stats = self._stats
+            stats["checkins"] += 1
+            self._checked_out = max(self._checked_out - 1, 0)
+            stats["hold_total_ms"] += hold_ms
+            stats["hold_max_ms"] = max(stats["hold_max_ms"], hold_ms)
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["checked_out"] = self._checked_out
+        checkouts = stats["checkouts"]
+        stats["wait_avg_ms"] = round(stats["wait_total_ms"] / checkouts, 3) if checkouts else 0.0
+        stats["hold_avg_ms"] = round(stats["hold_total_ms"] / stats["checkins"], 3) if stats["checkins"] else 0.0
+        for key in ("wait_total_ms", "wait_max_ms", "hold_total_ms", "hold_max_ms"):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a free connection"""
+
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self._record_wait(started, timed_out=True)
+            raise
+        self._record_wait(started)
+        return connection
+
+    def _record_wait(self, started: float, timed_out: bool = False) -> None:
+        if self.metrics is not None:
+            self.metrics.record_wait((time.perf_counter() - started) * 1000, timed_out=timed_out)
+
+
+def instrument_engine(engine, metrics: PoolMetrics) -> None:
+    """Attach pool event listeners that feed metrics (works for any pool class)"""
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        pool.metrics = metrics
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.record("connects")
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        metrics.record_checkout()
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            metrics.record_checkin((time.perf_counter() - started) * 1000)
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.record("invalidations")
@@ -0,0 +1,103 @@
+"""
+Cache ảnh QR code: LRU trong tiến trình, thêm tầng lưu trên đĩa nếu được cấu hình
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from app.core.cache import InMemoryCacheBackend
+from app.core.config import settings
+
+
+class QRImageCache:
+    """Ảnh PNG (base64) theo sha256 của nội dung QR.
+
+    Cùng nội dung luôn vẽ ra cùng ảnh nên ảnh không bao giờ cũ, chỉ bị LRU loại bỏ.
+    Khi có directory, ảnh đã vẽ được ghi thêm ra đĩa (<dir>/<ab>/<sha256>.png) để các
+    worker khác và lần khởi động sau đọc file thay vì vẽ lại. Lỗi đĩa chỉ làm phải vẽ lại.
+    """
+
+    def __init__(self, max_entries: int = 512, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._memory = InMemoryCacheBackend(max_entries)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def get_or_render(self, qr_data: str, render: Callable[[str], bytes]) -> str:
+        """Ảnh base64 của qr_data; render(qr_data) trả về PNG và chỉ được gọi khi cache không có"""
+        key = hashlib.sha256(qr_data.encode("utf-8")).hexdigest()
+        image = self._memory.get(key)
+        if image is not None:
+            self._count("hits")
+            return image
+
+        png = self._read(key)
+        if png is not None:
+            self._count("disk_hits")
+        else:
+            png = render(qr_data)
+            self._count("renders")
+            self._write(key, png)
+        image = base64.b64encode(png).decode()
+        self._memory.set(key, image, 0)
+        return image
+
+    # -- Disk tier -----------------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def _read(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key: str, png: bytes) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Ghi file tạm rồi đổi tên để tiến trình đang đọc không thấy file ghi dở
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"QR cache: could not write {path}: {e}")
+
+    # -- Metrics -------------------------------------------------------------
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def clear(self) -> None:
+        """Xóa cache trong bộ nhớ (giữ nguyên file trên đĩa)"""
+        self._memory.clear()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {"hits": 0, "disk_hits": 0, "renders": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["renders"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["entries"] = len(self._memory)
+        stats["max_entries"] = self.max_entries
+        stats["directory"] = self.directory
+        return stats
+
+
+# Global QR image cache instance
+qr_image_cache = QRImageCache(settings.QR_CACHE_MAX_ENTRIES, settings.QR_CACHE_DIR or None)
@@ -0,0 +1,182 @@
+"""
+Sliding-window-counter rate limiting with pluggable (per-process or shared) backends
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+
+
+def _sliding_window(current: int, previous: int, elapsed: float, window: int, limit: int) -> float:
+    """Seconds to wait before one more hit fits in the limit (0 = allowed now).
+
+    The estimate weights the previous fixed window by how much of it still overlaps
+    the sliding window: previous * (1 - elapsed / window) + current.
+    """
+    weight = 1 - elapsed / window
+    if previous * weight + current + 1 <= limit:
+        return 0.0
+    if current + 1 <= limit and previous:
+        # Wait until the previous window's share has decayed enough
+        needed_weight = (limit - current - 1) / previous
+        return max((1 - needed_weight) * window - elapsed, 0.001)
+    return window - elapsed
+
+
+class RateLimitBackend:
+    """Counts hits per key; O(1) time and memory per key"""
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> float:
+        """Record a hit if allowed; return 0 when allowed, else seconds until retry"""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process counters kept in an LRU of at most max_keys entries.
+
+    Keys whose windows have fully passed are evicted from the LRU head on each hit,
+    so idle clients do not accumulate; max_keys caps memory under an IP flood.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        # key -> [window_index, current, previous, expires_at]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> float:
+        now = time.time()
+        window_index, elapsed = divmod(now, window_seconds)
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [window_index, 0, 0, 0.0]
+                self._entries[key] = entry
+            elif entry[0] != window_index:
+                entry[2] = entry[1] if entry[0] == window_index - 1 else 0
+                entry[1] = 0
+                entry[0] = window_index
+            self._entries.move_to_end(key)
+            # Counts are irrelevant once the window after the current one has passed
+            entry[3] = (window_index + 2) * window_seconds
+
+            retry_after = _sliding_window(entry[1], entry[2], elapsed, window_seconds, limit)
+            if not retry_after:
+                entry[1] += 1
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            return retry_after
+
+    def _evict_idle(self, now: float) -> None:
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[3] > now:
+                return
+            del self._entries[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Shared counters for any client exposing the redis-py get/incr/decr/expire API.
+
+    Every worker process sees the same counts, so ``--workers N`` no longer
+    multiplies the effective limit. Counter keys expire on their own.
+    """
+
+    def __init__(self, client, prefix: str = "school-payment:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key: str, limit: int, window_seconds: int) -> float:
+        window_index, elapsed = divmod(time.time(), window_seconds)
+        current_key = f"{self.prefix}{key}:{int(window_index)}"
+        previous = int(self.client.get(f"{self.prefix}{key}:{int(window_index) - 1}") or 0)
+
+        current = int(self.client.incr(current_key))
+        if current == 1:
+            self.client.expire(current_key, window_seconds * 2)
+        retry_after = _sliding_window(current - 1, previous, elapsed, window_seconds, limit)
+        if retry_after:
+            # Rejected hits do not count against the client
+            self.client.decr(current_key)
+        return retry_after
+
+    def reset(self) -> None:
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+class RateLimiter:
+    """Applies per-scope limits on top of a backend and keeps allow/reject counters"""
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def check(self, scope: str, identity: str, limit: int, window_seconds: int) -> None:
+        """Raise 429 (with Retry-After) when identity exceeded limit hits per window in scope"""
+        try:
+            retry_after = self.backend.hit(f"{scope}:{identity}", limit, window_seconds)
+        except Exception as e:
+            # Shared backend unavailable: let the request through rather than failing it
+            print(f"Rate limit backend error: {e}")
+            self._count(scope, "errors")
+            return
+
+        if retry_after:
+            self._count(scope, "rejected")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(int(retry_after + 0.999), 1))}
+            )
+        self._count(scope, "allowed")
+
+    def reset(self) -> None:
+        self.backend.reset()
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            scopes = {name: dict(counters) for name, counters in self._stats.items()}
+        result: Dict[str, Any] = {"backend": type(self.backend).__name__, "scopes": scopes}
+        if isinstance(self.backend, InMemoryRateLimitBackend):
+            result["tracked_keys"] = len(self.backend)
+            result["max_keys"] = self.backend.max_keys
+        return result
+
+    def _count(self, scope: str, counter: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(scope, {"allowed": 0, "rejected": 0, "errors": 0})
+            counters[counter] += 1
+
+
+def build_backend() -> RateLimitBackend:
+    """Create the backend selected by RATE_LIMIT_BACKEND (memory or redis)"""
+    if settings.RATE_LIMIT_BACKEND == "redis" and settings.REDIS_URL:
+        try:
+            import redis
+            return RedisRateLimitBackend(redis.Redis.from_url(settings.REDIS_URL))
+        except ImportError:
+            print("redis package not installed, falling back to in-memory rate limiting")
+    return InMemoryRateLimitBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+
+
+# Global rate limiter instance
+limiter = RateLimiter(build_backend())
@@ -0,0 +1,120 @@
+"""
+Read routing between the primary database and an optional read replica
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.core.cache import CacheBackend, InMemoryCacheBackend, build_backend
+from app.core.config import settings
+
+
+# Methods that never write; any other successful authenticated request counts as a write
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class ReadRouter:
+    """Decides whether a read-only request may use the replica.
+
+    - After a replica connection failure the replica is skipped for
+      REPLICA_RETRY_SECONDS, so requests do not pay a failed connect each time.
+    - A principal that wrote recently reads from the primary for
+      READ_YOUR_WRITES_SECONDS, so replication lag never hides their own change.
+      The marker lives in the given cache backend; with CACHE_BACKEND=redis it is
+      shared, so a write on one worker process routes reads on every other worker.
+    """
+
+    def __init__(
+        self,
+        retry_seconds: int,
+        read_your_writes_seconds: int,
+        backend: Optional[CacheBackend] = None,
+        max_tracked_writers: int = 10000
+    ):
+        self.retry_seconds = retry_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._recent_writers = backend if backend is not None else InMemoryCacheBackend(max_entries=max_tracked_writers)
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "replica_reads": 0,
+            "primary_reads_unavailable": 0,
+            "primary_reads_recent_write": 0,
+            "replica_failures": 0
+        }
+
+    def replica_available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def mark_replica_down(self, error: Exception) -> None:
+        print(f"Read replica unavailable, using primary for {self.retry_seconds}s: {error}")
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_seconds
+            self._stats["replica_failures"] += 1
+
+    def mark_write(self, subject: Optional[str]) -> None:
+        if subject and self.read_your_writes_seconds > 0:
+            try:
+                self._recent_writers.set(self._key(subject), True, self.read_your_writes_seconds)
+            except Exception as e:
+                print(f"Read-your-writes marker error: {e}")
+
+    def wrote_recently(self, subject: Optional[str]) -> bool:
+        if not subject:
+            return False
+        try:
+            return self._recent_writers.get(self._key(subject)) is not None
+        except Exception as e:
+            # Backend unavailable: reading from the primary is always consistent
+            print(f"Read-your-writes marker error: {e}")
+            return True
+
+    @staticmethod
+    def _key(subject: str) -> str:
+        return f"read_your_writes:{subject}"
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["replica_available"] = self.replica_available()
+        stats["backend"] = type(self._recent_writers).__name__
+        if isinstance(self._recent_writers, InMemoryCacheBackend):
+            stats["tracked_writers"] = len(self._recent_writers)
+        return stats
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that marks the principal of each successful write request"""
+
+    def __init__(self, app, router: ReadRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        response = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if response["status"] < 400:
+            self.router.mark_write(state.get("principal_subject"))
+
+
+# Global read router instance
+read_router = ReadRouter(
+    retry_seconds=settings.REPLICA_RETRY_SECONDS,
+    read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    backend=build_backend(max_entries=10000)
+)
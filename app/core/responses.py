@@ -1,9 +1,63 @@
 """
 Standardized API response formats
 """
-from typing import Any, Dict, List, Optional, Union
+import enum
+import json
+from decimal import Decimal
+from typing import Any, Dict, Generic, List, Optional, TypeVar, Union
+from fastapi.encoders import decimal_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+T = TypeVar("T")
+
+
+def _json_default(value: Any) -> Any:
+    """Encode the types the stdlib/orjson encoders do not handle natively"""
+    if isinstance(value, Decimal):
+        # Same rule as FastAPI's jsonable_encoder: integral values stay ints
+        return decimal_encoder(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (stdlib json when orjson is not installed).
+
+    Decimal, datetime/date and enums (e.g. OrderStatus) are encoded directly, so
+    handlers can return service dicts without converting values first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content,
+            default=_json_default,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+
+# Response class for the whole API (JSON_RESPONSE_CLASS=fast|default)
+DefaultJSONResponse = FastJSONResponse if settings.JSON_RESPONSE_CLASS == "fast" else JSONResponse
+
 
 class APIResponse(BaseModel):
     """Standard API response format"""
@@ -13,19 +67,24 @@ class APIResponse(BaseModel):
     meta: Optional[Dict[str, Any]] = None
 
 
-class PaginatedResponse(BaseModel):
-    """Paginated response format"""
+class PageMeta(BaseModel):
+    """Pagination metadata (see paginated_response)"""
+    total: Optional[int] = 0
+    page: Optional[int] = 1
+    per_page: int = 10
+    total_pages: Optional[int] = 0
+    has_next: bool = False
+    has_prev: bool = False
+    next_cursor: Optional[str] = None
+    total_is_estimate: bool = False
+
+
+class PaginatedResponse(BaseModel, Generic[T]):
+    """Paginated response format; use PaginatedResponse[ItemSchema] as response_model"""
     success: bool = True
     message: str = "Success"
-    data: List[Any] = []
-    meta: Dict[str, Any] = {
-        "total": 0,
-        "page": 1,
-        "per_page": 10,
-        "total_pages": 0,
-        "has_next": False,
-        "has_prev": False
-    }
+    data: List[T] = []
+    meta: PageMeta = PageMeta()
 
 
 class ErrorResponse(BaseModel):
@@ -66,26 +125,44 @@ def error_response(
 
 def paginated_response(
     data: List[Any],
-    total: int,
-    page: int = 1,
+    total: Optional[int],
+    page: Optional[int] = 1,
     per_page: int = 10,
-    message: str = "Thành công"
+    message: str = "Thành công",
+    has_next: Optional[bool] = None,
+    has_prev: Optional[bool] = None,
+    next_cursor: Optional[str] = None,
+    total_is_estimate: bool = False
 ) -> Dict[str, Any]:
-    """Create paginated response"""
-    total_pages = (total + per_page - 1) // per_page
+    """Create paginated response.
+
+    ``total`` may be None when the count was skipped; ``page`` is None for keyset
+    (cursor) pages, which carry ``next_cursor`` instead.
+    """
+    total_pages = (total + per_page - 1) // per_page if total is not None else None
+    if has_next is None:
+        has_next = page is not None and total_pages is not None and page < total_pages
+    if has_prev is None:
+        has_prev = page is not None and page > 1
+    
+    meta = {
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "total_pages": total_pages,
+        "has_next": has_next,
+        "has_prev": has_prev
+    }
+    if next_cursor is not None:
+        meta["next_cursor"] = next_cursor
+    if total_is_estimate:
+        meta["total_is_estimate"] = True
     
     return {
         "success": True,
         "message": message,
         "data": data,
-        "meta": {
-            "total": total,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": total_pages,
-            "has_next": page < total_pages,
-            "has_prev": page > 1
-        }
+        "meta": meta
     }
 
 
@@ -0,0 +1,267 @@
+"""
+Pooled, reusable SMTP sessions with reconnect-on-failure and batched sending
+"""
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from email.message import Message
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+def _connection_lost(error: Exception) -> bool:
+    """True when the session is unusable and the send may be retried on a new one"""
+    # 421: server is closing the session (idle timeout, per-session message cap, ...)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(code == 421 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError))
+
+
+class _PooledConnection:
+    __slots__ = ("smtp", "last_used", "messages")
+
+    def __init__(self):
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.last_used = 0.0
+        self.messages = 0
+
+
+class SMTPConnectionPool:
+    """Keeps up to `size` logged-in SMTP sessions open between sends.
+
+    Opening a session costs a TCP connect, EHLO, STARTTLS and AUTH; reusing one
+    costs nothing, so sending N messages no longer means N handshakes. Sessions
+    idle longer than max_idle_seconds (servers drop them) or that reached
+    max_messages_per_connection (servers cap them) are replaced. A send that finds
+    its session disconnected reconnects once and retries.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = "",
+        password: str = "",
+        use_tls: bool = True,
+        size: int = 2,
+        timeout: float = 10,
+        max_idle_seconds: float = 60,
+        max_messages_per_connection: int = 100,
+        connection_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self.connection_factory = connection_factory
+        self._idle: List[_PooledConnection] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    # -- Sending -------------------------------------------------------------
+
+    def send(self, message: Message) -> None:
+        """Send one message on a pooled session; raise on failure"""
+        try:
+            with self._checkout() as connection:
+                self._send_on(connection, message)
+        except Exception:
+            self._count(messages_failed=1)
+            raise
+        self._count(messages_sent=1)
+
+    def send_batch(self, messages: List[Message]) -> Dict[str, Any]:
+        """Send messages over one pooled session and return per-batch numbers.
+
+        A rejected message (refused recipient, ...) is counted as failed and the
+        batch continues; a dropped session is reopened once and the batch resumes.
+        If the server cannot be reached the remaining messages fail immediately.
+        """
+        started = time.perf_counter()
+        sent, reconnects, errors = 0, 0, []
+        if messages:
+            with self._checkout() as connection:
+                for index, message in enumerate(messages):
+                    try:
+                        reconnects += self._send_on(connection, message)
+                        sent += 1
+                    except (smtplib.SMTPException, OSError) as e:
+                        errors.append((message.get("To"), str(e)))
+                        if connection.smtp is None:
+                            errors.extend((m.get("To"), str(e)) for m in messages[index + 1:])
+                            break
+        seconds = time.perf_counter() - started
+
+        batch = {
+            "size": len(messages),
+            "sent": sent,
+            "failed": len(errors),
+            "seconds": round(seconds, 3),
+            "messages_per_second": round(sent / seconds, 1) if seconds > 0 else 0.0,
+            "reconnects": reconnects
+        }
+        with self._lock:
+            stats = self._stats
+            stats["messages_sent"] += sent
+            stats["messages_failed"] += len(errors)
+            stats["batches"] += 1
+            stats["batch_messages"] += len(messages)
+            stats["batch_seconds"] += seconds
+            stats["last_batch"] = batch
+        return {**batch, "errors": errors}
+
+    @contextmanager
+    def _checkout(self) -> Iterator[_PooledConnection]:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No SMTP connection available")
+        with self._lock:
+            connection = self._idle.pop() if self._idle else _PooledConnection()
+        try:
+            if connection.smtp is not None and time.monotonic() - connection.last_used > self.max_idle_seconds:
+                self._discard(connection)
+            elif connection.smtp is not None:
+                self._count(reused=1)
+            yield connection
+        finally:
+            if connection.smtp is not None:
+                with self._lock:
+                    self._idle.append(connection)
+            self._slots.release()
+
+    def _send_on(self, connection: _PooledConnection, message: Message) -> int:
+        """Send on the checked-out session, reconnecting once if it was lost; return reconnects"""
+        for attempt in (1, 2):
+            if connection.smtp is None:
+                connection.smtp = self._open()
+            try:
+                connection.smtp.send_message(message)
+            except Exception as e:
+                if not _connection_lost(e):
+                    raise
+                self._discard(connection)
+                if attempt == 2:
+                    raise
+                self._count(reconnects=1)
+                continue
+            connection.messages += 1
+            connection.last_used = time.monotonic()
+            if connection.messages >= self.max_messages_per_connection:
+                self._quit(connection)
+            return attempt - 1
+
+    # -- Session lifecycle ---------------------------------------------------
+
+    def _open(self) -> smtplib.SMTP:
+        smtp = self.connection_factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count(connections_opened=1)
+        return smtp
+
+    def _quit(self, connection: _PooledConnection) -> None:
+        """Close a healthy session politely"""
+        try:
+            connection.smtp.quit()
+        except Exception:
+            pass
+        self._discard(connection)
+
+    def _discard(self, connection: _PooledConnection) -> None:
+        if connection.smtp is not None:
+            try:
+                connection.smtp.close()
+            except Exception:
+                pass
+            self._count(connections_closed=1)
+        connection.smtp = None
+        connection.messages = 0
+
+    def close(self) -> None:
+        """Close the idle sessions (e.g. at shutdown)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._quit(connection)
+
+    # -- Metrics -------------------------------------------------------------
+
+    def _count(self, **counters: int) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                self._stats[name] += value
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {
+                "connections_opened": 0,
+                "connections_closed": 0,
+                "reused": 0,
+                "reconnects": 0,
+                "messages_sent": 0,
+                "messages_failed": 0,
+                "batches": 0,
+                "batch_messages": 0,
+                "batch_seconds": 0.0,
+                "last_batch": None
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle_connections"] = len(self._idle)
+        batch_seconds = stats.pop("batch_seconds")
+        stats["batch_messages_per_second"] = round(stats["batch_messages"] / batch_seconds, 1) if batch_seconds else 0.0
+        stats["size"] = self.size
+        stats["server"] = f"{self.host}:{self.port}"
+        return stats
+
+
+_pools: Dict[Tuple[str, int, str], SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str, port: int, username: str = "", password: str = "") -> SMTPConnectionPool:
+    """Process-wide pool for an SMTP server/account, created on first use"""
+    key = (host, port, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPConnectionPool(
+                host, port, username, password,
+                use_tls=settings.SMTP_USE_TLS,
+                size=settings.SMTP_POOL_SIZE,
+                timeout=settings.SMTP_TIMEOUT,
+                max_idle_seconds=settings.SMTP_MAX_IDLE_SECONDS,
+                max_messages_per_connection=settings.SMTP_MAX_MESSAGES_PER_CONNECTION
+            )
+            _pools[key] = pool
+        return pool
+
+
+def smtp_pool_stats() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_smtp_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
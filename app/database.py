@@ -1,42 +1,138 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from typing import Generator
 
 from app.core.config import settings
+from app.core.pool_metrics import InstrumentedQueuePool, PoolMetrics, instrument_engine
 
-# Create database engine
-if settings.database_url.startswith("sqlite"):
-    engine = create_engine(
-        settings.database_url,
-        connect_args={"check_same_thread": False},
-        echo=settings.DB_ECHO
-    )
-elif settings.database_url.startswith("mysql"):
-    # MySQL database with proper connection args
-    engine = create_engine(
-        settings.database_url,
-        echo=settings.DB_ECHO,
-        pool_pre_ping=True,
-        pool_recycle=300,
-        connect_args={
-            "charset": "utf8mb4",
-            "autocommit": True
+
+def pool_options() -> dict:
+    """Pool sizing/lifecycle options from settings for server databases (MySQL/PostgreSQL)"""
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if settings.DB_ISOLATION_LEVEL:
+        options["isolation_level"] = settings.DB_ISOLATION_LEVEL
+    return options
+
+
+def _sqlite_wal(dbapi_connection, connection_record) -> None:
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+
+def create_sync_engine(url: str, metrics: PoolMetrics):
+    """Create an engine for url with pool settings and pool metrics attached"""
+    if url.startswith("sqlite"):
+        # In-memory SQLite must keep its single-connection pool
+        sqlite_pool = {} if ":memory:" in url else {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
         }
-    )
-else:
-    # PostgreSQL or other databases
-    engine = create_engine(
-        settings.database_url,
-        echo=settings.DB_ECHO
-    )
+        new_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            echo=settings.DB_ECHO,
+            **sqlite_pool
+        )
+        if ":memory:" not in url:
+            # WAL: readers (streaming jobs, exports) do not block background workers' commits
+            event.listen(new_engine, "connect", _sqlite_wal)
+    elif url.startswith("mysql"):
+        # MySQL: transactions are managed by the Session, so no driver-level autocommit
+        new_engine = create_engine(
+            url,
+            echo=settings.DB_ECHO,
+            connect_args={"charset": "utf8mb4"},
+            **pool_options()
+        )
+    else:
+        # PostgreSQL or other databases
+        new_engine = create_engine(
+            url,
+            echo=settings.DB_ECHO,
+            **pool_options()
+        )
+
+    instrument_engine(new_engine, metrics)
+    return new_engine
+
+
+# Create database engine (pool metrics: GET /api/v1/monitoring/db-pool)
+pool_metrics = PoolMetrics()
+engine = create_sync_engine(settings.database_url, pool_metrics)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replica for reports, dashboards and list endpoints (see get_read_db)
+replica_engine = None
+ReplicaSessionLocal = None
+replica_pool_metrics = None
+if settings.DATABASE_REPLICA_URL:
+    replica_pool_metrics = PoolMetrics()
+    replica_engine = create_sync_engine(settings.DATABASE_REPLICA_URL, replica_pool_metrics)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+    @event.listens_for(ReplicaSessionLocal, "before_flush")
+    def _reject_replica_writes(session, flush_context, instances):
+        raise RuntimeError("Replica sessions are read-only; use get_db for writes")
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL to its asyncio driver (aiosqlite, aiomysql, asyncpg)"""
+    scheme, sep, rest = url.partition("://")
+    backend = scheme.split("+")[0]
+    drivers = {
+        "sqlite": "sqlite+aiosqlite",
+        "mysql": "mysql+aiomysql",
+        "postgresql": "postgresql+asyncpg",
+        "postgres": "postgresql+asyncpg",
+    }
+    if backend not in drivers:
+        raise ValueError(f"No async driver configured for database URL scheme '{scheme}'")
+    return drivers[backend] + sep + rest
+
+
+# Optional async engine (ASYNC_DB_ENABLED=true); requires the matching async driver package
+async_engine = None
+AsyncSessionLocal = None
+async_pool_metrics = None
+if settings.ASYNC_DB_ENABLED:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_url = settings.ASYNC_DATABASE_URL or async_database_url(settings.database_url)
+    async_pool = {key: value for key, value in pool_options().items() if key != "poolclass"}
+    if async_url.startswith("mysql"):
+        async_engine = create_async_engine(
+            async_url,
+            echo=settings.DB_ECHO,
+            connect_args={"charset": "utf8mb4"},
+            **async_pool
+        )
+    elif async_url.startswith("sqlite"):
+        async_engine = create_async_engine(async_url, echo=settings.DB_ECHO)
+    else:
+        async_engine = create_async_engine(async_url, echo=settings.DB_ECHO, **async_pool)
+
+    async_pool_metrics = PoolMetrics()
+    instrument_engine(async_engine.sync_engine, async_pool_metrics)
+
+    # expire_on_commit=False: attributes must stay readable after commit without implicit IO
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
 # Create declarative base
 Base = declarative_base()
 
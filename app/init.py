@@ -1,10 +1,13 @@
 """
-App initializer: create default admin if missing.
+App initializer: create default admin if missing, backfill daily rollups,
+fail reminder jobs orphaned by a stopped process.
 """
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models import User, UserRole
 from app.core.security import get_password_hash
+from app.services.rollup_service import RollupService
+from app.services.reminder_service import reminder_engine
 
 
 def ensure_default_admin():
@@ -26,3 +29,17 @@ def ensure_default_admin():
         db.close()
 
 
+def ensure_daily_rollups():
+    db: Session = SessionLocal()
+    try:
+        RollupService(db).ensure_backfilled()
+    finally:
+        db.close()
+
+
+def fail_orphaned_reminder_jobs():
+    db: Session = SessionLocal()
+    try:
+        reminder_engine.fail_orphans(db)
+    finally:
+        db.close()
@@ -2,12 +2,15 @@
 Main FastAPI application with improved structure
 """
 import os
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
+from app.core.responses import DefaultJSONResponse
 from app.core.exceptions import (
     AppException, 
     app_exception_handler, 
@@ -15,8 +18,15 @@ from app.core.exceptions import (
     validation_exception_handler,
     generic_exception_handler
 )
+from app.core.auth_metrics import AuthMetricsMiddleware, auth_metrics
+from app.core.read_routing import ReadYourWritesMiddleware, read_router
+from app.core.smtp_pool import close_smtp_pools
 from app.database import Base, engine
 from app.api.v1.api import api_router
+from app.services.email_service import get_email_service
+from app.services.email_worker import email_worker
+from app.services.reminder_service import reminder_engine
+from app.services.webhook_worker import webhook_worker
 from app import init as app_init
 
 # Tags metadata to describe groups in Swagger UI
@@ -53,11 +63,34 @@ tags_metadata = [
         "name": "Print Management",
         "description": "Quản lý máy in và lệnh in hóa đơn/phiếu.",
     },
+    {
+        "name": "Monitoring",
+        "description": "Số liệu giám sát hiệu năng (cache, ...), chỉ admin.",
+    },
 ]
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 app_init.ensure_default_admin()
+app_init.ensure_daily_rollups()
+app_init.fail_orphaned_reminder_jobs()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nạp và biên dịch template email một lần khi khởi động thay vì ở request đầu tiên
+    get_email_service()
+    # Worker xử lý outbox webhook (tắt nếu chạy riêng: python -m app.services.webhook_worker)
+    if settings.WEBHOOK_WORKER_ENABLED:
+        webhook_worker.start()
+    # Worker gửi email từ hàng đợi (tắt nếu chạy riêng: python -m app.services.email_worker)
+    if settings.EMAIL_WORKER_ENABLED:
+        email_worker.start()
+    yield
+    webhook_worker.stop()
+    email_worker.stop()
+    reminder_engine.shutdown()
+    close_smtp_pools()
 
 # Initialize FastAPI app with settings
 app = FastAPI(
@@ -66,6 +99,8 @@ app = FastAPI(
     version=settings.APP_VERSION,
     debug=settings.DEBUG,
     openapi_tags=tags_metadata,
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan,
     swagger_ui_parameters={
         "displayRequestDuration": True,
         "tryItOutEnabled": True,
@@ -96,6 +131,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Đếm số lần giải mã token / tải user cho mỗi request
+app.add_middleware(AuthMetricsMiddleware, metrics=auth_metrics)
+
+# Đọc từ primary trong một khoảng ngắn sau khi user ghi dữ liệu (chỉ khi có read replica)
+if settings.DATABASE_REPLICA_URL:
+    app.add_middleware(ReadYourWritesMiddleware, router=read_router)
+
 # Include API v1 router
 app.include_router(api_router, prefix="/api/v1")
 
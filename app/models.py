@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Numeric, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Enum, Text, Numeric, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -20,6 +20,18 @@ class PaymentStatus(str, enum.Enum):
     SUCCESS = "success"
     FAILED = "failed"
 
+class OutboxState(str, enum.Enum):
+    PENDING = "pending"        # Chờ worker xử lý (hoặc chờ thử lại)
+    PROCESSING = "processing"  # Worker đang xử lý
+    DONE = "done"
+    FAILED = "failed"          # Hết số lần thử
+
+class JobState(str, enum.Enum):
+    PENDING = "pending"  # Chờ chạy
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -169,4 +181,120 @@ class PasswordResetToken(Base):
     used = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+
+class DailyRollup(Base):
+    """Số liệu tổng hợp theo ngày × lớp × trạng thái đơn hàng.
+
+    Mỗi dòng ghi nhận các sự kiện xảy ra trong ngày:
+    - PENDING: order_count = số đơn hàng được tạo
+    - PAID: revenue/payment_count = giao dịch thành công, order_count = số đơn chuyển sang đã thanh toán
+    - INVOICED: order_count = số đơn được phát hành hóa đơn
+    """
+    __tablename__ = "daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "class_name", "status", name="uq_daily_rollups_day_class_status"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    class_name = Column(String(50), nullable=False)
+    status = Column(Enum(OrderStatus), nullable=False)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    payment_count = Column(Integer, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class WebhookEvent(Base):
+    """Outbox webhook thanh toán, đồng thời là khóa idempotency.
+
+    Endpoint webhook chỉ ghi sự kiện vào bảng này rồi trả 200; worker
+    (app.services.webhook_worker) cập nhật payment/order và gửi thông báo.
+    Mỗi cặp (transaction_id, status) chỉ được ghi một lần: cổng thanh toán gửi lại
+    cùng sự kiện sẽ vướng ràng buộc unique và được xác nhận ngay, không xử lý lại.
+    """
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        UniqueConstraint("transaction_id", "status", name="uq_webhook_events_txn_status"),
+        Index("ix_webhook_events_state_available", "state", "available_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    transaction_id = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False)
+    payload = Column(Text)
+    payment_id = Column(Integer, ForeignKey("payments.id"))
+    state = Column(Enum(OutboxState), nullable=False, default=OutboxState.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False)  # UTC; thời điểm được xử lý (lần thử tiếp / hết hạn lease)
+    last_error = Column(String(500))
+    processed_at = Column(DateTime)  # UTC
+    created_at = Column(DateTime, nullable=False)  # UTC, dùng để tính độ trễ hàng đợi
+
+class EmailOutbox(Base):
+    """Hàng đợi email (outbox) do EmailService.queue_email ghi, worker gửi.
+
+    Email được ghi cùng transaction với nghiệp vụ nên request trả về không chờ SMTP;
+    email gửi lỗi được thử lại với backoff, hết số lần thử thì ở trạng thái FAILED.
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_state_available", "state", "available_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # invoice | payment_confirmation | payment_reminder | password_reset
+    recipient = Column(String(255), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON tham số dựng email
+    state = Column(Enum(OutboxState), nullable=False, default=OutboxState.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False)  # UTC; thời điểm được gửi (lần thử tiếp / hết hạn lease)
+    last_error = Column(String(500))
+    processed_at = Column(DateTime)  # UTC
+    created_at = Column(DateTime, nullable=False)  # UTC
+
+class ReminderJob(Base):
+    """Một lần gửi nhắc nhở quá hạn (chạy nền), lưu tiến độ để tra cứu theo id"""
+    __tablename__ = "reminder_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    class_name = Column(String(50))  # None: mọi lớp
+    requested_by = Column(Integer, ForeignKey("users.id"))
+    state = Column(Enum(JobState), nullable=False, default=JobState.PENDING)
+    parents_total = Column(Integer, nullable=False, default=0)
+    parents_processed = Column(Integer, nullable=False, default=0)
+    parents_queued = Column(Integer, nullable=False, default=0)
+    parents_skipped = Column(Integer, nullable=False, default=0)  # đã được nhắc trong cửa sổ chống trùng
+    orders_total = Column(Integer, nullable=False, default=0)
+    error = Column(String(500))
+    owner = Column(String(100))  # tiến trình đã nhận job (host:pid:token)
+    heartbeat_at = Column(DateTime)  # UTC, cập nhật sau mỗi lô; job ngừng cập nhật quá lâu là job mồ côi
+    created_at = Column(DateTime, nullable=False)  # UTC
+    started_at = Column(DateTime)  # UTC
+    finished_at = Column(DateTime)  # UTC
+
+class ReminderRecipient(Base):
+    """Lần nhắc gần nhất của mỗi phụ huynh; job chiếm quyền nhắc bằng UPDATE có điều kiện nên
+    hai job chạy song song (kể cả ở hai tiến trình) không nhắc trùng trong cửa sổ chống trùng"""
+    __tablename__ = "reminder_recipients"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_reminded_at = Column(DateTime)  # UTC
+    job_id = Column(Integer, ForeignKey("reminder_jobs.id"))
+
+class ReminderLog(Base):
+    """Phụ huynh đã được xếp email nhắc nhở, dùng để không nhắc lại trong cửa sổ chống trùng"""
+    __tablename__ = "reminder_logs"
+    __table_args__ = (
+        Index("ix_reminder_logs_user_created", "user_id", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    job_id = Column(Integer, ForeignKey("reminder_jobs.id"), nullable=False, index=True)
+    email_id = Column(Integer, ForeignKey("email_outbox.id"))
+    order_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False)  # UTC
+    
+    email = relationship("EmailOutbox")
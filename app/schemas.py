@@ -15,6 +15,7 @@ class UserCreate(UserBase):
     password: str
 
 class UserResponse(UserBase):
+    email: str  # đã kiểm tra khi tạo; không chạy lại email-validator cho từng dòng khi trả về
     id: int
     is_active: bool
     created_at: datetime
@@ -0,0 +1,354 @@
+"""
+Lớp tổng hợp số liệu cho dashboard
+Gom các phép đếm/tính tổng vào ít truy vấn GROUP BY / CASE thay vì mỗi chỉ số một truy vấn
+"""
+from typing import Dict, List, Optional
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, and_, select
+from app.models import (
+    User, Student, Order, Payment, Invoice, DailyRollup, UserRole, OrderStatus, PaymentStatus
+)
+
+
+def _count_if(condition):
+    """COUNT có điều kiện, chạy được trên SQLite, MySQL và PostgreSQL"""
+    return func.sum(case((condition, 1), else_=0))
+
+
+def _sum_if(column, condition):
+    """SUM có điều kiện"""
+    return func.sum(case((condition, column), else_=0))
+
+
+def day_key(value) -> str:
+    """Chuẩn hóa giá trị func.date() (SQLite trả chuỗi, MySQL/PostgreSQL trả date)"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()[:10]
+    return str(value)[:10]
+
+
+def period_key(value, group_by: str) -> str:
+    """Khóa kỳ báo cáo tính trong Python: ngày (YYYY-MM-DD), thứ 2 đầu tuần, hoặc tháng (YYYY-MM)"""
+    day = date.fromisoformat(day_key(value))
+    if group_by == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if group_by == 'month':
+        return day.strftime('%Y-%m')
+    return day.isoformat()
+
+
+def period_bucket(column, group_by: str, dialect: str):
+    """Biểu thức SQL làm tròn ngày về kỳ báo cáo, trả về chuỗi cùng định dạng với period_key.
+
+    Trả về None nếu dialect không hỗ trợ, khi đó gom nhóm bằng Python.
+    """
+    if dialect == 'sqlite':
+        if group_by == 'week':
+            # 'weekday 0' tiến tới Chủ nhật gần nhất, lùi 6 ngày là thứ 2 đầu tuần
+            return func.date(column, 'weekday 0', '-6 days')
+        if group_by == 'month':
+            return func.strftime('%Y-%m', column)
+        return func.date(column)
+    if dialect in ('mysql', 'mariadb'):
+        if group_by == 'week':
+            # SUBDATE(d, WEEKDAY(d)) là thứ 2 đầu tuần
+            return func.date_format(func.subdate(column, func.weekday(column)), '%Y-%m-%d')
+        if group_by == 'month':
+            return func.date_format(column, '%Y-%m')
+        return func.date_format(column, '%Y-%m-%d')
+    if dialect == 'postgresql':
+        if group_by == 'week':
+            return func.to_char(func.date_trunc('week', column), 'YYYY-MM-DD')
+        if group_by == 'month':
+            return func.to_char(column, 'YYYY-MM')
+        return func.to_char(column, 'YYYY-MM-DD')
+    return None
+
+
+class DashboardAggregates:
+    """Các truy vấn tổng hợp dùng chung cho DashboardService"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def people_counts(self) -> Dict[str, int]:
+        """Số học sinh, phụ huynh, nhân viên trong một truy vấn"""
+        student_count = select(func.count(Student.id)).scalar_subquery()
+        row = self.db.query(
+            student_count.label('total_students'),
+            _count_if(User.role == UserRole.PARENT).label('total_parents'),
+            _count_if(User.role != UserRole.PARENT).label('total_staff')
+        ).one()
+
+        return {
+            'total_students': int(row.total_students or 0),
+            'total_parents': int(row.total_parents or 0),
+            'total_staff': int(row.total_staff or 0)
+        }
+
+    def order_status_counts(self, now: datetime) -> Dict[str, int]:
+        """Đếm đơn hàng theo trạng thái và số đơn quá hạn trong một truy vấn"""
+        row = self.db.query(
+            func.count(Order.id).label('total_orders'),
+            _count_if(Order.status == OrderStatus.PAID).label('paid_orders'),
+            _count_if(Order.status == OrderStatus.PENDING).label('pending_orders'),
+            _count_if(Order.status == OrderStatus.INVOICED).label('invoiced_orders'),
+            _count_if(and_(
+                Order.status == OrderStatus.PENDING,
+                Order.due_date < now
+            )).label('overdue_orders')
+        ).one()
+
+        return {
+            'total_orders': int(row.total_orders or 0),
+            'paid_orders': int(row.paid_orders or 0),
+            'pending_orders': int(row.pending_orders or 0),
+            'invoiced_orders': int(row.invoiced_orders or 0),
+            'overdue_orders': int(row.overdue_orders or 0)
+        }
+
+    def revenue_summary(self, this_month_start: date, last_month_start: date) -> Dict[str, Decimal]:
+        """Doanh thu tổng, tháng này và tháng trước (đọc từ daily_rollups) trong một truy vấn"""
+        row = self.db.query(
+            func.sum(DailyRollup.revenue).label('total'),
+            _sum_if(DailyRollup.revenue, DailyRollup.day >= this_month_start).label('monthly'),
+            _sum_if(DailyRollup.revenue, and_(
+                DailyRollup.day >= last_month_start,
+                DailyRollup.day < this_month_start
+            )).label('last_month')
+        ).filter(
+            DailyRollup.status == OrderStatus.PAID
+        ).one()
+
+        return {
+            'total': Decimal(str(row.total or 0)),
+            'monthly': Decimal(str(row.monthly or 0)),
+            'last_month': Decimal(str(row.last_month or 0))
+        }
+
+    def rollup_by_day(self, start: date, end: date) -> Dict[str, Dict]:
+        """Doanh thu, số giao dịch và số đơn mới theo ngày từ daily_rollups.
+
+        Chi phí phụ thuộc vào độ dài khoảng thời gian, không phụ thuộc kích thước bảng payments/orders.
+        """
+        rows = self.db.query(
+            DailyRollup.day,
+            _sum_if(DailyRollup.revenue, DailyRollup.status == OrderStatus.PAID).label('revenue'),
+            _sum_if(DailyRollup.payment_count, DailyRollup.status == OrderStatus.PAID).label('payments'),
+            _sum_if(DailyRollup.order_count, DailyRollup.status == OrderStatus.PENDING).label('orders')
+        ).filter(
+            and_(DailyRollup.day >= start, DailyRollup.day <= end)
+        ).group_by(DailyRollup.day).all()
+
+        return {
+            day_key(r.day): {
+                'revenue': Decimal(str(r.revenue or 0)),
+                'payments': int(r.payments or 0),
+                'orders': int(r.orders or 0)
+            }
+            for r in rows
+        }
+
+    def revenue_by_period(self, start: date, end: date, group_by: str = 'day') -> List[Dict]:
+        """Doanh thu và số giao dịch theo kỳ (day/week/month), gom nhóm ngay trong database.
+
+        Chỉ trả về các dòng theo kỳ; với dialect không hỗ trợ làm tròn ngày thì
+        đọc từng lô dòng theo ngày (yield_per) và cộng dồn trong Python.
+        """
+        filters = and_(
+            DailyRollup.status == OrderStatus.PAID,
+            DailyRollup.day >= start,
+            DailyRollup.day <= end
+        )
+        bucket = period_bucket(DailyRollup.day, group_by, self.db.get_bind().dialect.name)
+
+        if bucket is not None:
+            period = bucket.label('period')
+            rows = self.db.query(
+                period,
+                func.sum(DailyRollup.revenue).label('revenue'),
+                func.sum(DailyRollup.payment_count).label('count')
+            ).filter(filters).group_by(period).order_by(period).all()
+
+            return [
+                {
+                    'period': str(r.period),
+                    'revenue': Decimal(str(r.revenue or 0)),
+                    'count': int(r.count or 0)
+                }
+                for r in rows
+                if r.revenue or r.count
+            ]
+
+        grouped: Dict[str, Dict] = {}
+        rows = self.db.query(
+            DailyRollup.day,
+            DailyRollup.revenue,
+            DailyRollup.payment_count
+        ).filter(filters).yield_per(1000)
+        for r in rows:
+            key = period_key(r.day, group_by)
+            data = grouped.setdefault(key, {'period': key, 'revenue': Decimal('0'), 'count': 0})
+            data['revenue'] += Decimal(str(r.revenue or 0))
+            data['count'] += int(r.payment_count or 0)
+
+        return [
+            grouped[key] for key in sorted(grouped)
+            if grouped[key]['revenue'] or grouped[key]['count']
+        ]
+
+    def invoice_counts(self, this_month_start: date) -> Dict[str, int]:
+        """Tổng hóa đơn, hóa đơn tháng này và số đơn chờ phát hành trong một truy vấn"""
+        need_invoice = select(func.count(Order.id)).where(
+            Order.status == OrderStatus.PAID
+        ).scalar_subquery()
+        row = self.db.query(
+            func.count(Invoice.id).label('total_invoices'),
+            _count_if(Invoice.issued_at >= this_month_start).label('monthly_invoices'),
+            need_invoice.label('need_invoice')
+        ).one()
+
+        return {
+            'total_invoices': int(row.total_invoices or 0),
+            'monthly_invoices': int(row.monthly_invoices or 0),
+            'need_invoice': int(row.need_invoice or 0)
+        }
+
+    def invoices_by_period(self, start: date, end: date, group_by: str = 'month') -> Dict[str, int]:
+        """Số hóa đơn phát hành theo kỳ, gom nhóm trong database"""
+        filters = and_(
+            Invoice.issued_at >= datetime.combine(start, time.min),
+            Invoice.issued_at < datetime.combine(end + timedelta(days=1), time.min)
+        )
+        bucket = period_bucket(Invoice.issued_at, group_by, self.db.get_bind().dialect.name)
+
+        if bucket is not None:
+            period = bucket.label('period')
+            rows = self.db.query(
+                period,
+                func.count(Invoice.id).label('count')
+            ).filter(filters).group_by(period).all()
+            return {str(r.period): int(r.count) for r in rows}
+
+        counts: Dict[str, int] = {}
+        for r in self.db.query(Invoice.issued_at).filter(filters).yield_per(1000):
+            key = period_key(r.issued_at, group_by)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def class_order_stats(self, class_name: Optional[str] = None) -> List[Dict]:
+        """Số học sinh, số đơn và số tiền theo lớp trong một truy vấn GROUP BY Student.class_name.
+
+        Dùng OUTER JOIN nên lớp chưa có đơn hàng vẫn có mặt (total_orders = 0).
+        """
+        is_paid = Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
+        is_pending = and_(Order.id != None, Order.status.notin_([OrderStatus.PAID, OrderStatus.INVOICED]))
+
+        query = self.db.query(
+            Student.class_name,
+            func.count(func.distinct(Student.id)).label('student_count'),
+            func.count(func.distinct(Order.student_id)).label('students_with_orders'),
+            func.count(Order.id).label('total_orders'),
+            _count_if(is_paid).label('paid_orders'),
+            _count_if(is_pending).label('pending_orders'),
+            func.sum(Order.amount).label('total_amount'),
+            _sum_if(Order.amount, is_paid).label('paid_amount'),
+            _sum_if(Order.amount, is_pending).label('pending_amount')
+        ).outerjoin(Order, Order.student_id == Student.id)
+
+        if class_name:
+            query = query.filter(Student.class_name == class_name)
+
+        rows = query.group_by(Student.class_name).order_by(Student.class_name).all()
+
+        return [
+            {
+                'class_name': r.class_name,
+                'student_count': int(r.student_count or 0),
+                'students_with_orders': int(r.students_with_orders or 0),
+                'total_orders': int(r.total_orders or 0),
+                'paid_orders': int(r.paid_orders or 0),
+                'pending_orders': int(r.pending_orders or 0),
+                'total_amount': Decimal(str(r.total_amount or 0)),
+                'paid_amount': Decimal(str(r.paid_amount or 0)),
+                'pending_amount': Decimal(str(r.pending_amount or 0))
+            }
+            for r in rows
+        ]
+
+    def student_order_stats(self, parent_user_id: int) -> List[Dict]:
+        """Thông tin và số liệu đơn hàng của từng con của phụ huynh, GROUP BY student_id trong một truy vấn"""
+        return self.student_order_stats_rows(
+            self.db.execute(self.student_order_stats_statement(parent_user_id)).all()
+        )
+
+    @staticmethod
+    def student_order_stats_statement(parent_user_id: int):
+        """Câu truy vấn của student_order_stats (dùng được với Session và AsyncSession)"""
+        is_paid = Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
+        is_pending = Order.status == OrderStatus.PENDING
+
+        # Tổng tiền đã thanh toán tính riêng theo học sinh để không bị nhân bản bởi JOIN với orders
+        paid_amount = select(func.sum(Payment.amount)).join(
+            Order, Payment.order_id == Order.id
+        ).where(
+            and_(
+                Order.student_id == Student.id,
+                Payment.status == PaymentStatus.SUCCESS
+            )
+        ).correlate(Student).scalar_subquery()
+
+        return select(
+            Student.id,
+            Student.name,
+            Student.student_code,
+            Student.class_name,
+            Student.grade,
+            func.count(Order.id).label('total_orders'),
+            _count_if(is_paid).label('paid_orders'),
+            _count_if(is_pending).label('pending_orders'),
+            _sum_if(Order.amount, is_pending).label('pending_amount'),
+            paid_amount.label('paid_amount')
+        ).outerjoin(
+            Order, Order.student_id == Student.id
+        ).where(
+            Student.user_id == parent_user_id
+        ).group_by(
+            Student.id, Student.name, Student.student_code, Student.class_name, Student.grade
+        ).order_by(Student.id)
+
+    @staticmethod
+    def student_order_stats_rows(rows) -> List[Dict]:
+        """Chuyển các dòng của student_order_stats_statement thành dict"""
+        return [
+            {
+                'id': r.id,
+                'name': r.name,
+                'student_code': r.student_code,
+                'class_name': r.class_name,
+                'grade': r.grade,
+                'total_orders': int(r.total_orders or 0),
+                'paid_orders': int(r.paid_orders or 0),
+                'pending_orders': int(r.pending_orders or 0),
+                'pending_amount': Decimal(str(r.pending_amount or 0)),
+                'paid_amount': Decimal(str(r.paid_amount or 0))
+            }
+            for r in rows
+        ]
+
+    def daily_series(self, today: date, days: int = 7) -> List[Dict]:
+        """Doanh thu và số đơn theo ngày trong một truy vấn trên daily_rollups"""
+        by_day = self.rollup_by_day(today - timedelta(days=days - 1), today)
+
+        series = []
+        for i in range(days):
+            key = (today - timedelta(days=i)).isoformat()
+            data = by_day.get(key, {})
+            series.append({
+                'date': key,
+                'revenue': float(data.get('revenue') or 0),
+                'orders': int(data.get('orders') or 0)
+            })
+        return series
@@ -3,14 +3,15 @@ Service cung cấp dữ liệu dashboard và báo cáo
 Phục vụ các role khác nhau: Admin, Kế toán, Giáo vụ, Phụ huynh
 """
 from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import and_, or_, select
 from app.models import (
-    User, Student, Order, Payment, Invoice, UserRole, 
+    User, Student, Order, Payment,
     OrderStatus, PaymentStatus
 )
+from app.services.dashboard_aggregates import DashboardAggregates
 
 class DashboardService:
     """Service cung cấp dữ liệu dashboard"""
@@ -18,6 +19,12 @@ class DashboardService:
     def __init__(self, db: Session):
         self.db = db
         
+    @staticmethod
+    def _shift_month(month_start: date, months: int) -> date:
+        """Ngày đầu tháng sau khi dịch đi một số tháng"""
+        index = month_start.year * 12 + month_start.month - 1 + months
+        return date(index // 12, index % 12 + 1, 1)
+        
     def get_admin_dashboard(self) -> Dict:
         """Dashboard cho Admin - tổng quan toàn hệ thống"""
         try:
@@ -25,84 +32,29 @@ class DashboardService:
             this_month_start = today.replace(day=1)
             last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
             
-            # Thống kê tổng quan
-            total_students = self.db.query(Student).count()
-            total_parents = self.db.query(User).filter(User.role == UserRole.PARENT).count()
-            total_staff = self.db.query(User).filter(User.role != UserRole.PARENT).count()
+            aggregates = DashboardAggregates(self.db)
             
-            # Thống kê đơn hàng
-            total_orders = self.db.query(Order).count()
-            paid_orders = self.db.query(Order).filter(Order.status == OrderStatus.PAID).count()
-            pending_orders = self.db.query(Order).filter(Order.status == OrderStatus.PENDING).count()
-            invoiced_orders = self.db.query(Order).filter(Order.status == OrderStatus.INVOICED).count()
+            # Thống kê tổng quan và đơn hàng (mỗi nhóm một truy vấn)
+            people = aggregates.people_counts()
+            orders = aggregates.order_status_counts(datetime.now())
             
             # Thống kê doanh thu
-            total_revenue = self.db.query(func.sum(Payment.amount)).filter(
-                Payment.status == PaymentStatus.SUCCESS
-            ).scalar() or Decimal('0')
-            
-            monthly_revenue = self.db.query(func.sum(Payment.amount)).filter(
-                and_(
-                    Payment.status == PaymentStatus.SUCCESS,
-                    Payment.paid_at >= this_month_start
-                )
-            ).scalar() or Decimal('0')
-            
-            last_month_revenue = self.db.query(func.sum(Payment.amount)).filter(
-                and_(
-                    Payment.status == PaymentStatus.SUCCESS,
-                    Payment.paid_at >= last_month_start,
-                    Payment.paid_at < this_month_start
-                )
-            ).scalar() or Decimal('0')
+            revenue = aggregates.revenue_summary(this_month_start, last_month_start)
+            monthly_revenue = revenue['monthly']
+            last_month_revenue = revenue['last_month']
             
             # Tính tốc độ tăng trưởng
             growth_rate = 0
             if last_month_revenue > 0:
                 growth_rate = float((monthly_revenue - last_month_revenue) / last_month_revenue * 100)
                 
-            # Đơn hàng quá hạn
-            overdue_orders = self.db.query(Order).filter(
-                and_(
-                    Order.status == OrderStatus.PENDING,
-                    Order.due_date < datetime.now()
-                )
-            ).count()
-            
             # Thống kê theo ngày gần đây (7 ngày)
-            daily_stats = []
-            for i in range(7):
-                date = today - timedelta(days=i)
-                daily_revenue = self.db.query(func.sum(Payment.amount)).filter(
-                    and_(
-                        Payment.status == PaymentStatus.SUCCESS,
-                        func.date(Payment.paid_at) == date
-                    )
-                ).scalar() or Decimal('0')
-                
-                daily_orders = self.db.query(Order).filter(
-                    func.date(Order.created_at) == date
-                ).count()
-                
-                daily_stats.append({
-                    'date': date.isoformat(),
-                    'revenue': float(daily_revenue),
-                    'orders': daily_orders
-                })
+            daily_stats = aggregates.daily_series(today, days=7)
                 
             return {
-                'overview': {
-                    'total_students': total_students,
-                    'total_parents': total_parents,
-                    'total_staff': total_staff,
-                    'total_orders': total_orders,
-                    'paid_orders': paid_orders,
-                    'pending_orders': pending_orders,
-                    'invoiced_orders': invoiced_orders,
-                    'overdue_orders': overdue_orders
-                },
+                'overview': {**people, **orders},
                 'revenue': {
-                    'total': float(total_revenue),
+                    'total': float(revenue['total']),
                     'monthly': float(monthly_revenue),
                     'last_month': float(last_month_revenue),
                     'growth_rate': round(growth_rate, 2)
@@ -120,78 +72,65 @@ class DashboardService:
             today = datetime.now().date()
             this_month_start = today.replace(day=1)
             
-            # Thống kê hóa đơn
-            total_invoices = self.db.query(Invoice).count()
-            monthly_invoices = self.db.query(Invoice).filter(
-                Invoice.issued_at >= this_month_start
-            ).count()
+            aggregates = DashboardAggregates(self.db)
             
-            # Đơn hàng cần phát hành hóa đơn
-            need_invoice = self.db.query(Order).filter(
-                Order.status == OrderStatus.PAID
-            ).count()
+            # Thống kê hóa đơn và đơn hàng cần phát hành hóa đơn
+            invoice_stats = aggregates.invoice_counts(this_month_start)
+            
+            # Doanh thu và số hóa đơn theo tháng (mỗi chuỗi một truy vấn GROUP BY)
+            month_starts = [self._shift_month(this_month_start, -i) for i in range(6)]  # 6 tháng gần nhất
+            revenue_by_month = {
+                p['period']: p['revenue']
+                for p in aggregates.revenue_by_period(month_starts[-1], today, 'month')
+            }
+            invoices_by_month = aggregates.invoices_by_period(month_starts[-1], today, 'month')
             
-            # Doanh thu theo tháng
             monthly_revenue_data = []
-            for i in range(6):  # 6 tháng gần nhất
-                month_start = (today.replace(day=1) - timedelta(days=i*30)).replace(day=1)
-                month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-                
-                revenue = self.db.query(func.sum(Payment.amount)).filter(
-                    and_(
-                        Payment.status == PaymentStatus.SUCCESS,
-                        Payment.paid_at >= month_start,
-                        Payment.paid_at <= month_end
-                    )
-                ).scalar() or Decimal('0')
-                
-                invoice_count = self.db.query(Invoice).filter(
-                    and_(
-                        Invoice.issued_at >= month_start,
-                        Invoice.issued_at <= month_end
-                    )
-                ).count()
-                
+            for month_start in month_starts:
+                month_key = month_start.strftime('%Y-%m')
                 monthly_revenue_data.append({
-                    'month': month_start.strftime('%Y-%m'),
-                    'revenue': float(revenue),
-                    'invoices': invoice_count
+                    'month': month_key,
+                    'revenue': float(revenue_by_month.get(month_key, 0)),
+                    'invoices': invoices_by_month.get(month_key, 0)
                 })
                 
-            # Top 10 khoản thu lớn nhất tháng này
-            top_payments = self.db.query(Payment).join(Order).join(Student).join(User).filter(
+            # Top 10 khoản thu lớn nhất tháng này: lấy luôn các cột cần dùng trong một truy vấn JOIN
+            top_payments = self.db.query(
+                Payment.payment_code,
+                Payment.amount,
+                Payment.paid_at,
+                Order.description,
+                Student.name.label('student_name'),
+                User.name.label('parent_name')
+            ).join(
+                Order, Payment.order_id == Order.id
+            ).join(
+                Student, Order.student_id == Student.id
+            ).join(
+                User, Student.user_id == User.id
+            ).filter(
                 and_(
                     Payment.status == PaymentStatus.SUCCESS,
                     Payment.paid_at >= this_month_start
                 )
             ).order_by(Payment.amount.desc()).limit(10).all()
             
-            top_payments_data = []
-            for payment in top_payments:
-                order = self.db.query(Order).filter(Order.id == payment.order_id).first()
-                student = self.db.query(Student).filter(Student.id == order.student_id).first()
-                parent = self.db.query(User).filter(User.id == student.user_id).first()
-                
-                top_payments_data.append({
-                    'payment_code': payment.payment_code,
-                    'amount': float(payment.amount),
-                    'student_name': student.name,
-                    'parent_name': parent.name,
-                    'description': order.description,
-                    'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
-                })
+            top_payments_data = [
+                {
+                    'payment_code': row.payment_code,
+                    'amount': float(row.amount),
+                    'student_name': row.student_name,
+                    'parent_name': row.parent_name,
+                    'description': row.description,
+                    'paid_at': row.paid_at.isoformat() if row.paid_at else None
+                }
+                for row in top_payments
+            ]
                 
             return {
                 'overview': {
-                    'total_invoices': total_invoices,
-                    'monthly_invoices': monthly_invoices,
-                    'need_invoice': need_invoice,
-                    'monthly_revenue': float(self.db.query(func.sum(Payment.amount)).filter(
-                        and_(
-                            Payment.status == PaymentStatus.SUCCESS,
-                            Payment.paid_at >= this_month_start
-                        )
-                    ).scalar() or Decimal('0'))
+                    **invoice_stats,
+                    'monthly_revenue': float(revenue_by_month.get(this_month_start.strftime('%Y-%m'), 0))
                 },
                 'monthly_revenue_chart': monthly_revenue_data,
                 'top_payments': top_payments_data
@@ -207,43 +146,26 @@ class DashboardService:
             today = datetime.now().date()
             this_month_start = today.replace(day=1)
             
-            # Thống kê học sinh
-            total_students = self.db.query(Student).count()
-            
-            # Thống kê theo lớp
-            class_stats = self.db.query(
-                Student.class_name,
-                func.count(Student.id).label('student_count')
-            ).group_by(Student.class_name).all()
+            # Thống kê học sinh và thanh toán theo lớp (một truy vấn GROUP BY)
+            class_stats = DashboardAggregates(self.db).class_order_stats()
+            total_students = sum(stat['student_count'] for stat in class_stats)
             
             class_stats_data = [
-                {'class_name': stat.class_name, 'student_count': stat.student_count}
+                {'class_name': stat['class_name'], 'student_count': stat['student_count']}
                 for stat in class_stats
             ]
             
             # Thống kê thanh toán theo lớp
             class_payment_stats = []
-            for class_stat in class_stats:
-                class_name = class_stat.class_name
-                
-                # Tổng số đơn hàng của lớp
-                total_orders = self.db.query(Order).join(Student).filter(
-                    Student.class_name == class_name
-                ).count()
-                
-                # Số đơn đã thanh toán
-                paid_orders = self.db.query(Order).join(Student).filter(
-                    and_(
-                        Student.class_name == class_name,
-                        Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
-                    )
-                ).count()
+            for stat in class_stats:
+                total_orders = stat['total_orders']
+                paid_orders = stat['paid_orders']
                 
                 # Tỷ lệ thanh toán
                 payment_rate = (paid_orders / total_orders * 100) if total_orders > 0 else 0
                 
                 class_payment_stats.append({
-                    'class_name': class_name,
+                    'class_name': stat['class_name'],
                     'total_orders': total_orders,
                     'paid_orders': paid_orders,
                     'payment_rate': round(payment_rate, 1)
@@ -291,135 +213,136 @@ class DashboardService:
             print(f"Error getting teacher dashboard: {e}")
             return {}
             
-    def get_parent_dashboard(self, parent_user_id: int) -> Dict:
-        """Dashboard cho Phụ huynh - chỉ xem thông tin của con mình"""
+    def get_parent_dashboard(self, parent_user_id: int, compact: bool = False) -> Dict:
+        """Dashboard cho Phụ huynh - chỉ xem thông tin của con mình
+
+        compact=True chỉ trả về tổng quan và thông tin từng con (một truy vấn),
+        bỏ qua danh sách đơn chưa thanh toán và lịch sử thanh toán.
+        """
         try:
-            # Lấy danh sách học sinh của phụ huynh
-            students = self.db.query(Student).filter(Student.user_id == parent_user_id).all()
-            student_ids = [s.id for s in students]
+            # Thông tin và thống kê đơn hàng theo từng học sinh (một truy vấn GROUP BY)
+            student_stats = DashboardAggregates(self.db).student_order_stats(parent_user_id)
+            student_ids = [s['id'] for s in student_stats]
+            if not student_ids or compact:
+                return self._parent_dashboard(student_stats, compact)
             
-            if not student_ids:
-                return {'students': [], 'orders': [], 'payments': []}
-            
-            # Thống kê đơn hàng
-            total_orders = self.db.query(Order).filter(
-                Order.student_id.in_(student_ids)
-            ).count()
-            
-            pending_orders = self.db.query(Order).filter(
-                and_(
-                    Order.student_id.in_(student_ids),
-                    Order.status == OrderStatus.PENDING
-                )
-            ).count()
+            pending_orders = self.db.execute(self._parent_pending_orders_statement(student_ids)).all()
+            recent_payments = self.db.execute(self._parent_payments_statement(student_ids)).all()
+            return self._parent_dashboard(student_stats, compact, pending_orders, recent_payments)
             
-            paid_orders = self.db.query(Order).filter(
-                and_(
-                    Order.student_id.in_(student_ids),
-                    Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
-                )
-            ).count()
-            
-            # Tổng số tiền đã thanh toán
-            total_paid = self.db.query(func.sum(Payment.amount)).join(Order).filter(
-                and_(
-                    Order.student_id.in_(student_ids),
-                    Payment.status == PaymentStatus.SUCCESS
-                )
-            ).scalar() or Decimal('0')
-            
-            # Tổng số tiền chưa thanh toán
-            total_pending = self.db.query(func.sum(Order.amount)).filter(
-                and_(
-                    Order.student_id.in_(student_ids),
-                    Order.status == OrderStatus.PENDING
-                )
-            ).scalar() or Decimal('0')
-            
-            # Danh sách đơn hàng chưa thanh toán
-            pending_orders_detail = self.db.query(Order, Student).join(
-                Student, Order.student_id == Student.id
-            ).filter(
-                and_(
-                    Order.student_id.in_(student_ids),
-                    Order.status == OrderStatus.PENDING
-                )
-            ).order_by(Order.due_date.asc()).all()
+        except Exception as e:
+            print(f"Error getting parent dashboard: {e}")
+            return {}
             
-            pending_data = []
-            for order, student in pending_orders_detail:
-                is_overdue = order.due_date and order.due_date < datetime.now()
-                pending_data.append({
-                    'order_id': order.id,
-                    'order_code': order.order_code,
-                    'student_name': student.name,
-                    'class_name': student.class_name,
-                    'description': order.description,
-                    'amount': float(order.amount),
-                    'due_date': order.due_date.isoformat() if order.due_date else None,
-                    'is_overdue': is_overdue
-                })
-                
-            # Lịch sử thanh toán gần đây
-            recent_payments = self.db.query(Payment, Order, Student).join(
-                Order, Payment.order_id == Order.id
-            ).join(
-                Student, Order.student_id == Student.id
-            ).filter(
-                and_(
-                    Order.student_id.in_(student_ids),
-                    Payment.status == PaymentStatus.SUCCESS
-                )
-            ).order_by(Payment.paid_at.desc()).limit(10).all()
+    async def get_parent_dashboard_async(self, parent_user_id: int, compact: bool = False) -> Dict:
+        """Bản async của get_parent_dashboard (self.db là AsyncSession), cùng truy vấn và kết quả"""
+        try:
+            rows = (await self.db.execute(DashboardAggregates.student_order_stats_statement(parent_user_id))).all()
+            student_stats = DashboardAggregates.student_order_stats_rows(rows)
+            student_ids = [s['id'] for s in student_stats]
+            if not student_ids or compact:
+                return self._parent_dashboard(student_stats, compact)
             
-            payment_history = []
-            for payment, order, student in recent_payments:
-                payment_history.append({
-                    'payment_code': payment.payment_code,
-                    'student_name': student.name,
-                    'description': order.description,
-                    'amount': float(payment.amount),
-                    'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
-                })
-                
-            # Thông tin học sinh
-            students_data = []
-            for student in students:
-                student_orders = self.db.query(Order).filter(Order.student_id == student.id).count()
-                student_paid = self.db.query(Order).filter(
-                    and_(
-                        Order.student_id == student.id,
-                        Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
-                    )
-                ).count()
-                
-                students_data.append({
-                    'id': student.id,
-                    'name': student.name,
-                    'student_code': student.student_code,
-                    'class_name': student.class_name,
-                    'grade': student.grade,
-                    'total_orders': student_orders,
-                    'paid_orders': student_paid
-                })
-                
-            return {
-                'overview': {
-                    'total_orders': total_orders,
-                    'pending_orders': pending_orders,
-                    'paid_orders': paid_orders,
-                    'total_paid': float(total_paid),
-                    'total_pending': float(total_pending)
-                },
-                'students': students_data,
-                'pending_orders': pending_data,
-                'payment_history': payment_history
-            }
+            pending_orders = (await self.db.execute(self._parent_pending_orders_statement(student_ids))).all()
+            recent_payments = (await self.db.execute(self._parent_payments_statement(student_ids))).all()
+            return self._parent_dashboard(student_stats, compact, pending_orders, recent_payments)
             
         except Exception as e:
             print(f"Error getting parent dashboard: {e}")
             return {}
             
+    @staticmethod
+    def _parent_pending_orders_statement(student_ids: List[int]):
+        """Danh sách đơn hàng chưa thanh toán"""
+        return select(Order, Student).join(
+            Student, Order.student_id == Student.id
+        ).where(
+            and_(
+                Order.student_id.in_(student_ids),
+                Order.status == OrderStatus.PENDING
+            )
+        ).order_by(Order.due_date.asc())
+        
+    @staticmethod
+    def _parent_payments_statement(student_ids: List[int]):
+        """Lịch sử thanh toán gần đây"""
+        return select(Payment, Order, Student).join(
+            Order, Payment.order_id == Order.id
+        ).join(
+            Student, Order.student_id == Student.id
+        ).where(
+            and_(
+                Order.student_id.in_(student_ids),
+                Payment.status == PaymentStatus.SUCCESS
+            )
+        ).order_by(Payment.paid_at.desc()).limit(10)
+        
+    @staticmethod
+    def _parent_dashboard(student_stats: List[Dict], compact: bool, pending_orders=(), recent_payments=()) -> Dict:
+        """Dựng kết quả dashboard phụ huynh từ số liệu từng học sinh và các dòng đã truy vấn"""
+        if not student_stats:
+            return {'students': [], 'orders': [], 'payments': []}
+        
+        # Thống kê đơn hàng và số tiền: cộng dồn từ số liệu từng học sinh
+        overview = {
+            'total_orders': sum(s['total_orders'] for s in student_stats),
+            'pending_orders': sum(s['pending_orders'] for s in student_stats),
+            'paid_orders': sum(s['paid_orders'] for s in student_stats),
+            'total_paid': float(sum((s['paid_amount'] for s in student_stats), Decimal('0'))),
+            'total_pending': float(sum((s['pending_amount'] for s in student_stats), Decimal('0')))
+        }
+        
+        # Thông tin học sinh
+        students_data = [
+            {
+                'id': s['id'],
+                'name': s['name'],
+                'student_code': s['student_code'],
+                'class_name': s['class_name'],
+                'grade': s['grade'],
+                'total_orders': s['total_orders'],
+                'paid_orders': s['paid_orders']
+            }
+            for s in student_stats
+        ]
+        
+        if compact:
+            return {
+                'overview': overview,
+                'students': students_data
+            }
+        
+        pending_data = []
+        for order, student in pending_orders:
+            is_overdue = order.due_date and order.due_date < datetime.now()
+            pending_data.append({
+                'order_id': order.id,
+                'order_code': order.order_code,
+                'student_name': student.name,
+                'class_name': student.class_name,
+                'description': order.description,
+                'amount': float(order.amount),
+                'due_date': order.due_date.isoformat() if order.due_date else None,
+                'is_overdue': is_overdue
+            })
+            
+        payment_history = []
+        for payment, order, student in recent_payments:
+            payment_history.append({
+                'payment_code': payment.payment_code,
+                'student_name': student.name,
+                'description': order.description,
+                'amount': float(payment.amount),
+                'paid_at': payment.paid_at.isoformat() if payment.paid_at else None
+            })
+            
+        return {
+            'overview': overview,
+            'students': students_data,
+            'pending_orders': pending_data,
+            'payment_history': payment_history
+        }
+            
     def generate_revenue_report(
         self, 
         start_date: datetime, 
@@ -428,58 +351,26 @@ class DashboardService:
     ) -> Dict:
         """Tạo báo cáo doanh thu theo khoảng thời gian"""
         try:
-            # Lấy dữ liệu thanh toán trong khoảng thời gian
-            payments = self.db.query(Payment).filter(
-                and_(
-                    Payment.status == PaymentStatus.SUCCESS,
-                    Payment.paid_at >= start_date,
-                    Payment.paid_at <= end_date
-                )
-            ).all()
+            # Gom nhóm theo kỳ trong database trên daily_rollups, chỉ nhận về các dòng theo kỳ
+            periods = DashboardAggregates(self.db).revenue_by_period(
+                start_date.date(), end_date.date(), group_by
+            )
             
-            # Group dữ liệu theo yêu cầu
-            grouped_data = {}
-            total_revenue = Decimal('0')
+            total_revenue = sum((p['revenue'] for p in periods), Decimal('0'))
+            total_transactions = sum(p['count'] for p in periods)
             
-            for payment in payments:
-                if not payment.paid_at:
-                    continue
-                    
-                if group_by == 'day':
-                    key = payment.paid_at.date().isoformat()
-                elif group_by == 'week':
-                    # Lấy thứ 2 của tuần
-                    week_start = payment.paid_at.date() - timedelta(days=payment.paid_at.weekday())
-                    key = week_start.isoformat()
-                elif group_by == 'month':
-                    key = payment.paid_at.strftime('%Y-%m')
-                else:
-                    key = payment.paid_at.date().isoformat()
-                    
-                if key not in grouped_data:
-                    grouped_data[key] = {
-                        'revenue': Decimal('0'),
-                        'count': 0,
-                        'period': key
-                    }
-                    
-                grouped_data[key]['revenue'] += payment.amount
-                grouped_data[key]['count'] += 1
-                total_revenue += payment.amount
-                
-            # Convert to list và sort
-            revenue_data = []
-            for key in sorted(grouped_data.keys()):
-                data = grouped_data[key]
-                revenue_data.append({
-                    'period': key,
-                    'revenue': float(data['revenue']),
-                    'count': data['count']
-                })
+            revenue_data = [
+                {
+                    'period': p['period'],
+                    'revenue': float(p['revenue']),
+                    'count': p['count']
+                }
+                for p in periods
+            ]
                 
             return {
                 'total_revenue': float(total_revenue),
-                'total_transactions': len(payments),
+                'total_transactions': total_transactions,
                 'period_start': start_date.isoformat(),
                 'period_end': end_date.isoformat(),
                 'group_by': group_by,
@@ -493,61 +384,27 @@ class DashboardService:
     def get_collection_report(self, class_name: Optional[str] = None) -> Dict:
         """Báo cáo thu học phí theo lớp"""
         try:
-            query = self.db.query(Order, Student, User).join(
-                Student, Order.student_id == Student.id
-            ).join(
-                User, Student.user_id == User.id
-            )
+            # Tổng hợp theo lớp ngay trong database, chỉ giữ các lớp có đơn hàng
+            class_stats = DashboardAggregates(self.db).class_order_stats(class_name)
             
-            if class_name:
-                query = query.filter(Student.class_name == class_name)
-                
-            orders = query.all()
-            
-            # Tổng hợp dữ liệu
-            collection_data = {}
-            for order, student, parent in orders:
-                class_key = student.class_name
-                
-                if class_key not in collection_data:
-                    collection_data[class_key] = {
-                        'class_name': class_key,
-                        'total_orders': 0,
-                        'paid_orders': 0,
-                        'pending_orders': 0,
-                        'total_amount': Decimal('0'),
-                        'paid_amount': Decimal('0'),
-                        'pending_amount': Decimal('0'),
-                        'students': set()
-                    }
-                    
-                data = collection_data[class_key]
-                data['total_orders'] += 1
-                data['total_amount'] += order.amount
-                data['students'].add(student.id)
-                
-                if order.status in [OrderStatus.PAID, OrderStatus.INVOICED]:
-                    data['paid_orders'] += 1
-                    data['paid_amount'] += order.amount
-                else:
-                    data['pending_orders'] += 1
-                    data['pending_amount'] += order.amount
-                    
             # Convert sang list và tính tỷ lệ
             result = []
-            for class_key, data in collection_data.items():
+            for data in class_stats:
+                if data['total_orders'] == 0:
+                    continue
+                    
                 collection_rate = (data['paid_amount'] / data['total_amount'] * 100) if data['total_amount'] > 0 else 0
                 
                 result.append({
                     'class_name': data['class_name'],
-                    'student_count': len(data['students']),
+                    'student_count': data['students_with_orders'],
                     'total_orders': data['total_orders'],
                     'paid_orders': data['paid_orders'],
                     'pending_orders': data['pending_orders'],
                     'total_amount': float(data['total_amount']),
                     'paid_amount': float(data['paid_amount']),
                     'pending_amount': float(data['pending_amount']),
-                    'collection_rate': round(collection_rate, 2)
+                    'collection_rate': round(float(collection_rate), 2)
                 })
                 
             # Sort theo tỷ lệ thu
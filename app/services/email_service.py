@@ -1,34 +1,155 @@
 """
 Service gửi email notification
 Gửi hóa đơn điện tử và thông báo thanh toán
+
+Nghiệp vụ ghi email vào hàng đợi (queue_email -> bảng email_outbox) nên request không
+chờ SMTP; worker app.services.email_worker dựng email, gửi qua pool SMTP và thử lại khi lỗi.
 """
+import json
 import os
-import smtplib
+import threading
+from datetime import date, datetime
+from decimal import Decimal
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 from typing import List, Optional
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.outbox import utcnow
+from app.core.smtp_pool import get_smtp_pool
+from app.models import EmailOutbox, OutboxState
+
+# Loại email trong hàng đợi -> hàm dựng email tương ứng
+EMAIL_KINDS = {
+    "invoice": "build_invoice_email",
+    "payment_confirmation": "build_payment_confirmation",
+    "payment_reminder": "build_payment_reminder",
+    "password_reset": "build_password_reset",
+}
+
+
+def _json_default(value):
+    """Chuyển Decimal/ngày giờ trong tham số email sang JSON"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Không lưu được {type(value).__name__} vào hàng đợi email")
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "..", "templates", "email")
+
+_templates: Optional[Environment] = None
+_service: Optional["EmailService"] = None
+_lock = threading.Lock()
+
+
+def _wake_email_worker(session):
+    """Sau commit của session đã xếp email: báo worker xử lý ngay thay vì chờ chu kỳ poll"""
+    from app.services.email_worker import email_worker
+    email_worker.notify()
+
 
 class EmailService:
     """Service gửi email"""
     
     def __init__(self):
-        self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+        self.smtp_server = os.getenv("SMTP_SERVER", os.getenv("SMTP_HOST", "smtp.gmail.com"))
         self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
         self.smtp_username = os.getenv("SMTP_USERNAME", "")
         self.smtp_password = os.getenv("SMTP_PASSWORD", "")
         self.sender_email = os.getenv("SENDER_EMAIL", self.smtp_username)
         self.sender_name = os.getenv("SENDER_NAME", "Hệ thống thanh toán trường học")
+        # Phiên SMTP dùng chung trong tiến trình (không mở kết nối/STARTTLS/login cho mỗi email)
+        self.smtp_pool = get_smtp_pool(self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password)
         
-        # Setup Jinja2 cho email templates
-        template_dir = os.path.join(os.path.dirname(__file__), "..", "templates", "email")
-        os.makedirs(template_dir, exist_ok=True)
-        self.jinja_env = Environment(loader=FileSystemLoader(template_dir))
+        # Template dùng chung trong tiến trình, đã biên dịch sẵn (không ghi file/biên dịch lại mỗi lần)
+        self.jinja_env = get_email_templates()
+    
+    def queue_email(self, db: Session, kind: str, recipient_email: str, **params) -> EmailOutbox:
+        """Ghi email vào hàng đợi trong transaction của db (người gọi commit)
         
-        # Tạo các template email cơ bản
-        self._ensure_email_templates()
+        kind là một khóa của EMAIL_KINDS, params là tham số của hàm dựng email tương ứng.
+        Email chỉ được gửi khi transaction commit; worker được đánh thức ngay sau commit.
+        """
+        if kind not in EMAIL_KINDS:
+            raise ValueError(f"Loại email không hợp lệ: {kind}")
+        now = utcnow()
+        item = EmailOutbox(
+            kind=kind,
+            recipient=recipient_email,
+            payload=json.dumps({"recipient_email": recipient_email, **params}, ensure_ascii=False, default=_json_default),
+            state=OutboxState.PENDING,
+            available_at=now,
+            created_at=now
+        )
+        db.add(item)
+        if not event.contains(db, "after_commit", _wake_email_worker):
+            event.listen(db, "after_commit", _wake_email_worker)
+        return item
+    
+    def build_message(self, kind: str, params: dict) -> MIMEMultipart:
+        """Dựng email của một dòng hàng đợi"""
+        return getattr(self, EMAIL_KINDS[kind])(**params)
+        
+    def build_invoice_email(
+        self, 
+        recipient_email: str, 
+        recipient_name: str,
+        invoice_data: dict,
+        pdf_path: Optional[str] = None,
+        xml_path: Optional[str] = None
+    ) -> MIMEMultipart:
+        """Email hóa đơn điện tử cho phụ huynh (kèm PDF/XML nếu có)"""
+        # Load template
+        template = self.jinja_env.get_template("invoice_notification.html")
+        
+        # Render HTML content
+        html_content = template.render(recipient_name=recipient_name, invoice_data=invoice_data)
+        
+        # Tạo email
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = f"Hóa đơn điện tử #{invoice_data['invoice_number']}"
+        msg['From'] = f"{self.sender_name} <{self.sender_email}>"
+        msg['To'] = recipient_email
+        
+        # Text version (fallback)
+        text_content = self.jinja_env.get_template("invoice_notification.txt").render(
+            recipient_name=recipient_name, invoice_data=invoice_data, sender_name=self.sender_name
+        )
+        
+        msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
+        msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+        
+        # Attach PDF nếu có
+        if pdf_path and os.path.exists(pdf_path):
+            with open(pdf_path, "rb") as attachment:
+                part = MIMEBase('application', 'pdf')
+                part.set_payload(attachment.read())
+                encoders.encode_base64(part)
+                part.add_header(
+                    'Content-Disposition',
+                    f'attachment; filename= invoice_{invoice_data["invoice_number"]}.pdf'
+                )
+                msg.attach(part)
+        
+        # Attach XML nếu có
+        if xml_path and os.path.exists(xml_path):
+            with open(xml_path, "rb") as attachment:
+                part = MIMEBase('application', 'xml')
+                part.set_payload(attachment.read())
+                encoders.encode_base64(part)
+                part.add_header(
+                    'Content-Disposition',
+                    f'attachment; filename= invoice_{invoice_data["invoice_number"]}.xml'
+                )
+                msg.attach(part)
+        
+        return msg
         
     def send_invoice_email(
         self, 
@@ -38,136 +159,70 @@ class EmailService:
         pdf_path: Optional[str] = None,
         xml_path: Optional[str] = None
     ) -> bool:
-        """Gửi email hóa đơn điện tử cho phụ huynh"""
+        """Gửi ngay email hóa đơn điện tử cho phụ huynh (không qua hàng đợi)"""
         try:
-            # Load template
-            template = self.jinja_env.get_template("invoice_notification.html")
-            
-            # Render HTML content
-            html_content = template.render(
-                recipient_name=recipient_name,
-                invoice_data=invoice_data,
-                company_name=os.getenv("COMPANY_NAME", "Trường Tiểu học ABC")
-            )
-            
-            # Tạo email
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = f"Hóa đơn điện tử #{invoice_data['invoice_number']}"
-            msg['From'] = f"{self.sender_name} <{self.sender_email}>"
-            msg['To'] = recipient_email
-            
-            # Text version (fallback)
-            text_content = f"""
-Kính gửi {recipient_name},
-
-Hóa đơn điện tử của bạn đã được phát hành thành công.
-
-Thông tin hóa đơn:
-- Số hóa đơn: {invoice_data['invoice_number']}
-- Mã tra cứu: {invoice_data.get('lookup_code', 'N/A')}
-- Học sinh: {invoice_data.get('student_name', 'N/A')}
-- Số tiền: {invoice_data.get('total_amount', 0):,.0f} VNĐ
-- Nội dung: {invoice_data.get('description', 'N/A')}
-
-Bạn có thể tra cứu hóa đơn tại: https://tracuuhoadon.gdt.gov.vn
-
-Trân trọng,
-{self.sender_name}
-            """
-            
-            msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-            msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-            
-            # Attach PDF nếu có
-            if pdf_path and os.path.exists(pdf_path):
-                with open(pdf_path, "rb") as attachment:
-                    part = MIMEBase('application', 'pdf')
-                    part.set_payload(attachment.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= invoice_{invoice_data["invoice_number"]}.pdf'
-                    )
-                    msg.attach(part)
-            
-            # Attach XML nếu có
-            if xml_path and os.path.exists(xml_path):
-                with open(xml_path, "rb") as attachment:
-                    part = MIMEBase('application', 'xml')
-                    part.set_payload(attachment.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= invoice_{invoice_data["invoice_number"]}.xml'
-                    )
-                    msg.attach(part)
-            
-            # Gửi email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                if self.smtp_username and self.smtp_password:
-                    server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
-                
+            self.smtp_pool.send(self.build_invoice_email(recipient_email, recipient_name, invoice_data, pdf_path, xml_path))
             return True
             
         except Exception as e:
             print(f"Error sending invoice email: {e}")
             return False
             
+    def build_payment_confirmation(
+        self,
+        recipient_email: str,
+        recipient_name: str,
+        payment_data: dict
+    ) -> MIMEMultipart:
+        """Email xác nhận thanh toán thành công"""
+        template = self.jinja_env.get_template("payment_confirmation.html")
+        
+        html_content = template.render(recipient_name=recipient_name, payment_data=payment_data)
+        
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = f"Xác nhận thanh toán #{payment_data['payment_code']}"
+        msg['From'] = f"{self.sender_name} <{self.sender_email}>"
+        msg['To'] = recipient_email
+        
+        text_content = self.jinja_env.get_template("payment_confirmation.txt").render(
+            recipient_name=recipient_name, payment_data=payment_data, sender_name=self.sender_name
+        )
+        
+        msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
+        msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+        return msg
+            
     def send_payment_confirmation(
         self,
         recipient_email: str,
         recipient_name: str,
         payment_data: dict
     ) -> bool:
-        """Gửi email xác nhận thanh toán thành công"""
+        """Gửi ngay email xác nhận thanh toán thành công (không qua hàng đợi)"""
         try:
-            template = self.jinja_env.get_template("payment_confirmation.html")
-            
-            html_content = template.render(
-                recipient_name=recipient_name,
-                payment_data=payment_data,
-                company_name=os.getenv("COMPANY_NAME", "Trường Tiểu học ABC")
-            )
-            
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = f"Xác nhận thanh toán #{payment_data['payment_code']}"
-            msg['From'] = f"{self.sender_name} <{self.sender_email}>"
-            msg['To'] = recipient_email
-            
-            text_content = f"""
-Kính gửi {recipient_name},
-
-Thanh toán của bạn đã được xử lý thành công.
-
-Thông tin thanh toán:
-- Mã giao dịch: {payment_data['payment_code']}
-- Số tiền: {payment_data.get('amount', 0):,.0f} VNĐ
-- Học sinh: {payment_data.get('student_name', 'N/A')}
-- Nội dung: {payment_data.get('description', 'N/A')}
-- Thời gian: {payment_data.get('paid_at', 'N/A')}
-
-Hóa đơn điện tử sẽ được gửi trong thời gian sớm nhất.
-
-Trân trọng,
-{self.sender_name}
-            """
-            
-            msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-            msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-            
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                if self.smtp_username and self.smtp_password:
-                    server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
-                
+            self.smtp_pool.send(self.build_payment_confirmation(recipient_email, recipient_name, payment_data))
             return True
             
         except Exception as e:
             print(f"Error sending payment confirmation: {e}")
             return False
+    
+    def build_payment_reminder(self, recipient_email: str, orders: List[dict]) -> MIMEMultipart:
+        """Email nhắc nhở thanh toán các khoản quá hạn của một phụ huynh"""
+        context = {
+            "parent_name": orders[0].get('parent_name', 'Phụ huynh'),
+            "orders": orders,
+            "sender_name": self.sender_name
+        }
+        
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = "Nhắc nhở thanh toán học phí"
+        msg['From'] = f"{self.sender_name} <{self.sender_email}>"
+        msg['To'] = recipient_email
+        
+        msg.attach(MIMEText(self.jinja_env.get_template("payment_reminder.txt").render(context), 'plain', 'utf-8'))
+        msg.attach(MIMEText(self.jinja_env.get_template("payment_reminder.html").render(context), 'html', 'utf-8'))
+        return msg
             
     def send_payment_reminder(
         self,
@@ -176,68 +231,56 @@ Trân trọng,
     ) -> bool:
         """Gửi email nhắc nhở thanh toán cho các khoản quá hạn"""
         try:
-            template = self.jinja_env.get_template("payment_reminder.html")
-            
-            for email in recipient_emails:
-                # Filter orders for this parent
-                parent_orders = [o for o in overdue_orders if o.get('parent_email') == email]
-                if not parent_orders:
-                    continue
-                    
-                html_content = template.render(
-                    parent_name=parent_orders[0].get('parent_name', 'Phụ huynh'),
-                    orders=parent_orders,
-                    company_name=os.getenv("COMPANY_NAME", "Trường Tiểu học ABC")
-                )
-                
-                msg = MIMEMultipart('alternative')
-                msg['Subject'] = "Nhắc nhở thanh toán học phí"
-                msg['From'] = f"{self.sender_name} <{self.sender_email}>"
-                msg['To'] = email
-                
-                msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-                
-                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                    server.starttls()
-                    if self.smtp_username and self.smtp_password:
-                        server.login(self.smtp_username, self.smtp_password)
-                    server.send_message(msg)
-                    
-            return True
-            
+            return self.send_payment_reminders(recipient_emails, overdue_orders)["failed"] == 0
         except Exception as e:
             print(f"Error sending payment reminders: {e}")
             return False
     
+    def send_payment_reminders(
+        self,
+        recipient_emails: List[str],
+        overdue_orders: List[dict]
+    ) -> dict:
+        """Gửi ngay nhắc nhở cho nhiều phụ huynh qua một phiên SMTP
+        
+        Trả về số liệu của lô gửi: size, sent, failed, seconds, messages_per_second,
+        reconnects và errors (danh sách (email, lỗi)).
+        """
+        # Nhóm đơn hàng theo phụ huynh một lần
+        orders_by_email = {}
+        for order in overdue_orders:
+            orders_by_email.setdefault(order.get('parent_email'), []).append(order)
+        
+        messages = [
+            self.build_payment_reminder(email, orders_by_email[email])
+            for email in recipient_emails if orders_by_email.get(email)
+        ]
+        return self.smtp_pool.send_batch(messages)
+    
+    def build_password_reset(self, recipient_email: str, recipient_name: str, reset_url: str) -> MIMEMultipart:
+        """Email đặt lại mật khẩu"""
+        context = {"recipient_name": recipient_name, "reset_url": reset_url, "sender_name": self.sender_name}
+        
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = "Đặt lại mật khẩu"
+        msg['From'] = f"{self.sender_name} <{self.sender_email}>"
+        msg['To'] = recipient_email
+        msg.attach(MIMEText(self.jinja_env.get_template("password_reset.txt").render(context), 'plain', 'utf-8'))
+        msg.attach(MIMEText(self.jinja_env.get_template("password_reset.html").render(context), 'html', 'utf-8'))
+        return msg
+    
     def send_password_reset(self, recipient_email: str, recipient_name: str, reset_url: str) -> bool:
-        """Gửi email đặt lại mật khẩu"""
+        """Gửi ngay email đặt lại mật khẩu (không qua hàng đợi)"""
         try:
-            subject = "Đặt lại mật khẩu"
-            html_content = f"""
-            <p>Xin chào {recipient_name},</p>
-            <p>Bạn đã yêu cầu đặt lại mật khẩu. Vui lòng nhấn vào liên kết dưới đây để đặt lại:</p>
-            <p><a href=\"{reset_url}\">Đặt lại mật khẩu</a></p>
-            <p>Nếu bạn không yêu cầu, vui lòng bỏ qua email này.</p>
-            """.strip()
-            
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{self.sender_name} <{self.sender_email}>"
-            msg['To'] = recipient_email
-            msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-            
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                if self.smtp_username and self.smtp_password:
-                    server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
+            self.smtp_pool.send(self.build_password_reset(recipient_email, recipient_name, reset_url))
             return True
         except Exception as e:
             print(f"Error sending password reset email: {e}")
             return False
             
-    def _ensure_email_templates(self):
-        """Tạo các email template cơ bản"""
+    @staticmethod
+    def _ensure_email_templates():
+        """Tạo các email template cơ bản (HTML và bản text) nếu chưa có"""
         templates = {
             "invoice_notification.html": '''
 <!DOCTYPE html>
@@ -438,12 +481,115 @@ Trân trọng,
     </div>
 </body>
 </html>
+            ''',
+            
+            "password_reset.html": '''
+<p>Xin chào {{ recipient_name }},</p>
+<p>Bạn đã yêu cầu đặt lại mật khẩu. Vui lòng nhấn vào liên kết dưới đây để đặt lại:</p>
+<p><a href="{{ reset_url }}">Đặt lại mật khẩu</a></p>
+<p>Nếu bạn không yêu cầu, vui lòng bỏ qua email này.</p>
+            ''',
+            
+            # Bản text (fallback) của từng email
+            "invoice_notification.txt": '''
+Kính gửi {{ recipient_name }},
+
+Hóa đơn điện tử của bạn đã được phát hành thành công.
+
+Thông tin hóa đơn:
+- Số hóa đơn: {{ invoice_data.invoice_number }}
+- Mã tra cứu: {{ invoice_data.lookup_code or 'N/A' }}
+- Học sinh: {{ invoice_data.student_name or 'N/A' }}
+- Số tiền: {{ "{:,.0f}".format(invoice_data.total_amount or 0) }} VNĐ
+- Nội dung: {{ invoice_data.description or 'N/A' }}
+
+Bạn có thể tra cứu hóa đơn tại: https://tracuuhoadon.gdt.gov.vn
+
+Trân trọng,
+{{ sender_name }}
+            ''',
+            
+            "payment_confirmation.txt": '''
+Kính gửi {{ recipient_name }},
+
+Thanh toán của bạn đã được xử lý thành công.
+
+Thông tin thanh toán:
+- Mã giao dịch: {{ payment_data.payment_code }}
+- Số tiền: {{ "{:,.0f}".format(payment_data.amount or 0) }} VNĐ
+- Học sinh: {{ payment_data.student_name or 'N/A' }}
+- Nội dung: {{ payment_data.description or 'N/A' }}
+- Thời gian: {{ payment_data.paid_at or 'N/A' }}
+
+Hóa đơn điện tử sẽ được gửi trong thời gian sớm nhất.
+
+Trân trọng,
+{{ sender_name }}
+            ''',
+            
+            "payment_reminder.txt": '''
+Kính gửi {{ parent_name }},
+
+Chúng tôi xin thông báo có các khoản học phí sau chưa được thanh toán:
+{% for order in orders %}
+- {{ order.student_name }} ({{ order.class_name }}): {{ order.description }}, {{ "{:,.0f}".format(order.amount) }} VNĐ, hạn {{ order.due_date }}
+{%- endfor %}
+
+Quý phụ huynh vui lòng thanh toán trong thời gian sớm nhất.
+
+Trân trọng,
+{{ sender_name }}
+            ''',
+            
+            "password_reset.txt": '''
+Xin chào {{ recipient_name }},
+
+Bạn đã yêu cầu đặt lại mật khẩu. Mở liên kết dưới đây để đặt lại:
+{{ reset_url }}
+
+Nếu bạn không yêu cầu, vui lòng bỏ qua email này.
             '''
         }
         
-        template_dir = os.path.join(os.path.dirname(__file__), "..", "templates", "email")
         for filename, content in templates.items():
-            file_path = os.path.join(template_dir, filename)
+            file_path = os.path.join(TEMPLATE_DIR, filename)
             if not os.path.exists(file_path):
                 with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content.strip())
\ No newline at end of file
+                    f.write(content.strip())
+
+
+def get_email_templates() -> Environment:
+    """Môi trường Jinja dùng chung trong tiến trình, tạo một lần
+    
+    Lần đầu: ghi các template còn thiếu ra đĩa và biên dịch sẵn toàn bộ; bytecode được lưu
+    vào EMAIL_TEMPLATE_CACHE_DIR để tiến trình sau (worker, lần khởi động lại) không phải
+    biên dịch lại. Sau đó mỗi lần render chỉ còn thay biến.
+    """
+    global _templates
+    if _templates is None:
+        with _lock:
+            if _templates is None:
+                os.makedirs(TEMPLATE_DIR, exist_ok=True)
+                EmailService._ensure_email_templates()
+                env = Environment(
+                    loader=FileSystemLoader(TEMPLATE_DIR),
+                    bytecode_cache=FileSystemBytecodeCache(settings.EMAIL_TEMPLATE_CACHE_DIR or None),
+                    # Không kiểm tra file template trên đĩa mỗi lần render (trừ khi DEBUG)
+                    auto_reload=settings.DEBUG
+                )
+                env.globals["company_name"] = os.getenv("COMPANY_NAME", "Trường Tiểu học ABC")
+                for name in env.list_templates():
+                    env.get_template(name)
+                _templates = env
+    return _templates
+
+
+def get_email_service() -> EmailService:
+    """EmailService dùng chung trong tiến trình (template và pool SMTP đã sẵn sàng)"""
+    global _service
+    if _service is None:
+        service = EmailService()
+        with _lock:
+            if _service is None:
+                _service = service
+    return _service
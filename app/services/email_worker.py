@@ -0,0 +1,64 @@
+"""
+Worker gửi email từ hàng đợi email_outbox
+Dựng email theo loại, gửi qua pool SMTP; lỗi được thử lại với backoff, hết lượt thì FAILED
+
+Mặc định chạy trong tiến trình API (EMAIL_WORKER_ENABLED=true); chạy riêng:
+    python -m app.services.email_worker
+"""
+import json
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.outbox import OutboxWorker
+from app.database import SessionLocal
+from app.models import EmailOutbox, OutboxState
+from app.services.email_service import get_email_service
+
+
+class EmailWorker(OutboxWorker):
+    """Gửi các email đã được ghi vào hàng đợi"""
+
+    model = EmailOutbox
+    name = "email"
+
+    def process(self, db: Session, item: EmailOutbox) -> Optional[Callable[[], None]]:
+        email_service = get_email_service()
+        message = email_service.build_message(item.kind, json.loads(item.payload))
+        email_service.smtp_pool.send(message)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Số liệu worker, độ sâu hàng đợi và các email thất bại gần nhất (dead letter)"""
+        stats = super().stats()
+        db = self.session_factory()
+        try:
+            failed = db.execute(
+                select(EmailOutbox.id, EmailOutbox.kind, EmailOutbox.recipient, EmailOutbox.attempts, EmailOutbox.last_error)
+                .where(EmailOutbox.state == OutboxState.FAILED)
+                .order_by(EmailOutbox.id.desc())
+                .limit(10)
+            ).mappings().all()
+        finally:
+            db.close()
+        stats["recent_failures"] = [dict(row) for row in failed]
+        return stats
+
+
+# Global email worker instance
+email_worker = EmailWorker(
+    SessionLocal,
+    poll_seconds=settings.EMAIL_WORKER_POLL_SECONDS,
+    batch_size=settings.EMAIL_WORKER_BATCH_SIZE,
+    max_attempts=settings.EMAIL_MAX_ATTEMPTS,
+    retry_base_seconds=settings.EMAIL_RETRY_BASE_SECONDS,
+    lease_seconds=settings.EMAIL_LEASE_SECONDS,
+    concurrency=settings.EMAIL_WORKER_CONCURRENCY
+)
+
+
+if __name__ == "__main__":
+    print("Email worker đang chạy (Ctrl+C để dừng)")
+    email_worker.serve()
@@ -13,6 +13,7 @@ import hashlib
 from sqlalchemy.orm import Session
 from app.models import Invoice, Order, User, Student, OrderStatus
 from jinja2 import Environment, FileSystemLoader
+from app.services.rollup_service import RollupService
 
 class EInvoiceProvider:
     """Service tích hợp với nhà cung cấp HĐĐT"""
@@ -171,6 +172,7 @@ class InvoiceService:
         
         # Cập nhật order status
         order.status = OrderStatus.INVOICED
+        RollupService(self.db).record_order_invoiced(invoice, student.class_name)
         
         self.db.commit()
         self.db.refresh(invoice)
@@ -194,7 +196,8 @@ class InvoiceService:
             "xml_path": xml_path
         }
 
-    def resend_invoice_email(self, invoice_id: int) -> bool:
+    def queue_invoice_email(self, invoice_id: int) -> bool:
+        """Xếp email hóa đơn vào hàng đợi gửi cho phụ huynh (worker gửi, không chờ SMTP)"""
         invoice = self.db.query(Invoice).filter(Invoice.id == invoice_id).first()
         if not invoice:
             raise ValueError("Không tìm thấy hóa đơn")
@@ -204,9 +207,10 @@ class InvoiceService:
         parent = self.db.query(User).filter(User.id == student.user_id).first() if student else None
         if not (order and student and parent):
             raise ValueError("Thiếu thông tin để gửi email hóa đơn")
-        from app.services.email_service import EmailService
-        email_service = EmailService()
-        return email_service.send_invoice_email(
+        from app.services.email_service import get_email_service
+        get_email_service().queue_email(
+            self.db,
+            "invoice",
             recipient_email=parent.email,
             recipient_name=parent.name,
             invoice_data={
@@ -221,6 +225,8 @@ class InvoiceService:
             pdf_path=invoice.pdf_path,
             xml_path=invoice.xml_path
         )
+        self.db.commit()
+        return True
 
     def rerender_pdf(self, invoice_id: int) -> str:
         invoice = self.db.query(Invoice).filter(Invoice.id == invoice_id).first()
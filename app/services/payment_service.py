@@ -8,11 +8,26 @@ import io
 import base64
 import uuid
 import requests
+import enum
+import json
 from typing import Dict, Optional
 from decimal import Decimal
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.models import Payment, Order, PaymentStatus, OrderStatus
-from datetime import datetime
+from app.core.config import settings
+from app.core.outbox import utcnow
+from app.core.qr_cache import qr_image_cache
+from app.models import Payment, Order, Student, User, PaymentStatus, OrderStatus, OutboxState, WebhookEvent
+from app.services.rollup_service import RollupService
+from datetime import datetime, timedelta
+
+class WebhookResult(str, enum.Enum):
+    """Kết quả tiếp nhận một webhook thanh toán"""
+    QUEUED = "queued"         # Đã ghi vào outbox, worker sẽ xử lý
+    DUPLICATE = "duplicate"   # Đã tiếp nhận trước đó (cổng thanh toán gửi lại)
+    REJECTED = "rejected"     # Thiếu dữ liệu
 
 class PaymentGatewayService:
     """Service tích hợp với cổng thanh toán"""
@@ -52,14 +67,21 @@ class PaymentGatewayService:
             "success": True,
             "transaction_id": transaction_id,
             "qr_data": f"VIETQR|{self.merchant_id}|{transaction_id}|{amount}|VND|{order.description[:50]}",
-            "deep_link": f"vnpay://payment?amount={amount}&desc={order.description}",
-            "expires_at": datetime.now().isoformat()
+            "deep_link": self.deep_link(order, amount),
+            "expires_at": (datetime.now() + timedelta(minutes=settings.PAYMENT_QR_TTL_MINUTES)).isoformat()
         }
         
         return mock_response
         
+    def deep_link(self, order: Order, amount: Decimal) -> str:
+        return f"vnpay://payment?amount={amount}&desc={order.description}"
+        
     def generate_qr_image(self, qr_data: str) -> str:
-        """Tạo QR code image từ data"""
+        """QR code image (PNG base64) từ data; ảnh đã tạo được lấy lại từ qr_image_cache"""
+        return qr_image_cache.get_or_render(qr_data, self.render_qr_png)
+        
+    def render_qr_png(self, qr_data: str) -> bytes:
+        """Vẽ QR code thành PNG"""
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_M,
@@ -69,11 +91,10 @@ class PaymentGatewayService:
         qr.add_data(qr_data)
         qr.make(fit=True)
         
-        # Tạo image và convert sang base64
         img = qr.make_image(fill_color="black", back_color="white")
         buffer = io.BytesIO()
         img.save(buffer, format='PNG')
-        return base64.b64encode(buffer.getvalue()).decode()
+        return buffer.getvalue()
         
     def verify_webhook(self, webhook_data: Dict, signature: str) -> bool:
         """Xác minh webhook signature từ cổng thanh toán"""
@@ -97,6 +118,13 @@ class PaymentService:
         order = self.db.query(Order).filter(Order.id == order_id).first()
         if not order:
             raise ValueError("Không tìm thấy đơn hàng")
+        
+        # Phụ huynh mở lại trang thanh toán: dùng lại giao dịch QR đang chờ thay vì tạo giao dịch mới
+        reusable = self.find_reusable_payment(order_id, amount)
+        if reusable:
+            payment, expires_at = reusable
+            qr_image = self.gateway.generate_qr_image(payment.qr_code_data)
+            return self._payment_request_response(payment, order, amount, qr_image, expires_at)
             
         # Gọi API cổng thanh toán
         gateway_response = self.gateway.create_qr_payment(order, amount)
@@ -108,7 +136,46 @@ class PaymentService:
         qr_image = self.gateway.generate_qr_image(gateway_response["qr_data"])
         
         # Lưu payment record
-        payment = Payment(
+        payment = self._new_payment(order_id, amount, gateway_response)
+        self.db.add(payment)
+        self.db.commit()
+        self.db.refresh(payment)
+        
+        # Cùng đồng hồ database với giao dịch được dùng lại (find_reusable_payment)
+        return self._payment_request_response(payment, order, amount, qr_image, self.qr_expires_at(payment))
+        
+    async def create_payment_request_async(self, order_id: int, amount: Decimal) -> Dict:
+        """Bản async của create_payment_request (self.db là AsyncSession)
+        
+        Gọi cổng thanh toán và vẽ QR trong threadpool để không chặn event loop.
+        """
+        order = await self.db.get(Order, order_id)
+        if not order:
+            raise ValueError("Không tìm thấy đơn hàng")
+        
+        reusable = self._reusable((await self.db.execute(self._reusable_payment_statement(order_id, amount))).first())
+        if reusable:
+            payment, expires_at = reusable
+            qr_image = await run_in_threadpool(self.gateway.generate_qr_image, payment.qr_code_data)
+            return self._payment_request_response(payment, order, amount, qr_image, expires_at)
+            
+        gateway_response = await run_in_threadpool(self.gateway.create_qr_payment, order, amount)
+        
+        if not gateway_response.get("success"):
+            raise ValueError("Không thể tạo thanh toán")
+            
+        qr_image = await run_in_threadpool(self.gateway.generate_qr_image, gateway_response["qr_data"])
+        
+        payment = self._new_payment(order_id, amount, gateway_response)
+        self.db.add(payment)
+        await self.db.commit()
+        await self.db.refresh(payment)
+        
+        return self._payment_request_response(payment, order, amount, qr_image, self.qr_expires_at(payment))
+        
+    @staticmethod
+    def _new_payment(order_id: int, amount: Decimal, gateway_response: Dict) -> Payment:
+        return Payment(
             order_id=order_id,
             payment_code=gateway_response["transaction_id"],
             gateway_txn_id=gateway_response["transaction_id"],
@@ -118,49 +185,226 @@ class PaymentService:
             status=PaymentStatus.PENDING
         )
         
-        self.db.add(payment)
-        self.db.commit()
-        self.db.refresh(payment)
-        
+    def _payment_request_response(self, payment: Payment, order: Order, amount: Decimal, qr_image: str, expires_at: datetime) -> Dict:
         return {
             "payment_id": payment.id,
             "payment_code": payment.payment_code,
             "qr_code_image": f"data:image/png;base64,{qr_image}",
-            "qr_data": gateway_response["qr_data"],
-            "deep_link": gateway_response.get("deep_link"),
+            "qr_data": payment.qr_code_data,
+            "deep_link": self.gateway.deep_link(order, amount),
             "amount": amount,
             "order_code": order.order_code,
-            "expires_at": gateway_response.get("expires_at")
+            "expires_at": expires_at.isoformat()
         }
         
-    def process_webhook(self, webhook_data: Dict) -> bool:
-        """Xử lý webhook từ cổng thanh toán"""
+    def find_reusable_payment(self, order_id: int, amount: Decimal):
+        """Giao dịch QR PENDING mới nhất của đơn với cùng số tiền, còn trong PAYMENT_QR_TTL_MINUTES
+        
+        Trả về (payment, thời điểm hết hạn theo đồng hồ database) hoặc None. Tuổi giao dịch được
+        tính bằng giờ của database (created_at do database ghi) để không lệch múi giờ.
+        """
+        return self._reusable(self.db.execute(self._reusable_payment_statement(order_id, amount)).first())
+        
+    @staticmethod
+    def _reusable_payment_statement(order_id: int, amount: Decimal):
+        return (
+            select(Payment, func.now())
+            .where(
+                Payment.order_id == order_id,
+                Payment.amount == amount,
+                Payment.status == PaymentStatus.PENDING,
+                Payment.payment_method == "QR_CODE",
+                Payment.qr_code_data.isnot(None)
+            )
+            .order_by(Payment.id.desc())
+            .limit(1)
+        )
+        
+    @classmethod
+    def _reusable(cls, row):
+        if row is None:
+            return None
+        payment, db_now = row
+        if payment.created_at is None or db_now is None:
+            return None
+        expires_at = cls.qr_expires_at(payment)
+        if db_now.replace(tzinfo=None) >= expires_at:
+            return None
+        return payment, expires_at
+        
+    @staticmethod
+    def qr_expires_at(payment: Payment) -> datetime:
+        """Thời điểm QR hết hạn: created_at (giờ database) + PAYMENT_QR_TTL_MINUTES"""
+        return payment.created_at.replace(tzinfo=None) + timedelta(minutes=settings.PAYMENT_QR_TTL_MINUTES)
+        
+    def enqueue_webhook(self, webhook_data: Dict) -> "WebhookResult":
+        """Ghi webhook vào outbox webhook_events, mỗi (transaction_id, status) một lần
+
+        Không đọc/ghi payment hay order nên trả lời cổng thanh toán ngay; worker
+        (app.services.webhook_worker) áp dụng sự kiện sau. Cổng thanh toán gửi lại
+        cùng sự kiện chỉ tốn một lần tra index unique; các lần gửi đồng thời được
+        chặn bởi ràng buộc unique. Sự kiện đã hết số lần thử (FAILED) được xếp hàng lại.
+        """
         transaction_id = webhook_data.get("transaction_id")
         status = webhook_data.get("status")
         
         if not transaction_id or not status:
-            return False
-            
-        # Tìm payment record
+            return WebhookResult.REJECTED
+        
+        now = utcnow()
+        existing = self.db.execute(self._webhook_event_statement(transaction_id, status)).first()
+        if existing:
+            if existing.state != OutboxState.FAILED:
+                return WebhookResult.DUPLICATE
+            self.db.execute(self._requeue_statement(existing.id, now))
+            self.db.commit()
+            return WebhookResult.QUEUED
+        
+        self.db.add(self._new_webhook_event(webhook_data, now))
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            return WebhookResult.DUPLICATE
+        return WebhookResult.QUEUED
+        
+    async def enqueue_webhook_async(self, webhook_data: Dict) -> "WebhookResult":
+        """Bản async của enqueue_webhook (self.db là AsyncSession)"""
+        transaction_id = webhook_data.get("transaction_id")
+        status = webhook_data.get("status")
+        
+        if not transaction_id or not status:
+            return WebhookResult.REJECTED
+        
+        now = utcnow()
+        existing = (await self.db.execute(self._webhook_event_statement(transaction_id, status))).first()
+        if existing:
+            if existing.state != OutboxState.FAILED:
+                return WebhookResult.DUPLICATE
+            await self.db.execute(self._requeue_statement(existing.id, now))
+            await self.db.commit()
+            return WebhookResult.QUEUED
+        
+        self.db.add(self._new_webhook_event(webhook_data, now))
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            await self.db.rollback()
+            return WebhookResult.DUPLICATE
+        return WebhookResult.QUEUED
+        
+    @staticmethod
+    def _webhook_event_statement(transaction_id: str, status: str):
+        return select(WebhookEvent.id, WebhookEvent.state).where(
+            WebhookEvent.transaction_id == transaction_id,
+            WebhookEvent.status == status
+        )
+        
+    @staticmethod
+    def _requeue_statement(event_id: int, now: datetime):
+        return update(WebhookEvent).where(
+            WebhookEvent.id == event_id,
+            WebhookEvent.state == OutboxState.FAILED
+        ).values(state=OutboxState.PENDING, attempts=0, available_at=now).execution_options(synchronize_session=False)
+        
+    @staticmethod
+    def _new_webhook_event(webhook_data: Dict, now: datetime) -> WebhookEvent:
+        return WebhookEvent(
+            transaction_id=webhook_data["transaction_id"],
+            status=webhook_data["status"],
+            payload=json.dumps(webhook_data, ensure_ascii=False, default=str),
+            state=OutboxState.PENDING,
+            available_at=now,
+            created_at=now
+        )
+        
+    def apply_webhook(self, transaction_id: str, status: str) -> Payment:
+        """Cập nhật payment/order theo một sự kiện webhook (không commit)
+
+        Khóa dòng payment/order (SELECT ... FOR UPDATE nếu dialect hỗ trợ) để không
+        chồng lên thao tác xác nhận/hoàn tiền thủ công (cũng khóa theo cùng thứ tự qua
+        lock_payment). Raise LookupError nếu không tìm thấy giao dịch (worker sẽ thử lại sau).
+        """
         payment = self.db.query(Payment).filter(
             Payment.payment_code == transaction_id
-        ).first()
+        ).with_for_update().first()
         
         if not payment:
-            return False
+            raise LookupError(f"Không tìm thấy giao dịch {transaction_id}")
             
         # Cập nhật trạng thái
         if status == "success":
-            payment.status = PaymentStatus.SUCCESS
-            payment.paid_at = datetime.now()
+            self.confirm_payment(payment)
+        elif status == "failed":
+            self.reverse_payment(payment)
             
-            # Cập nhật order status
-            order = self.db.query(Order).filter(Order.id == payment.order_id).first()
-            if order:
+        return payment
+        
+    def lock_payment(self, payment_id: int) -> Optional[Payment]:
+        """Khóa dòng payment (SELECT ... FOR UPDATE) trước khi xác nhận/hoàn tiền thủ công
+        
+        Trạng thái phải được kiểm tra trên bản đã khóa: webhook worker có thể vừa đổi nó.
+        """
+        return self.db.query(Payment).filter(Payment.id == payment_id).with_for_update().first()
+        
+    def _lock_order(self, payment: Payment) -> Optional[Order]:
+        return self.db.query(Order).filter(Order.id == payment.order_id).with_for_update().first()
+        
+    def confirm_payment(self, payment: Payment) -> None:
+        """Đánh dấu payment (đã khóa) thành công, chuyển đơn sang PAID và cập nhật bảng tổng hợp (không commit)"""
+        already_success = payment.status == PaymentStatus.SUCCESS
+        payment.status = PaymentStatus.SUCCESS
+        if not already_success:
+            payment.paid_at = datetime.now()
+        
+        # Cập nhật order status
+        order = self._lock_order(payment)
+        if order:
+            order_became_paid = order.status == OrderStatus.PENDING
+            if order_became_paid:
                 order.status = OrderStatus.PAID
-                
-        elif status == "failed":
-            payment.status = PaymentStatus.FAILED
             
-        self.db.commit()
-        return True
\ No newline at end of file
+            # Cập nhật bảng tổng hợp (chỉ lần đầu giao dịch thành công)
+            if not already_success:
+                RollupService(self.db).record_payment_success(
+                    payment, order.student.class_name, order_became_paid
+                )
+                
+    def reverse_payment(self, payment: Payment) -> None:
+        """Chuyển payment (đã khóa) sang FAILED (không commit)
+        
+        Nếu payment đang thành công (hoàn tiền, hoặc "failed" đến sau "success"): trừ lại bảng
+        tổng hợp và đưa đơn về PENDING khi không còn giao dịch thành công nào khác.
+        """
+        if payment.status == PaymentStatus.SUCCESS:
+            order = self._lock_order(payment)
+            if order:
+                RollupService(self.db).record_payment_reversed(payment, order.student.class_name)
+                still_paid = self.db.query(Payment.id).filter(
+                    Payment.order_id == order.id,
+                    Payment.id != payment.id,
+                    Payment.status == PaymentStatus.SUCCESS
+                ).first()
+                if order.status == OrderStatus.PAID and not still_paid:
+                    order.status = OrderStatus.PENDING
+        payment.status = PaymentStatus.FAILED
+        
+    def payment_confirmation(self, payment: Payment) -> Optional[Dict]:
+        """Dữ liệu email xác nhận thanh toán gửi phụ huynh (None nếu thiếu thông tin)"""
+        row = self.db.query(Order, Student, User).join(
+            Student, Student.id == Order.student_id
+        ).join(User, User.id == Student.user_id).filter(Order.id == payment.order_id).first()
+        if not row:
+            return None
+        order, student, parent = row
+        return {
+            'recipient_email': parent.email,
+            'recipient_name': parent.name,
+            'payment_data': {
+                'payment_code': payment.payment_code,
+                'amount': payment.amount,
+                'student_name': student.name,
+                'description': order.description,
+                'paid_at': payment.paid_at.strftime('%d/%m/%Y %H:%M') if payment.paid_at else None
+            }
+        }
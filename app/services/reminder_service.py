@@ -0,0 +1,411 @@
+"""
+Engine gửi nhắc nhở thanh toán quá hạn chạy nền
+Đọc đơn quá hạn theo luồng (yield_per, sắp theo phụ huynh) nên chỉ giữ đơn của phụ huynh đang
+gom; email tổng hợp của từng phụ huynh được chia lô vào bộ đệm có giới hạn để nhóm worker xếp
+vào hàng đợi email (email_outbox). Phụ huynh đã được nhắc trong REMINDER_DEDUP_HOURS giờ được bỏ qua.
+"""
+import os
+import queue
+import socket
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.outbox import utcnow
+from app.database import SessionLocal
+from app.models import (
+    EmailOutbox, JobState, Order, OrderStatus, OutboxState, ReminderJob, ReminderLog, ReminderRecipient,
+    Student, User
+)
+from app.services.email_service import get_email_service
+
+# (id phụ huynh, email phụ huynh, các đơn quá hạn)
+Digest = Tuple[int, str, List[dict]]
+
+_STOP = object()
+
+
+def _overdue(class_name: Optional[str]):
+    condition = and_(Order.status == OrderStatus.PENDING, Order.due_date.isnot(None), Order.due_date < datetime.now())
+    if class_name:
+        condition = and_(condition, Student.class_name == class_name)
+    return condition
+
+
+class ReminderEngine:
+    """Chạy các job nhắc nhở quá hạn trên một luồng nền, lần lượt từng job trong tiến trình.
+
+    Trong một job, luồng đọc gom đơn theo phụ huynh thành lô batch_size email; tối đa
+    buffer_size lô chờ trong bộ đệm (luồng đọc dừng khi đầy) và `workers` luồng xếp
+    email của từng lô vào hàng đợi trong một transaction. Việc gửi SMTP do email worker làm.
+
+    Nhiều tiến trình (uvicorn --workers) có thể chạy job cùng lúc: job được nhận bằng UPDATE
+    có điều kiện (chỉ chạy một lần), và mỗi phụ huynh được nhắc khi job chiếm được dòng
+    reminder_recipients của họ bằng UPDATE có điều kiện, nên không phụ huynh nào bị nhắc hai lần
+    trong cửa sổ chống trùng. Job ghi heartbeat sau mỗi lô; job PENDING/RUNNING của tiến trình
+    đã dừng quá lease_seconds được đánh dấu FAILED (fail_orphans).
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        workers: int = 4,
+        batch_size: int = 100,
+        buffer_size: int = 8,
+        fetch_size: int = 1000,
+        dedup_hours: float = 24,
+        lease_seconds: float = 120
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.fetch_size = fetch_size
+        self.dedup_hours = dedup_hours
+        self.lease_seconds = lease_seconds
+        # Định danh tiến trình trên các job nó tạo/nhận (pid có thể lặp lại sau khi khởi động lại container)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[-100:]
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+    # -- Job -----------------------------------------------------------------
+
+    def submit(self, db: Session, class_name: Optional[str] = None, requested_by: Optional[int] = None) -> int:
+        """Tạo job (commit trong db) và đưa vào hàng chạy nền; trả về id job"""
+        self.fail_orphans(db)
+        job = ReminderJob(
+            class_name=class_name, requested_by=requested_by, state=JobState.PENDING, owner=self.owner, created_at=utcnow()
+        )
+        db.add(job)
+        db.commit()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reminder-job")
+            self._futures = {job_id: f for job_id, f in self._futures.items() if not f.done()}
+            self._futures[job.id] = self._executor.submit(self.run, job.id)
+        return job.id
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> None:
+        """Chờ job đang chạy trong tiến trình này kết thúc (script, kiểm thử)"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+
+    def shutdown(self) -> None:
+        """Bỏ các job chưa chạy và đánh dấu chúng FAILED; job đang chạy được chạy nốt trước khi tiến trình thoát"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures = dict(self._futures)
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        cancelled = [job_id for job_id, future in futures.items() if future.cancelled()]
+        if cancelled:
+            db = self.session_factory()
+            try:
+                self._fail_jobs(db, cancelled, "Bị hủy khi tiến trình dừng")
+            except Exception as e:
+                print(f"reminder engine: could not mark cancelled jobs {cancelled} failed: {e}")
+            finally:
+                db.close()
+
+    def fail_orphans(self, db: Session) -> int:
+        """Đánh dấu FAILED các job PENDING/RUNNING mà tiến trình sở hữu đã dừng; trả về số job
+
+        Tiến trình còn sống luôn có một job với heartbeat trong lease_seconds (job đang chạy ghi
+        sau mỗi lô, job vừa xong giữ heartbeat lúc kết thúc), nên job PENDING đang chờ sau một job
+        dài của tiến trình đó không bị tính là mồ côi. Gọi khi khởi động và mỗi lần tạo job.
+        """
+        cutoff = utcnow() - timedelta(seconds=self.lease_seconds)
+        alive = set(db.scalars(
+            select(ReminderJob.owner).where(ReminderJob.heartbeat_at >= cutoff).distinct()
+        ).all())
+        alive.add(self.owner)
+        orphans = [
+            job_id for job_id, owner in db.execute(
+                select(ReminderJob.id, ReminderJob.owner).where(
+                    ReminderJob.state.in_([JobState.PENDING, JobState.RUNNING]),
+                    ReminderJob.created_at < cutoff
+                )
+            ).all()
+            if owner not in alive
+        ]
+        if orphans:
+            self._fail_jobs(db, orphans, "Tiến trình chạy job đã dừng")
+            print(f"reminder engine: marked orphaned jobs {orphans} failed")
+        return len(orphans)
+
+    def _fail_jobs(self, db: Session, job_ids: List[int], error: str) -> None:
+        db.execute(
+            update(ReminderJob)
+            .where(ReminderJob.id.in_(job_ids), ReminderJob.state.in_([JobState.PENDING, JobState.RUNNING]))
+            .values(state=JobState.FAILED, error=error, finished_at=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    def run(self, job_id: int) -> None:
+        """Chạy một job: đọc theo luồng, gom theo phụ huynh, chia lô cho các worker"""
+        if not self._claim(job_id):
+            return
+        errors: List[str] = []
+        try:
+            class_name = self._start(job_id)
+            buffer: "queue.Queue" = queue.Queue(maxsize=self.buffer_size)
+            threads = [
+                threading.Thread(target=self._dispatch_loop, args=(job_id, buffer, errors), name=f"reminder-{job_id}-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                for batch in self.digests(class_name):
+                    buffer.put(batch)
+            except Exception as e:
+                errors.append(str(e))
+            finally:
+                for _ in threads:
+                    buffer.put(_STOP)
+                for thread in threads:
+                    thread.join()
+        except Exception as e:
+            errors.append(str(e))
+        self._finish(job_id, errors)
+
+    def _claim(self, job_id: int) -> bool:
+        """PENDING -> RUNNING bằng UPDATE có điều kiện: job đã bị nhận hoặc đã FAILED thì không chạy"""
+        db = self.session_factory()
+        try:
+            now = utcnow()
+            result = db.execute(
+                update(ReminderJob)
+                .where(ReminderJob.id == job_id, ReminderJob.state == JobState.PENDING)
+                .values(state=JobState.RUNNING, owner=self.owner, started_at=now, heartbeat_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    def _start(self, job_id: int) -> Optional[str]:
+        db = self.session_factory()
+        try:
+            job = db.get(ReminderJob, job_id)
+            # Tổng số phụ huynh/đơn để tính phần trăm tiến độ
+            parents_total, orders_total = db.execute(
+                select(func.count(func.distinct(User.id)), func.count(Order.id))
+                .select_from(Order)
+                .join(Student, Order.student_id == Student.id)
+                .join(User, Student.user_id == User.id)
+                .where(_overdue(job.class_name))
+            ).one()
+            job.heartbeat_at = utcnow()
+            job.parents_total = parents_total
+            job.orders_total = orders_total
+            class_name = job.class_name
+            db.commit()
+            return class_name
+        finally:
+            db.close()
+
+    def _finish(self, job_id: int, errors: List[str]) -> None:
+        db = self.session_factory()
+        try:
+            job = db.get(ReminderJob, job_id)
+            job.state = JobState.FAILED if errors else JobState.DONE
+            job.error = errors[0][:500] if errors else None
+            job.finished_at = job.heartbeat_at = utcnow()
+            db.commit()
+        finally:
+            db.close()
+        if errors:
+            print(f"reminder job #{job_id} failed: {errors[0]}")
+
+    # -- Streaming & dispatch ------------------------------------------------
+
+    def digests(self, class_name: Optional[str] = None) -> Iterator[List[Digest]]:
+        """Các lô email tổng hợp (mỗi phụ huynh một email) đọc theo luồng từ đơn quá hạn"""
+        stmt = (
+            select(User.id, User.email, User.name, Student.name, Student.class_name,
+                   Order.description, Order.amount, Order.due_date)
+            .select_from(Order)
+            .join(Student, Order.student_id == Student.id)
+            .join(User, Student.user_id == User.id)
+            .where(_overdue(class_name))
+            .order_by(User.id, Order.due_date, Order.id)
+        )
+        db = self.session_factory()
+        try:
+            result = db.execute(stmt.execution_options(yield_per=self.fetch_size))
+            batch: List[Digest] = []
+            current: Optional[Digest] = None
+            for parent_id, email, parent_name, student_name, student_class, description, amount, due_date in result:
+                if current is None or current[0] != parent_id:
+                    if current is not None:
+                        batch.append(current)
+                        if len(batch) >= self.batch_size:
+                            yield batch
+                            batch = []
+                    current = (parent_id, email, [])
+                current[2].append({
+                    'parent_email': email,
+                    'parent_name': parent_name,
+                    'student_name': student_name,
+                    'class_name': student_class,
+                    'description': description,
+                    'amount': float(amount),
+                    'due_date': due_date.strftime('%d/%m/%Y')
+                })
+            if current is not None:
+                batch.append(current)
+            if batch:
+                yield batch
+        finally:
+            db.close()
+
+    def _dispatch_loop(self, job_id: int, buffer: "queue.Queue", errors: List[str]) -> None:
+        while True:
+            batch = buffer.get()
+            if batch is _STOP:
+                return
+            try:
+                self.dispatch(job_id, batch)
+            except Exception as e:
+                # Lô lỗi không được tính vào tiến độ; các lô khác vẫn tiếp tục
+                errors.append(str(e))
+                print(f"reminder job #{job_id}: batch of {len(batch)} parents failed: {e}")
+
+    def dispatch(self, job_id: int, batch: List[Digest]) -> int:
+        """Xếp email của một lô vào hàng đợi trong một transaction, bỏ qua phụ huynh vừa được nhắc; trả về số email"""
+        db = self.session_factory()
+        try:
+            now = utcnow()
+            parent_ids = [parent_id for parent_id, _, _ in batch]
+            self._ensure_recipients(db, parent_ids)
+            # Chiếm quyền nhắc: UPDATE khóa các dòng nên job khác đang chạy (kể cả ở tiến trình
+            # khác) chờ transaction này rồi thấy last_reminded_at mới và bỏ qua các phụ huynh đó
+            db.execute(
+                update(ReminderRecipient)
+                .where(
+                    ReminderRecipient.user_id.in_(parent_ids),
+                    or_(
+                        ReminderRecipient.last_reminded_at.is_(None),
+                        ReminderRecipient.last_reminded_at < now - timedelta(hours=self.dedup_hours)
+                    )
+                )
+                .values(last_reminded_at=now, job_id=job_id)
+                .execution_options(synchronize_session=False)
+            )
+            claimed = set(db.scalars(
+                select(ReminderRecipient.user_id).where(
+                    ReminderRecipient.user_id.in_(parent_ids),
+                    ReminderRecipient.job_id == job_id
+                )
+            ).all())
+            email_service = get_email_service()
+            queued = 0
+            for parent_id, email, orders in batch:
+                if parent_id not in claimed:
+                    continue
+                item = email_service.queue_email(db, "payment_reminder", recipient_email=email, orders=orders)
+                db.add(ReminderLog(user_id=parent_id, job_id=job_id, email=item, order_count=len(orders), created_at=now))
+                queued += 1
+            db.execute(
+                update(ReminderJob)
+                .where(ReminderJob.id == job_id)
+                .values(
+                    parents_processed=ReminderJob.parents_processed + len(batch),
+                    parents_queued=ReminderJob.parents_queued + queued,
+                    parents_skipped=ReminderJob.parents_skipped + len(batch) - queued,
+                    heartbeat_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return queued
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _ensure_recipients(self, db: Session, parent_ids: List[int]) -> None:
+        """Tạo dòng reminder_recipients còn thiếu; lần nhắc gần nhất lấy từ reminder_logs"""
+        known = set(db.scalars(
+            select(ReminderRecipient.user_id).where(ReminderRecipient.user_id.in_(parent_ids))
+        ).all())
+        missing = [parent_id for parent_id in parent_ids if parent_id not in known]
+        if not missing:
+            return
+        last_reminded = dict(db.execute(
+            select(ReminderLog.user_id, func.max(ReminderLog.created_at))
+            .where(ReminderLog.user_id.in_(missing))
+            .group_by(ReminderLog.user_id)
+        ).all())
+        try:
+            with db.begin_nested():
+                db.add_all([ReminderRecipient(user_id=p, last_reminded_at=last_reminded.get(p)) for p in missing])
+        except IntegrityError:
+            # Job khác vừa tạo một số dòng: tạo từng dòng, bỏ qua dòng đã có
+            for parent_id in missing:
+                try:
+                    with db.begin_nested():
+                        db.add(ReminderRecipient(user_id=parent_id, last_reminded_at=last_reminded.get(parent_id)))
+                except IntegrityError:
+                    pass
+
+    # -- Progress ------------------------------------------------------------
+
+    def progress(self, db: Session, job_id: int) -> Optional[Dict[str, Any]]:
+        """Tiến độ job và trạng thái gửi các email của job; None nếu không có job"""
+        job = db.get(ReminderJob, job_id)
+        if job is None:
+            return None
+        emails = dict(db.execute(
+            select(EmailOutbox.state, func.count())
+            .join(ReminderLog, ReminderLog.email_id == EmailOutbox.id)
+            .where(ReminderLog.job_id == job_id)
+            .group_by(EmailOutbox.state)
+        ).all())
+        if job.parents_total:
+            percent = round(job.parents_processed * 100 / job.parents_total, 1)
+        else:
+            percent = 100.0 if job.state == JobState.DONE else 0.0
+        return {
+            "job_id": job.id,
+            "state": job.state.value,
+            "class_name": job.class_name,
+            "parents_total": job.parents_total,
+            "parents_processed": job.parents_processed,
+            "parents_queued": job.parents_queued,
+            "parents_skipped": job.parents_skipped,
+            "orders_total": job.orders_total,
+            "progress_percent": percent,
+            "emails": {state.value: emails.get(state, 0) for state in OutboxState},
+            "error": job.error,
+            "created_at": job.created_at.isoformat(),
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
+
+
+# Global reminder engine instance
+reminder_engine = ReminderEngine(
+    SessionLocal,
+    workers=settings.REMINDER_WORKERS,
+    batch_size=settings.REMINDER_BATCH_SIZE,
+    buffer_size=settings.REMINDER_BUFFER_SIZE,
+    fetch_size=settings.REMINDER_FETCH_SIZE,
+    dedup_hours=settings.REMINDER_DEDUP_HOURS,
+    lease_seconds=settings.REMINDER_JOB_LEASE_SECONDS
+)
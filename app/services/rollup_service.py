@@ -0,0 +1,262 @@
+"""
+Service duy trì bảng tổng hợp daily_rollups
+Cập nhật tăng dần khi có đơn hàng/thanh toán/hóa đơn mới, và dựng lại toàn bộ khi cần backfill
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_
+from sqlalchemy.exc import IntegrityError
+from app.models import (
+    Student, Order, Payment, Invoice, DailyRollup,
+    OrderStatus, PaymentStatus
+)
+from app.services.dashboard_aggregates import day_key
+
+
+class RollupService:
+    """Service ghi nhận sự kiện vào daily_rollups.
+
+    Các hàm record_* chỉ flush vào session hiện tại, không commit:
+    số liệu tổng hợp được commit cùng transaction với thay đổi nghiệp vụ.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record_order_created(self, order: Order, class_name: str, day: Optional[date] = None):
+        """Ghi nhận một đơn hàng mới (theo ngày created_at do database ghi, giống rebuild())"""
+        self._bump(day or self._stored_date(order, 'created_at'), class_name, OrderStatus.PENDING, orders=1)
+
+    def record_orders_created(self, orders_by_class: Dict[str, List[Order]]):
+        """Ghi nhận nhiều đơn hàng mới (tạo hàng loạt), mỗi (ngày, lớp) một lần cập nhật"""
+        orders = [order for class_orders in orders_by_class.values() for order in class_orders]
+        if not orders:
+            return
+        self.db.flush()
+        created = dict(self.db.query(Order.id, Order.created_at).filter(
+            Order.id.in_([order.id for order in orders])
+        ))
+        counts: Dict[Tuple[date, str], int] = {}
+        for class_name, class_orders in orders_by_class.items():
+            for order in class_orders:
+                key = (self._date_of(created[order.id]), class_name)
+                counts[key] = counts.get(key, 0) + 1
+        for (day, class_name), count in counts.items():
+            self._bump(day, class_name, OrderStatus.PENDING, orders=count)
+
+    def record_payment_success(
+        self,
+        payment: Payment,
+        class_name: str,
+        order_became_paid: bool,
+        day: Optional[date] = None
+    ):
+        """Ghi nhận giao dịch thành công (và đơn hàng chuyển sang PAID nếu có)"""
+        self._bump(
+            day or self._date_of(payment.paid_at),
+            class_name,
+            OrderStatus.PAID,
+            revenue=payment.amount,
+            payments=1,
+            orders=1 if order_became_paid else 0
+        )
+
+    def record_payment_reversed(self, payment: Payment, class_name: str):
+        """Trừ lại doanh thu khi giao dịch thành công bị hoàn tiền hoặc chuyển sang thất bại
+
+        Gọi trước khi đổi trạng thái payment. Nếu đây là giao dịch thành công sớm nhất của đơn,
+        đơn được tính sang ngày của giao dịch thành công kế tiếp (hoặc trừ đi nếu không còn),
+        giống cách rebuild() tính ngày đơn chuyển sang đã thanh toán.
+        """
+        day = self._date_of(payment.paid_at)
+        self._bump(
+            day,
+            class_name,
+            OrderStatus.PAID,
+            revenue=-Decimal(str(payment.amount)),
+            payments=-1
+        )
+
+        other_paid = self.db.query(Payment.paid_at).filter(
+            Payment.order_id == payment.order_id,
+            Payment.id != payment.id,
+            Payment.status == PaymentStatus.SUCCESS,
+            Payment.paid_at != None
+        ).order_by(Payment.paid_at).first()
+        if other_paid is None:
+            self._bump(day, class_name, OrderStatus.PAID, orders=-1)
+        elif payment.paid_at is not None and other_paid.paid_at > payment.paid_at:
+            next_day = self._date_of(other_paid.paid_at)
+            if next_day != day:
+                self._bump(day, class_name, OrderStatus.PAID, orders=-1)
+                self._bump(next_day, class_name, OrderStatus.PAID, orders=1)
+
+    def record_order_invoiced(self, invoice: Invoice, class_name: str, day: Optional[date] = None):
+        """Ghi nhận đơn hàng được phát hành hóa đơn (theo ngày issued_at, giống rebuild())"""
+        self._bump(day or self._stored_date(invoice, 'issued_at'), class_name, OrderStatus.INVOICED, orders=1)
+
+    def rebuild(self, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """Dựng lại daily_rollups từ dữ liệu gốc (backfill). Trả về số dòng đã ghi."""
+        totals: Dict[Tuple[date, str, OrderStatus], Dict] = {}
+
+        def add(day_value, class_name, status, revenue=0, payments=0, orders=0):
+            key = (date.fromisoformat(day_key(day_value)), class_name, status)
+            row = totals.setdefault(key, {'revenue': Decimal('0'), 'payments': 0, 'orders': 0})
+            row['revenue'] += Decimal(str(revenue or 0))
+            row['payments'] += int(payments or 0)
+            row['orders'] += int(orders or 0)
+
+        # Đơn hàng được tạo theo ngày
+        created_day = func.date(Order.created_at)
+        query = self.db.query(
+            created_day.label('day'),
+            Student.class_name,
+            func.count(Order.id).label('orders')
+        ).join(Student, Order.student_id == Student.id)
+        query = self._in_range(query, Order.created_at, start, end)
+        for row in query.group_by(created_day, Student.class_name):
+            add(row.day, row.class_name, OrderStatus.PENDING, orders=row.orders)
+
+        # Doanh thu theo ngày thanh toán
+        paid_day = func.date(Payment.paid_at)
+        query = self.db.query(
+            paid_day.label('day'),
+            Student.class_name,
+            func.sum(Payment.amount).label('revenue'),
+            func.count(Payment.id).label('payments')
+        ).join(Order, Payment.order_id == Order.id).join(
+            Student, Order.student_id == Student.id
+        ).filter(
+            and_(Payment.status == PaymentStatus.SUCCESS, Payment.paid_at != None)
+        )
+        query = self._in_range(query, Payment.paid_at, start, end)
+        for row in query.group_by(paid_day, Student.class_name):
+            add(row.day, row.class_name, OrderStatus.PAID, revenue=row.revenue, payments=row.payments)
+
+        # Đơn hàng chuyển sang đã thanh toán: ngày của giao dịch thành công đầu tiên
+        first_paid = self.db.query(
+            Payment.order_id.label('order_id'),
+            func.min(Payment.paid_at).label('paid_at')
+        ).filter(
+            and_(Payment.status == PaymentStatus.SUCCESS, Payment.paid_at != None)
+        ).group_by(Payment.order_id).subquery()
+        first_paid_day = func.date(first_paid.c.paid_at)
+        query = self.db.query(
+            first_paid_day.label('day'),
+            Student.class_name,
+            func.count(Order.id).label('orders')
+        ).join(first_paid, first_paid.c.order_id == Order.id).join(
+            Student, Order.student_id == Student.id
+        ).filter(
+            Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
+        )
+        query = self._in_range(query, first_paid.c.paid_at, start, end)
+        for row in query.group_by(first_paid_day, Student.class_name):
+            add(row.day, row.class_name, OrderStatus.PAID, orders=row.orders)
+
+        # Hóa đơn được phát hành theo ngày
+        issued_day = func.date(Invoice.issued_at)
+        query = self.db.query(
+            issued_day.label('day'),
+            Student.class_name,
+            func.count(Invoice.id).label('orders')
+        ).join(Order, Invoice.order_id == Order.id).join(
+            Student, Order.student_id == Student.id
+        )
+        query = self._in_range(query, Invoice.issued_at, start, end)
+        for row in query.group_by(issued_day, Student.class_name):
+            add(row.day, row.class_name, OrderStatus.INVOICED, orders=row.orders)
+
+        # Thay thế các dòng cũ trong khoảng thời gian
+        delete_query = self.db.query(DailyRollup)
+        if start:
+            delete_query = delete_query.filter(DailyRollup.day >= start)
+        if end:
+            delete_query = delete_query.filter(DailyRollup.day <= end)
+        delete_query.delete(synchronize_session=False)
+
+        self.db.bulk_insert_mappings(DailyRollup, [
+            {
+                'day': day_value,
+                'class_name': class_name,
+                'status': status,
+                'revenue': data['revenue'],
+                'payment_count': data['payments'],
+                'order_count': data['orders']
+            }
+            for (day_value, class_name, status), data in totals.items()
+        ])
+        self.db.commit()
+        return len(totals)
+
+    def ensure_backfilled(self) -> bool:
+        """Dựng bảng tổng hợp lần đầu nếu bảng rỗng nhưng đã có dữ liệu"""
+        if self.db.query(DailyRollup.id).first() is not None:
+            return False
+        if self.db.query(Order.id).first() is None:
+            return False
+        self.rebuild()
+        return True
+
+    def _bump(
+        self,
+        day: date,
+        class_name: str,
+        status: OrderStatus,
+        revenue=0,
+        payments: int = 0,
+        orders: int = 0
+    ):
+        """Cộng dồn vào dòng (day, class_name, status), tạo mới nếu chưa có"""
+        revenue = Decimal(str(revenue or 0))
+        filters = and_(
+            DailyRollup.day == day,
+            DailyRollup.class_name == class_name,
+            DailyRollup.status == status
+        )
+        increments = {
+            DailyRollup.revenue: DailyRollup.revenue + revenue,
+            DailyRollup.payment_count: DailyRollup.payment_count + payments,
+            DailyRollup.order_count: DailyRollup.order_count + orders
+        }
+
+        # UPDATE ... SET col = col + x khóa dòng nên an toàn khi ghi đồng thời
+        if self.db.query(DailyRollup).filter(filters).update(increments, synchronize_session=False):
+            return
+        try:
+            with self.db.begin_nested():
+                self.db.add(DailyRollup(
+                    day=day,
+                    class_name=class_name,
+                    status=status,
+                    revenue=revenue,
+                    payment_count=payments,
+                    order_count=orders
+                ))
+        except IntegrityError:
+            # Request khác vừa tạo dòng này, cộng dồn vào dòng đó
+            self.db.query(DailyRollup).filter(filters).update(increments, synchronize_session=False)
+
+    def _stored_date(self, instance, column: str) -> date:
+        """Ngày của cột thời gian do database ghi (server_default): flush rồi đọc lại nếu chưa có"""
+        if getattr(instance, column) is None:
+            self.db.flush()
+        return self._date_of(getattr(instance, column))
+
+    @staticmethod
+    def _date_of(value) -> date:
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return datetime.now().date()
+
+    @staticmethod
+    def _in_range(query, column, start: Optional[date], end: Optional[date]):
+        if start:
+            query = query.filter(column >= datetime.combine(start, time.min))
+        if end:
+            query = query.filter(column < datetime.combine(end + timedelta(days=1), time.min))
+        return query
@@ -0,0 +1,52 @@
+"""
+Worker xử lý webhook thanh toán từ outbox webhook_events
+Cập nhật payment/order, bảng tổng hợp và xếp email xác nhận cho phụ huynh vào hàng đợi
+
+Mặc định chạy trong tiến trình API (WEBHOOK_WORKER_ENABLED=true); chạy riêng:
+    python -m app.services.webhook_worker
+"""
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.outbox import OutboxWorker
+from app.database import SessionLocal
+from app.models import WebhookEvent
+from app.services.email_service import get_email_service
+from app.services.payment_service import PaymentService
+
+
+class WebhookWorker(OutboxWorker):
+    """Áp dụng các sự kiện webhook đã được endpoint ghi vào outbox"""
+
+    model = WebhookEvent
+    name = "webhook"
+
+    def process(self, db: Session, event: WebhookEvent) -> Optional[Callable[[], None]]:
+        payment_service = PaymentService(db)
+        payment = payment_service.apply_webhook(event.transaction_id, event.status)
+        event.payment_id = payment.id
+
+        if event.status == "success":
+            # Email vào hàng đợi cùng transaction: chỉ gửi khi sự kiện đã được áp dụng
+            confirmation = payment_service.payment_confirmation(payment)
+            if confirmation:
+                get_email_service().queue_email(db, "payment_confirmation", **confirmation)
+        return None
+
+
+# Global webhook worker instance
+webhook_worker = WebhookWorker(
+    SessionLocal,
+    poll_seconds=settings.WEBHOOK_WORKER_POLL_SECONDS,
+    batch_size=settings.WEBHOOK_WORKER_BATCH_SIZE,
+    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+    retry_base_seconds=settings.WEBHOOK_RETRY_BASE_SECONDS,
+    lease_seconds=settings.WEBHOOK_LEASE_SECONDS
+)
+
+
+if __name__ == "__main__":
+    print("Webhook worker đang chạy (Ctrl+C để dừng)")
+    webhook_worker.serve()
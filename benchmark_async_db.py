@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark so sánh thông lượng endpoint sync (threadpool) và async (AsyncSession)
+Mỗi chế độ chạy trong một tiến trình riêng với database SQLite tạm, gọi app qua ASGI (không cần server)
+
+    python benchmark_async_db.py
+    python benchmark_async_db.py --requests 1000 --concurrency 100
+
+Chế độ async cần driver tương ứng (pip install aiosqlite greenlet).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ENDPOINTS = {
+    "orders_list": "/api/v1/orders/?limit=50",
+    "parent_dashboard": "/api/v1/dashboard/parent",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async database layer")
+    parser.add_argument("--requests", type=int, default=500, help="Số request mỗi endpoint")
+    parser.add_argument("--concurrency", type=int, default=50, help="Số request đồng thời")
+    parser.add_argument("--worker", choices=["sync", "async"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def seed(students=20, orders_per_student=10):
+    """Tạo dữ liệu mẫu, trả về email phụ huynh"""
+    from decimal import Decimal
+    from app.database import SessionLocal
+    from app.models import User, Student, Order, UserRole, OrderStatus
+
+    db = SessionLocal()
+    try:
+        parent = User(name="Phụ huynh", email="parent@example.com", role=UserRole.PARENT, hashed_password="x")
+        db.add(parent)
+        for s in range(students):
+            student = Student(parent=parent, name=f"Học sinh {s}", student_code=f"HS{s:04d}", class_name=f"{s % 5 + 1}A")
+            db.add(student)
+            for o in range(orders_per_student):
+                db.add(Order(
+                    student=student,
+                    order_code=f"ORD-{s:04d}-{o}",
+                    description="Học phí",
+                    amount=Decimal("500000"),
+                    status=OrderStatus.PENDING if o % 2 else OrderStatus.PAID
+                ))
+        db.commit()
+        return parent.email
+    finally:
+        db.close()
+
+
+def check(response, path):
+    if response.status_code != 200:
+        raise SystemExit(f"{path}: HTTP {response.status_code} {response.text}")
+
+
+async def run_endpoint(client, path, headers, total, concurrency):
+    """Gửi total request với tối đa concurrency request đồng thời"""
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            check(response, path)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    }
+
+
+def run_worker(mode, total, concurrency):
+    """Chạy benchmark trong tiến trình con (settings đã được đặt qua biến môi trường)"""
+    import httpx
+    from app.main import app
+    from app.core.security import create_access_token
+
+    parent_email = seed()
+    tokens = {
+        "orders_list": create_access_token({"sub": "admin@example.com"}),
+        "parent_dashboard": create_access_token({"sub": parent_email}),
+    }
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Nạp principal của từng token tuần tự trước: khi cache xác thực còn lạnh, 50 request
+            # đồng thời cùng giữ kết nối của dependency xác thực và chờ kết nối đọc, có thể cạn pool
+            for name, path in ENDPOINTS.items():
+                check(await client.get(path, headers={"Authorization": f"Bearer {tokens[name]}"}), path)
+            
+            results = {}
+            for name, path in ENDPOINTS.items():
+                headers = {"Authorization": f"Bearer {tokens[name]}"}
+                await run_endpoint(client, path, headers, min(total, 20), concurrency)  # warm-up
+                results[name] = await run_endpoint(client, path, headers, total, concurrency)
+            return results
+
+    print(json.dumps({"mode": mode, "results": asyncio.run(main())}))
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        run_worker(args.worker, args.requests, args.concurrency)
+        return 0
+
+    print(f"🚀 Benchmark {args.requests} request/endpoint, {args.concurrency} đồng thời")
+    summary = {}
+    for mode in ["sync", "async"]:
+        db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{db_file}",
+            ASYNC_DB_ENABLED="true" if mode == "async" else "false",
+            # Cache xác thực không hết hạn giữa chừng: hai chế độ đo cùng điều kiện
+            AUTH_CACHE_TTL_SECONDS="3600",
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", mode,
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+            env=env, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"❌ Chế độ {mode} lỗi:\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+            return 1
+        summary[mode] = json.loads(proc.stdout.strip().splitlines()[-1])["results"]
+
+    for name in ENDPOINTS:
+        print(f"📊 {name}")
+        for mode in ["sync", "async"]:
+            r = summary[mode][name]
+            print(f"   {mode:5s}: {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.2f} ms   p95 {r['p95_ms']:7.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark render JSON: Starlette JSONResponse (json.dumps) so với FastJSONResponse (orjson)
+Payload lấy từ dashboard/báo cáo và trang danh sách thật, chạy trên SQLite tạm
+
+    python benchmark_json_response.py
+    python benchmark_json_response.py --repeat 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_json.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+sys.path.append('.')
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.database import Base, engine, SessionLocal
+from app.models import Order, Payment
+from app.schemas import OrderResponse, PaymentResponse
+from app.core.pagination import PageParams, page_statement, page_response
+from app.core.responses import FastJSONResponse, PaginatedResponse, orjson
+from app.services.dashboard_service import DashboardService
+from test_dashboard_queries import seed_data
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response rendering")
+    parser.add_argument("--repeat", type=int, default=100, help="Số lần đo mỗi payload")
+    return parser.parse_args()
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def list_payload(db, model, schema):
+    """Nội dung mà FastAPI đưa vào response class sau khi serialize response_model"""
+    params = PageParams(limit=500, count="none")
+    rows = db.scalars(page_statement(select(model), model.id, params, schema)).all()
+    adapter = TypeAdapter(PaginatedResponse[schema])
+    return adapter.dump_python(adapter.validate_python(page_response(rows, None, params), from_attributes=True), mode="json")
+
+
+def main():
+    args = parse_args()
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed_data(db, classes=10, students_per_class=30, orders_per_student=3)
+        service = DashboardService(db)
+        payloads = {
+            "admin_dashboard": service.get_admin_dashboard(),
+            "accountant_dashboard": service.get_accountant_dashboard(),
+            "collection_report": service.get_collection_report(),
+            "orders_list": list_payload(db, Order, OrderResponse),
+            "payments_list": list_payload(db, Payment, PaymentResponse),
+        }
+    finally:
+        db.close()
+
+    print(f"🚀 Render JSON, trung vị {args.repeat} lần (ms) — orjson {'có' if orjson else 'KHÔNG có, dùng json'}")
+    print(f"   {'':22s} {'JSONResponse':>13s} {'FastJSON':>9s} {'x':>6s} {'KB':>7s}")
+    for name, content in payloads.items():
+        # Dashboard trả dict: FastAPI chạy jsonable_encoder trước khi render, giống nhau ở cả hai cách
+        content = jsonable_encoder(content)
+        old_body = JSONResponse(content).body
+        new_body = FastJSONResponse(content).body
+        assert json.loads(old_body) == json.loads(new_body), f"{name}: kết quả khác nhau"
+        old_ms = measure(lambda: JSONResponse(content), args.repeat)
+        new_ms = measure(lambda: FastJSONResponse(content), args.repeat)
+        print(f"   {name:22s} {old_ms:13.3f} {new_ms:9.3f} {old_ms / new_ms:6.1f} {len(old_body) / 1024:7.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
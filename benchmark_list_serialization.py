@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark thời gian đọc + encode 1.000 dòng của các endpoint danh sách
+So sánh cách cũ (ORM đầy đủ cột + jsonable_encoder) với cách mới
+(load_only theo schema + PaginatedResponse[...] của pydantic), chạy trên SQLite tạm
+
+    python benchmark_list_serialization.py
+    python benchmark_list_serialization.py --rows 5000 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_list.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+sys.path.append('.')
+from decimal import Decimal
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.database import Base, engine, SessionLocal
+from app.models import User, Student, Order, Payment, Invoice, UserRole, OrderStatus, PaymentStatus
+from app.schemas import UserResponse, StudentResponse, OrderResponse, PaymentResponse, InvoiceResponse
+from app.core.pagination import PageParams, page_statement, page_response
+from app.core.responses import paginated_response, PaginatedResponse
+
+RESOURCES = [
+    ("users", User, UserResponse),
+    ("students", Student, StudentResponse),
+    ("orders", Order, OrderResponse),
+    ("payments", Payment, PaymentResponse),
+    ("invoices", Invoice, InvoiceResponse),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark list endpoint serialization")
+    parser.add_argument("--rows", type=int, default=1000, help="Số dòng mỗi trang")
+    parser.add_argument("--repeat", type=int, default=10, help="Số lần đo mỗi trường hợp")
+    return parser.parse_args()
+
+
+def seed(rows):
+    """Tạo `rows` dòng cho mỗi bảng; payment có dữ liệu QR như khi tạo qua /create-qr"""
+    Base.metadata.create_all(bind=engine)
+    qr = "data:image/png;base64," + "A" * 2000
+    db = SessionLocal()
+    try:
+        for i in range(rows):
+            parent = User(name=f"Phụ huynh {i}", email=f"parent{i}@example.com", phone="0900000000",
+                          role=UserRole.PARENT, hashed_password="$2b$12$" + "x" * 53)
+            student = Student(parent=parent, name=f"Học sinh {i}", student_code=f"HS{i:05d}", class_name="1A")
+            order = Order(student=student, order_code=f"ORD-{i:05d}", description="Học phí",
+                          amount=Decimal("500000"), status=OrderStatus.PAID, due_date=datetime.now())
+            db.add_all([parent, student, order])
+            db.add(Payment(order=order, payment_code=f"PAY-{i:05d}", amount=Decimal("500000"),
+                           status=PaymentStatus.SUCCESS, payment_method="QR_CODE", qr_code_data=qr, paid_at=datetime.now()))
+            db.add(Invoice(order=order, invoice_number=f"INV-{i:05d}", customer_name=f"Phụ huynh {i}",
+                           amount=Decimal("500000"), tax_amount=Decimal("0"), total_amount=Decimal("500000")))
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def bench_resource(model, schema, rows, repeat):
+    params = PageParams(limit=rows, count="none")
+
+    def load_old():
+        with SessionLocal() as db:
+            return db.scalars(select(model).limit(rows)).all()
+
+    def load_new():
+        with SessionLocal() as db:
+            return db.scalars(page_statement(select(model), model.id, params, schema)).all()
+
+    old_rows, new_rows = load_old(), load_new()
+    adapter = TypeAdapter(PaginatedResponse[schema])
+
+    def encode_old():
+        # FastAPI không có response_model: jsonable_encoder duyệt từng thuộc tính ORM rồi json.dumps
+        content = paginated_response(data=old_rows, total=None, page=1, per_page=rows)
+        return json.dumps(jsonable_encoder(content)).encode("utf-8")
+
+    def encode_new():
+        # FastAPI có response_model: pydantic validate (from_attributes) rồi serialize
+        content = page_response(new_rows, None, params)
+        model_value = adapter.validate_python(content, from_attributes=True)
+        return json.dumps(adapter.dump_python(model_value, mode="json")).encode("utf-8")
+
+    return {
+        "load_old_ms": measure(load_old, repeat),
+        "load_new_ms": measure(load_new, repeat),
+        "encode_old_ms": measure(encode_old, repeat),
+        "encode_new_ms": measure(encode_new, repeat),
+        "bytes_old": len(encode_old()),
+        "bytes_new": len(encode_new()),
+    }
+
+
+def main():
+    args = parse_args()
+    print(f"🌱 Đang tạo {args.rows} dòng mỗi bảng...")
+    seed(args.rows)
+
+    print(f"🚀 Đo {args.rows} dòng/trang, trung vị {args.repeat} lần (ms)")
+    print(f"   {'':9s} {'đọc cũ':>8s} {'đọc mới':>8s} {'encode cũ':>10s} {'encode mới':>11s} {'KB cũ':>8s} {'KB mới':>8s}")
+    for name, model, schema in RESOURCES:
+        r = bench_resource(model, schema, args.rows, args.repeat)
+        print(f"   {name:9s} {r['load_old_ms']:8.1f} {r['load_new_ms']:8.1f} {r['encode_old_ms']:10.1f} "
+              f"{r['encode_new_ms']:11.1f} {r['bytes_old'] / 1024:8.1f} {r['bytes_new'] / 1024:8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -125,6 +125,109 @@ CREATE TABLE IF NOT EXISTS invoices (
     INDEX idx_issued_at (issued_at)
 ) ENGINE=InnoDB;
 
+-- =====================================================
+-- Bảng daily_rollups (số liệu tổng hợp theo ngày × lớp × trạng thái)
+-- =====================================================
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    day DATE NOT NULL,
+    class_name VARCHAR(50) NOT NULL,
+    status ENUM('PENDING', 'PAID', 'INVOICED') NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    payment_count INT NOT NULL DEFAULT 0,
+    order_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_daily_rollups_day_class_status (day, class_name, status),
+    INDEX idx_day (day)
+) ENGINE=InnoDB;
+
+-- =====================================================
+-- Bảng webhook_events (outbox + khóa idempotency của webhook thanh toán)
+-- =====================================================
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    transaction_id VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    payload TEXT NULL,
+    payment_id INT NULL,
+    state ENUM('PENDING', 'PROCESSING', 'DONE', 'FAILED') NOT NULL DEFAULT 'PENDING',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME NOT NULL,
+    last_error VARCHAR(500) NULL,
+    processed_at DATETIME NULL,
+    created_at DATETIME NOT NULL,
+    UNIQUE KEY uq_webhook_events_txn_status (transaction_id, status),
+    INDEX ix_webhook_events_state_available (state, available_at),
+    FOREIGN KEY (payment_id) REFERENCES payments(id)
+) ENGINE=InnoDB;
+
+-- =====================================================
+-- Bảng email_outbox (hàng đợi email, worker gửi và thử lại)
+-- =====================================================
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    recipient VARCHAR(255) NOT NULL,
+    payload TEXT NOT NULL,
+    state ENUM('PENDING', 'PROCESSING', 'DONE', 'FAILED') NOT NULL DEFAULT 'PENDING',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME NOT NULL,
+    last_error VARCHAR(500) NULL,
+    processed_at DATETIME NULL,
+    created_at DATETIME NOT NULL,
+    INDEX ix_email_outbox_state_available (state, available_at)
+) ENGINE=InnoDB;
+
+-- =====================================================
+-- Bảng reminder_jobs (tiến độ các lần gửi nhắc nhở quá hạn)
+-- =====================================================
+CREATE TABLE IF NOT EXISTS reminder_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    class_name VARCHAR(50) NULL,
+    requested_by INT NULL,
+    state ENUM('PENDING', 'RUNNING', 'DONE', 'FAILED') NOT NULL DEFAULT 'PENDING',
+    parents_total INT NOT NULL DEFAULT 0,
+    parents_processed INT NOT NULL DEFAULT 0,
+    parents_queued INT NOT NULL DEFAULT 0,
+    parents_skipped INT NOT NULL DEFAULT 0,
+    orders_total INT NOT NULL DEFAULT 0,
+    error VARCHAR(500) NULL,
+    owner VARCHAR(100) NULL,
+    heartbeat_at DATETIME NULL,
+    created_at DATETIME NOT NULL,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    FOREIGN KEY (requested_by) REFERENCES users(id) ON DELETE SET NULL
+) ENGINE=InnoDB;
+
+-- =====================================================
+-- Bảng reminder_recipients (lần nhắc gần nhất của mỗi phụ huynh, chống nhắc trùng giữa các job)
+-- =====================================================
+CREATE TABLE IF NOT EXISTS reminder_recipients (
+    user_id INT PRIMARY KEY,
+    last_reminded_at DATETIME NULL,
+    job_id INT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (job_id) REFERENCES reminder_jobs(id) ON DELETE SET NULL
+) ENGINE=InnoDB;
+
+-- =====================================================
+-- Bảng reminder_logs (chống nhắc trùng phụ huynh trong một khoảng thời gian)
+-- =====================================================
+CREATE TABLE IF NOT EXISTS reminder_logs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    job_id INT NOT NULL,
+    email_id INT NULL,
+    order_count INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL,
+    INDEX ix_reminder_logs_user_created (user_id, created_at),
+    INDEX ix_reminder_logs_job_id (job_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (job_id) REFERENCES reminder_jobs(id) ON DELETE CASCADE,
+    FOREIGN KEY (email_id) REFERENCES email_outbox(id) ON DELETE SET NULL
+) ENGINE=InnoDB;
+
 -- =====================================================
 -- Bảng printer_agents
 -- =====================================================
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Script dựng lại bảng daily_rollups từ orders/payments/invoices (backfill)
+
+    python rebuild_daily_rollups.py                      # toàn bộ dữ liệu
+    python rebuild_daily_rollups.py --start 2024-01-01   # từ ngày chỉ định
+    python rebuild_daily_rollups.py --start 2024-01-01 --end 2024-03-31
+"""
+
+import argparse
+import sys
+from datetime import date
+
+sys.path.append('.')
+from app.database import SessionLocal, Base, engine
+from app.services.rollup_service import RollupService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dựng lại bảng daily_rollups")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="Ngày bắt đầu (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="Ngày kết thúc (YYYY-MM-DD)")
+    return parser.parse_args()
+
+
+def rebuild_daily_rollups(start=None, end=None):
+    """Dựng lại số liệu tổng hợp trong khoảng thời gian"""
+    print("🔄 Đang dựng lại daily_rollups...")
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rows = RollupService(db).rebuild(start=start, end=end)
+        print(f"✅ Đã ghi {rows} dòng tổng hợp")
+        return True
+    except Exception as e:
+        print(f"❌ Lỗi: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(0 if rebuild_daily_rollups(args.start, args.end) else 1)
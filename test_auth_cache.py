@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra cache người dùng đã xác thực (principal cache)
+Đếm số truy vấn bảng users cho mỗi request có token, chạy trên SQLite tạm
+
+    python test_auth_cache.py
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "auth_cache.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.main import app
+from app.database import engine
+from app.core.auth_cache import principal_cache
+from app.core.auth_metrics import auth_metrics
+
+client = TestClient(app)
+
+
+@contextmanager
+def count_user_queries():
+    """Đếm số câu SELECT trên bảng users"""
+    counter = {"count": 0}
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            counter["count"] += 1
+
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_execute)
+
+
+def login(email, password):
+    response = client.post("/api/v1/auth/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['data']['access_token']}"}
+
+
+def test_cached_principal():
+    """Request thứ hai với cùng token không truy vấn bảng users"""
+    print("🔐 Đang kiểm tra cache người dùng...")
+    principal_cache.clear()
+    headers = login("admin@example.com", "Admin@123")
+
+    with count_user_queries() as first:
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+    with count_user_queries() as second:
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+
+    print(f"   Lần 1: {first['count']} truy vấn users, lần 2: {second['count']} truy vấn users")
+    assert first["count"] >= 1
+    assert second["count"] == 0, "Request có token đã cache vẫn truy vấn bảng users"
+
+    print("✅ Cache người dùng OK")
+    return True
+
+
+def test_invalidation():
+    """Sửa/xóa user hoặc đổi mật khẩu phải xóa cache của user đó"""
+    print("🧹 Đang kiểm tra xóa cache...")
+    admin = login("admin@example.com", "Admin@123")
+
+    user = {"name": "Kế toán", "email": "ketoan@example.com", "phone": "0900000000",
+            "role": "admin", "password": "Secret@123"}
+    response = client.post("/api/v1/users/", json=user, headers=admin)
+    assert response.status_code == 200, response.text
+    user_id = response.json()["id"]
+
+    headers = login(user["email"], user["password"])
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+
+    # Đổi mật khẩu: lần xác thực sau phải đọc lại user từ database
+    response = client.post("/api/v1/auth/change-password", headers=headers,
+                           json={"old_password": "Secret@123", "new_password": "Changed@123"})
+    assert response.status_code == 200, response.text
+    with count_user_queries() as counter:
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+    assert counter["count"] >= 1, "Đổi mật khẩu không xóa cache"
+
+    # Đổi email: token cũ (sub = email cũ) không còn dùng được
+    response = client.put(f"/api/v1/users/{user_id}", headers=admin,
+                          json={**user, "email": "ketoan2@example.com"})
+    assert response.status_code == 200, response.text
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 401
+
+    # Xóa user: token của user mới không còn dùng được
+    headers = login("ketoan2@example.com", "Secret@123")
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+    assert client.delete(f"/api/v1/users/{user_id}", headers=admin).status_code == 200
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 401
+
+    print(f"   {principal_cache.stats()}")
+    print("✅ Xóa cache OK")
+    return True
+
+
+def test_single_resolution():
+    """Token chỉ được giải mã và user chỉ được tải một lần mỗi request"""
+    print("🔁 Đang kiểm tra số lần xác thực mỗi request...")
+    principal_cache.clear()
+    headers = login("admin@example.com", "Admin@123")
+    auth_metrics.reset()
+
+    # /users/ có dependency ở protected_router, require_admin và get_current_active_user
+    for _ in range(5):
+        assert client.get("/api/v1/users/", headers=headers).status_code == 200
+        assert client.get("/api/v1/dashboard/admin", headers=headers).status_code == 200
+
+    stats = auth_metrics.stats()
+    print(f"   {stats}")
+    assert stats["authenticated_requests"] == 10
+    assert stats["max_decodes_per_request"] == 1, "Token bị giải mã nhiều lần trong một request"
+    assert stats["max_user_loads_per_request"] == 1
+    assert stats["user_loads"] == 1, "User phải được lấy từ cache sau request đầu tiên"
+    assert stats["duplicate_resolutions"] == 0
+
+    print("✅ Mỗi request xác thực một lần OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_cached_principal(),
+        test_invalidation(),
+        test_single_resolution(),
+    ]
+    if all(results):
+        print("🎉 Cache người dùng hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
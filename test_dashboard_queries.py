@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Script benchmark số truy vấn SQL mỗi lần tải dashboard
+Chạy trên SQLite in-memory với dữ liệu mẫu, không cần server
+
+    python test_dashboard_queries.py
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from sqlalchemy import event, func
+
+from app.database import Base, SessionLocal, engine
+from app.models import (
+    User, Student, Order, Payment, Invoice, DailyRollup, UserRole, OrderStatus, PaymentStatus
+)
+from app.services.dashboard_aggregates import period_key
+from app.services.dashboard_service import DashboardService
+from app.services.rollup_service import RollupService
+
+# Giới hạn số truy vấn cho mỗi dashboard (không phụ thuộc số lượng dữ liệu)
+MAX_ADMIN_QUERIES = 6
+MAX_ACCOUNTANT_QUERIES = 5
+MAX_TEACHER_QUERIES = 3
+MAX_PARENT_QUERIES = 3
+MAX_PARENT_COMPACT_QUERIES = 1
+
+
+@contextmanager
+def count_queries():
+    """Đếm số câu lệnh SQL gửi xuống database"""
+    counter = {"count": 0}
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["count"] += 1
+
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_execute)
+
+
+def seed_data(db, classes=6, students_per_class=10, orders_per_student=3):
+    """Tạo dữ liệu mẫu"""
+    print("🌱 Đang tạo dữ liệu mẫu...")
+    now = datetime.now()
+
+    admin = User(name="Admin", email="admin@bench.local", role=UserRole.ADMIN, hashed_password="x")
+    db.add(admin)
+
+    student_index = 0
+    for c in range(classes):
+        for s in range(students_per_class):
+            parent = User(
+                name=f"Phụ huynh {student_index}",
+                email=f"parent{student_index}@bench.local",
+                role=UserRole.PARENT,
+                hashed_password="x"
+            )
+            student = Student(
+                parent=parent,
+                name=f"Học sinh {student_index}",
+                student_code=f"HS{student_index:05d}",
+                class_name=f"{c + 1}A",
+                grade=str(c + 1)
+            )
+            db.add_all([parent, student])
+
+            for o in range(orders_per_student):
+                created = now - timedelta(days=(student_index + o) % 10)
+                status = [OrderStatus.PENDING, OrderStatus.PAID, OrderStatus.INVOICED][o % 3]
+                order = Order(
+                    student=student,
+                    order_code=f"ORD-{student_index:05d}-{o}",
+                    description=f"Học phí đợt {o + 1}",
+                    amount=Decimal("500000"),
+                    status=status,
+                    created_at=created,
+                    due_date=now - timedelta(days=1) if o == 0 else now + timedelta(days=30)
+                )
+                db.add(order)
+                if status != OrderStatus.PENDING:
+                    db.add(Payment(
+                        order=order,
+                        payment_code=f"TXN-{student_index:05d}-{o}",
+                        amount=Decimal("500000"),
+                        status=PaymentStatus.SUCCESS,
+                        payment_method="QR_CODE",
+                        paid_at=min(created + timedelta(hours=1), now)
+                    ))
+            student_index += 1
+
+    db.commit()
+    RollupService(db).rebuild()
+    print(f"✅ Đã tạo {student_index} học sinh")
+
+
+def test_admin_dashboard_query_count(db):
+    """Dashboard admin phải chạy trong số truy vấn cố định"""
+    print("📊 Đang đo dashboard admin...")
+    service = DashboardService(db)
+
+    with count_queries() as counter:
+        started = time.perf_counter()
+        data = service.get_admin_dashboard()
+        elapsed = (time.perf_counter() - started) * 1000
+
+    print(f"   Số truy vấn: {counter['count']} (tối đa {MAX_ADMIN_QUERIES}), thời gian: {elapsed:.1f} ms")
+
+    assert data, "Dashboard admin trả về rỗng"
+    assert counter["count"] <= MAX_ADMIN_QUERIES, f"Dashboard admin chạy {counter['count']} truy vấn"
+
+    # Đối chiếu số liệu với cách đếm trực tiếp
+    overview = data["overview"]
+    assert overview["total_students"] == db.query(Student).count()
+    assert overview["total_orders"] == db.query(Order).count()
+    assert overview["paid_orders"] == db.query(Order).filter(Order.status == OrderStatus.PAID).count()
+    assert len(data["daily_stats"]) == 7
+    assert sum(d["orders"] for d in data["daily_stats"]) == db.query(Order).filter(
+        Order.created_at >= datetime.combine(datetime.now().date() - timedelta(days=6), datetime.min.time())
+    ).count()
+
+    total_revenue = db.query(func.sum(Payment.amount)).filter(Payment.status == PaymentStatus.SUCCESS).scalar()
+    assert data["revenue"]["total"] == float(total_revenue)
+
+    print("✅ Dashboard admin OK")
+    return True
+
+
+def test_accountant_dashboard_query_count(db):
+    """Dashboard kế toán không được chạy thêm truy vấn cho từng khoản thu (N+1)"""
+    print("🧾 Đang đo dashboard kế toán...")
+    service = DashboardService(db)
+
+    # Phát hành hóa đơn cho các đơn INVOICED để có dữ liệu hóa đơn
+    now = datetime.now()
+    rollups = RollupService(db)
+    invoiced = db.query(Order).filter(Order.status == OrderStatus.INVOICED).all()
+    for i, order in enumerate(invoiced):
+        issued_at = now - timedelta(days=i % 45)
+        invoice = Invoice(
+            order_id=order.id,
+            invoice_number=f"INV-BENCH-{i:05d}",
+            customer_name=f"Phụ huynh {i}",
+            amount=order.amount,
+            total_amount=order.amount,
+            issued_at=issued_at
+        )
+        db.add(invoice)
+        rollups.record_order_invoiced(invoice, order.student.class_name)
+    db.commit()
+
+    with count_queries() as counter:
+        started = time.perf_counter()
+        data = service.get_accountant_dashboard()
+        elapsed = (time.perf_counter() - started) * 1000
+
+    print(f"   Số truy vấn: {counter['count']} (tối đa {MAX_ACCOUNTANT_QUERIES}), thời gian: {elapsed:.1f} ms")
+
+    assert data, "Dashboard kế toán trả về rỗng"
+    assert counter["count"] <= MAX_ACCOUNTANT_QUERIES, f"Dashboard kế toán chạy {counter['count']} truy vấn"
+
+    # Đối chiếu số liệu với cách đếm trực tiếp
+    this_month_start = now.date().replace(day=1)
+    overview = data["overview"]
+    assert overview["total_invoices"] == db.query(Invoice).count()
+    assert overview["monthly_invoices"] == db.query(Invoice).filter(Invoice.issued_at >= this_month_start).count()
+    assert overview["need_invoice"] == db.query(Order).filter(Order.status == OrderStatus.PAID).count()
+    assert sum(m["invoices"] for m in data["monthly_revenue_chart"]) == db.query(Invoice).filter(
+        Invoice.issued_at >= datetime.fromisoformat(data["monthly_revenue_chart"][-1]["month"] + "-01")
+    ).count()
+
+    top = data["top_payments"]
+    assert 0 < len(top) <= 10
+    for item in top:
+        payment = db.query(Payment).filter(Payment.payment_code == item["payment_code"]).one()
+        assert item["student_name"] == payment.order.student.name
+        assert item["parent_name"] == payment.order.student.parent.name
+        assert item["description"] == payment.order.description
+
+    print("✅ Dashboard kế toán OK")
+    return True
+
+
+def test_teacher_dashboard_query_count(db):
+    """Dashboard giáo vụ và báo cáo thu phí không được chạy truy vấn theo từng lớp"""
+    print("🏫 Đang đo dashboard giáo vụ...")
+    service = DashboardService(db)
+
+    # Lớp mới chưa có đơn hàng: vẫn xuất hiện ở dashboard, không có trong báo cáo thu phí
+    db.add(Student(
+        parent=db.query(User).filter(User.role == UserRole.PARENT).first(),
+        name="Học sinh lớp mới",
+        student_code="HS-NEW-1",
+        class_name="12Z",
+        grade="12"
+    ))
+    db.commit()
+
+    with count_queries() as counter:
+        started = time.perf_counter()
+        data = service.get_teacher_dashboard()
+        elapsed = (time.perf_counter() - started) * 1000
+
+    print(f"   Số truy vấn: {counter['count']} (tối đa {MAX_TEACHER_QUERIES}), thời gian: {elapsed:.1f} ms")
+
+    assert data, "Dashboard giáo vụ trả về rỗng"
+    assert counter["count"] <= MAX_TEACHER_QUERIES, f"Dashboard giáo vụ chạy {counter['count']} truy vấn"
+    assert data["overview"]["total_students"] == db.query(Student).count()
+
+    for stat in data["class_payment_stats"]:
+        class_orders = db.query(Order).join(Student).filter(Student.class_name == stat["class_name"])
+        assert stat["total_orders"] == class_orders.count()
+        assert stat["paid_orders"] == class_orders.filter(
+            Order.status.in_([OrderStatus.PAID, OrderStatus.INVOICED])
+        ).count()
+
+    # Báo cáo thu phí phải khớp với cách cộng dồn từng đơn trong Python
+    expected = {}
+    for order, student in db.query(Order, Student).join(Student, Order.student_id == Student.id):
+        row = expected.setdefault(student.class_name, {"students": set(), "orders": 0, "paid": Decimal("0")})
+        row["students"].add(student.id)
+        row["orders"] += 1
+        if order.status in [OrderStatus.PAID, OrderStatus.INVOICED]:
+            row["paid"] += order.amount
+
+    with count_queries() as counter:
+        report = service.get_collection_report()
+
+    print(f"   Báo cáo thu phí: {len(report['classes'])} lớp, {counter['count']} truy vấn")
+    assert counter["count"] == 1
+    assert {c["class_name"] for c in report["classes"]} == set(expected)
+    for c in report["classes"]:
+        assert c["student_count"] == len(expected[c["class_name"]]["students"])
+        assert c["total_orders"] == expected[c["class_name"]]["orders"]
+        assert c["paid_amount"] == float(expected[c["class_name"]]["paid"])
+
+    print("✅ Dashboard giáo vụ OK")
+    return True
+
+
+def test_parent_dashboard_query_count(db):
+    """Số truy vấn dashboard phụ huynh không phụ thuộc số con"""
+    print("👪 Đang đo dashboard phụ huynh...")
+    service = DashboardService(db)
+
+    # Gán thêm con cho một phụ huynh để có nhiều học sinh
+    parent = db.query(User).filter(User.role == UserRole.PARENT).first()
+    for student in db.query(Student).filter(Student.user_id != parent.id).limit(4):
+        student.user_id = parent.id
+    db.commit()
+    student_ids = [s.id for s in db.query(Student).filter(Student.user_id == parent.id)]
+
+    for compact, limit in [(False, MAX_PARENT_QUERIES), (True, MAX_PARENT_COMPACT_QUERIES)]:
+        with count_queries() as counter:
+            data = service.get_parent_dashboard(parent.id, compact=compact)
+
+        print(f"   compact={compact}: {len(data['students'])} con, {counter['count']} truy vấn (tối đa {limit})")
+        assert data, "Dashboard phụ huynh trả về rỗng"
+        assert counter["count"] <= limit, f"Dashboard phụ huynh chạy {counter['count']} truy vấn"
+        assert ("payment_history" in data) != compact
+
+    # Đối chiếu số liệu với cách đếm trực tiếp
+    orders = db.query(Order).filter(Order.student_id.in_(student_ids))
+    total_paid = db.query(func.sum(Payment.amount)).join(Order).filter(
+        Order.student_id.in_(student_ids),
+        Payment.status == PaymentStatus.SUCCESS
+    ).scalar()
+    overview = data["overview"]
+    assert overview["total_orders"] == orders.count()
+    assert overview["pending_orders"] == orders.filter(Order.status == OrderStatus.PENDING).count()
+    assert overview["total_paid"] == float(total_paid)
+    for student in data["students"]:
+        assert student["total_orders"] == db.query(Order).filter(Order.student_id == student["id"]).count()
+
+    print("✅ Dashboard phụ huynh OK")
+    return True
+
+
+def test_rollup_incremental_matches_rebuild(db):
+    """Cập nhật tăng dần phải cho kết quả giống dựng lại từ đầu"""
+    print("🧮 Đang kiểm tra daily_rollups...")
+    rollups = RollupService(db)
+    student = db.query(Student).first()
+
+    order = Order(
+        student=student,
+        order_code="ORD-ROLLUP-1",
+        description="Phí ngoại khóa",
+        amount=Decimal("150000"),
+        status=OrderStatus.PAID
+    )
+    payment = Payment(
+        order=order,
+        payment_code="TXN-ROLLUP-1",
+        amount=Decimal("150000"),
+        status=PaymentStatus.SUCCESS,
+        payment_method="QR_CODE",
+        paid_at=datetime.now()
+    )
+    db.add_all([order, payment])
+    rollups.record_order_created(order, student.class_name)
+    rollups.record_payment_success(payment, student.class_name, order_became_paid=True)
+    db.commit()
+
+    def snapshot():
+        return sorted(
+            (r.day, r.class_name, r.status.value, float(r.revenue), r.payment_count, r.order_count)
+            for r in db.query(DailyRollup).all()
+        )
+
+    incremental = snapshot()
+    rollups.rebuild()
+    rebuilt = snapshot()
+    assert incremental == rebuilt, "daily_rollups tăng dần khác với dựng lại"
+
+    # Webhook "failed" đến sau "success": trừ doanh thu, đơn quay về PENDING
+    from app.services.payment_service import PaymentService
+    PaymentService(db).apply_webhook("TXN-ROLLUP-1", "failed")
+    db.commit()
+    assert payment.status == PaymentStatus.FAILED and order.status == OrderStatus.PENDING
+    reversed_incremental = snapshot()
+    rollups.rebuild()
+    assert reversed_incremental == snapshot(), "daily_rollups sau giao dịch bị đảo khác với dựng lại"
+    assert reversed_incremental != rebuilt
+
+    print("✅ daily_rollups OK")
+    return True
+
+
+def test_rollup_day_outside_utc(db):
+    """Đơn hàng/hóa đơn mới ghi vào cùng ngày với rebuild() khi TZ của tiến trình khác UTC"""
+    print("🌍 Đang kiểm tra ngày của daily_rollups ngoài UTC...")
+    # Chọn múi giờ sao cho ngày địa phương luôn khác ngày UTC (database ghi created_at theo UTC)
+    original_tz = os.environ.get("TZ")
+    os.environ["TZ"] = "Etc/GMT+12" if datetime.utcnow().hour < 12 else "Etc/GMT-13"
+    time.tzset()
+    try:
+        assert datetime.now().date() != datetime.utcnow().date()
+        rollups = RollupService(db)
+        rollups.rebuild()
+        student = db.query(Student).first()
+
+        order = Order(student=student, order_code="ORD-TZ-1", description="Phí ăn trưa",
+                      amount=Decimal("90000"), status=OrderStatus.PENDING)
+        db.add(order)
+        rollups.record_order_created(order, student.class_name)
+        bulk = [Order(student=student, order_code=f"ORD-TZ-{i}", description="Phí ăn trưa",
+                      amount=Decimal("90000"), status=OrderStatus.INVOICED) for i in range(2, 4)]
+        db.add_all(bulk)
+        rollups.record_orders_created({student.class_name: bulk})
+        invoice = Invoice(order=bulk[0], invoice_number="INV-TZ-1", customer_name="Phụ huynh",
+                          amount=Decimal("90000"), total_amount=Decimal("90000"))
+        db.add(invoice)
+        rollups.record_order_invoiced(invoice, student.class_name)
+        db.commit()
+
+        def snapshot():
+            return sorted(
+                (r.day, r.class_name, r.status.value, float(r.revenue), r.payment_count, r.order_count)
+                for r in db.query(DailyRollup).all()
+            )
+
+        incremental = snapshot()
+        rollups.rebuild()
+        assert incremental == snapshot(), "daily_rollups lệch ngày so với dựng lại khi TZ khác UTC"
+    finally:
+        if original_tz is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = original_tz
+        time.tzset()
+
+    print("✅ Ngày của daily_rollups OK")
+    return True
+
+
+def test_revenue_report_buckets(db):
+    """Báo cáo doanh thu gom nhóm trong SQL phải khớp với cách tính trong Python"""
+    print("📈 Đang kiểm tra báo cáo doanh thu...")
+    service = DashboardService(db)
+    start = datetime.now() - timedelta(days=60)
+    end = datetime.now()
+    payments = db.query(Payment).filter(Payment.status == PaymentStatus.SUCCESS).all()
+
+    for group_by in ["day", "week", "month"]:
+        expected = {}
+        for payment in payments:
+            key = period_key(payment.paid_at, group_by)
+            expected[key] = expected.get(key, 0) + float(payment.amount)
+
+        with count_queries() as counter:
+            report = service.generate_revenue_report(start, end, group_by)
+
+        actual = {row["period"]: row["revenue"] for row in report["data"]}
+        print(f"   group_by={group_by}: {len(actual)} kỳ, {counter['count']} truy vấn")
+        assert actual == expected, f"Sai số liệu khi group_by={group_by}"
+        assert counter["count"] == 1
+
+    print("✅ Báo cáo doanh thu OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ benchmark"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed_data(db)
+        results = [
+            test_admin_dashboard_query_count(db),
+            test_accountant_dashboard_query_count(db),
+            test_teacher_dashboard_query_count(db),
+            test_parent_dashboard_query_count(db),
+            test_rollup_incremental_matches_rebuild(db),
+            test_rollup_day_outside_utc(db),
+            test_revenue_report_buckets(db),
+        ]
+    finally:
+        db.close()
+
+    if all(results):
+        print("🎉 Tất cả dashboard đều nằm trong giới hạn truy vấn")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
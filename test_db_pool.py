@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra cấu hình connection pool và số liệu thời gian chờ kết nối
+Dùng pool 1 kết nối trên SQLite tạm để tạo tình huống hết kết nối
+
+    python test_db_pool.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pool.db')}")
+os.environ.setdefault("DB_POOL_SIZE", "1")
+os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+os.environ.setdefault("DB_POOL_TIMEOUT", "1")
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.database import engine, pool_metrics
+from app.core.pool_metrics import InstrumentedQueuePool, SLOW_WAIT_MS
+
+
+def test_pool_configuration():
+    """Engine dùng pool đo thời gian chờ với kích thước lấy từ settings"""
+    print("⚙️  Đang kiểm tra cấu hình pool...")
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+    assert engine.pool.size() == 1
+    assert engine.pool._max_overflow == 0
+    print(f"   {engine.pool.status()}")
+    print("✅ Cấu hình pool OK")
+    return True
+
+
+def test_wait_metrics():
+    """Request chờ kết nối khi pool hết phải được ghi nhận (chờ lâu, timeout)"""
+    print("⏱️  Đang kiểm tra số liệu chờ kết nối...")
+    pool_metrics.reset()
+
+    released = threading.Event()
+
+    def hold_connection(seconds):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            released.wait(seconds)
+
+    # Giữ kết nối duy nhất 0.3s: lần lấy kết nối tiếp theo phải chờ
+    holder = threading.Thread(target=hold_connection, args=(0.3,))
+    holder.start()
+    time.sleep(0.05)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    holder.join()
+
+    stats = pool_metrics.stats()
+    print(f"   Sau khi chờ: wait_max={stats['wait_max_ms']} ms, slow_waits={stats['slow_waits']}")
+    assert stats["checkouts"] == 2
+    assert stats["slow_waits"] >= 1 and stats["wait_max_ms"] >= SLOW_WAIT_MS
+    assert stats["max_checked_out"] == 1
+    assert stats["checked_out"] == 0
+
+    # Giữ kết nối lâu hơn DB_POOL_TIMEOUT: lần lấy kết nối tiếp theo bị timeout
+    released.clear()
+    holder = threading.Thread(target=hold_connection, args=(3,))
+    holder.start()
+    time.sleep(0.05)
+    try:
+        engine.connect()
+        raise AssertionError("Phải timeout khi pool hết kết nối")
+    except PoolTimeoutError:
+        pass
+    finally:
+        released.set()
+        holder.join()
+
+    stats = pool_metrics.stats()
+    print(f"   Sau timeout: timeouts={stats['timeouts']}, hold_max={stats['hold_max_ms']} ms")
+    assert stats["timeouts"] == 1
+
+    print("✅ Số liệu chờ kết nối OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_pool_configuration(),
+        test_wait_metrics(),
+    ]
+    if all(results):
+        print("🎉 Connection pool hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
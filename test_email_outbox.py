@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra hàng đợi email (email_outbox): request chỉ ghi email vào hàng đợi và trả lời
+ngay, worker gửi qua pool SMTP, thử lại với backoff rồi đánh dấu thất bại (dead letter),
+nhiều luồng gửi không trùng thư và số liệu hàng đợi. Dùng SMTP server giả lập của
+test_smtp_pool trên SQLite tạm
+
+    python test_email_outbox.py
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "email_outbox.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("FORGOT_PASSWORD_RATE_LIMIT", "1000")
+
+from test_smtp_pool import smtp_server, reset
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import SessionLocal
+from app.core.outbox import utcnow
+from app.models import EmailOutbox, User, Student, Order, Payment, UserRole, OrderStatus, OutboxState, PaymentStatus
+from app.services.email_service import EmailService
+from app.services.email_worker import EmailWorker, email_worker
+
+client = TestClient(app)
+
+
+def queue_reminders(count, prefix):
+    """Xếp `count` email nhắc nhở trong một transaction; trả về danh sách người nhận"""
+    recipients = [f"{prefix}{i}@example.com" for i in range(count)]
+    db = SessionLocal()
+    try:
+        service = EmailService()
+        for email in recipients:
+            service.queue_email(db, "payment_reminder", recipient_email=email, orders=[
+                {"parent_email": email, "student_name": "HS", "class_name": "4A", "description": "Học phí",
+                 "amount": Decimal("150000"), "due_date": "01/09/2026"}
+            ])
+        db.commit()
+    finally:
+        db.close()
+    return recipients
+
+
+def admin_headers():
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def load(recipient):
+    db = SessionLocal()
+    try:
+        return db.query(EmailOutbox).filter(EmailOutbox.recipient == recipient).one()
+    finally:
+        db.close()
+
+
+def test_request_does_not_wait_for_smtp():
+    """Quên mật khẩu chỉ ghi email vào hàng đợi; email bị rollback thì không bao giờ được gửi"""
+    print("⚡ Đang kiểm tra request không chờ SMTP...")
+    reset(EmailService().smtp_pool)
+    response = client.post("/api/v1/auth/forgot-password", json={"email": "admin@example.com"})
+    assert response.status_code == 200, response.text
+    assert not smtp_server.messages
+    item = load("admin@example.com")
+    assert item.kind == "password_reset" and item.state == OutboxState.PENDING
+    assert "reset-password?token=" in json.loads(item.payload)["reset_url"]
+
+    db = SessionLocal()
+    try:
+        EmailService().queue_email(db, "password_reset", recipient_email="rollback@example.com",
+                                   recipient_name="X", reset_url="http://localhost/reset")
+        db.rollback()
+        assert db.query(EmailOutbox).filter(EmailOutbox.recipient == "rollback@example.com").count() == 0
+    finally:
+        db.close()
+
+    assert email_worker.run_once() == 1
+    assert smtp_server.messages == ["admin@example.com"] and load("admin@example.com").state == OutboxState.DONE
+    print("✅ Request không chờ SMTP OK")
+    return True
+
+
+def test_payment_confirmation_end_to_end():
+    """Webhook thanh toán -> worker webhook xếp email xác nhận -> worker email gửi"""
+    print("💳 Đang kiểm tra email xác nhận thanh toán...")
+    db = SessionLocal()
+    try:
+        parent = User(name="Phụ huynh", email="confirm@example.com", role=UserRole.PARENT, hashed_password="x")
+        student = Student(parent=parent, name="Học sinh", student_code="HS-EO", class_name="4A")
+        order = Order(student=student, order_code="ORD-EO", description="Học phí",
+                      amount=Decimal("200000"), status=OrderStatus.PENDING)
+        db.add(Payment(order=order, payment_code="TXN-EO", amount=Decimal("200000"), status=PaymentStatus.PENDING))
+        db.commit()
+    finally:
+        db.close()
+
+    from app.services.webhook_worker import webhook_worker
+    reset(EmailService().smtp_pool)
+    body = {"transaction_id": "TXN-EO", "status": "success"}
+    signature = hmac.new(b"dev-secret", json.dumps(body, separators=(",", ":")).encode(), hashlib.sha256).hexdigest()
+    response = client.post("/api/v1/payments/webhook", json=body, headers={**admin_headers(), "X-Signature": signature})
+    assert response.status_code == 200 and response.json()["result"] == "queued", response.text
+    assert webhook_worker.run_once() == 1
+    assert load("confirm@example.com").kind == "payment_confirmation" and not smtp_server.messages
+    assert email_worker.run_once() == 1
+    assert smtp_server.messages == ["confirm@example.com"]
+    print("✅ Email xác nhận thanh toán OK")
+    return True
+
+
+def test_retry_and_dead_letter():
+    """Gửi lỗi: thử lại sau retry_delay, hết lượt thì FAILED và hiện trong recent_failures"""
+    print("🔁 Đang kiểm tra thử lại và dead letter...")
+    reset(EmailService().smtp_pool)
+    smtp_server.refused.add("bounce0@example.com")
+    worker = EmailWorker(SessionLocal, max_attempts=2, retry_base_seconds=30)
+
+    queue_reminders(1, "bounce")
+    assert worker.run_once() == 1
+    item = load("bounce0@example.com")
+    assert item.state == OutboxState.PENDING and item.attempts == 1 and "No such user" in item.last_error
+    assert item.available_at > utcnow() + timedelta(seconds=20)
+    assert worker.run_once() == 0, "Chưa đến hạn thử lại"
+
+    db = SessionLocal()
+    try:
+        db.query(EmailOutbox).filter(EmailOutbox.id == item.id).update({"available_at": utcnow()})
+        db.commit()
+    finally:
+        db.close()
+    assert worker.run_once() == 1
+    item = load("bounce0@example.com")
+    assert item.state == OutboxState.FAILED and item.attempts == 2
+    assert worker.run_once() == 0 and not smtp_server.messages
+
+    stats = worker.stats()
+    assert stats["retried"] == 1 and stats["failed"] == 1
+    assert stats["recent_failures"][0]["recipient"] == "bounce0@example.com"
+    print("✅ Thử lại và dead letter OK")
+    return True
+
+
+def test_concurrent_workers():
+    """Nhiều luồng gửi cùng lúc: mỗi email được gửi đúng một lần"""
+    print("🏁 Đang kiểm tra nhiều luồng gửi...")
+    reset(EmailService().smtp_pool)
+    recipients = queue_reminders(60, "parallel")
+    worker = EmailWorker(SessionLocal, poll_seconds=0.05, batch_size=10, concurrency=2)
+    started = time.perf_counter()
+    worker.start()
+    try:
+        while worker.queue_stats()["pending"] + worker.queue_stats()["processing"] and time.perf_counter() - started < 30:
+            time.sleep(0.05)
+    finally:
+        worker.stop()
+    print(f"   60 email, 2 luồng: {time.perf_counter() - started:.2f}s, {smtp_server.connections} kết nối")
+    assert sorted(smtp_server.messages) == sorted(recipients)
+    assert worker.stats()["processed"] == 60 and smtp_server.connections <= 2
+    print("✅ Nhiều luồng gửi OK")
+    return True
+
+
+def test_queue_depth_metrics():
+    """/monitoring/email báo số email đang chờ và tuổi email chờ lâu nhất"""
+    print("📊 Đang kiểm tra số liệu hàng đợi...")
+    queue_reminders(5, "waiting")
+    response = client.get("/api/v1/monitoring/email", headers=admin_headers())
+    assert response.status_code == 200, response.text
+    queue = response.json()["outbox"]["queue"]
+    print(f"   Hàng đợi: {queue}")
+    assert queue["pending"] == 5 and queue["failed"] == 1 and queue["oldest_pending_age_seconds"] >= 0
+    print("✅ Số liệu hàng đợi OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_request_does_not_wait_for_smtp(),
+        test_payment_confirmation_end_to_end(),
+        test_retry_and_dead_letter(),
+        test_concurrent_workers(),
+        test_queue_depth_metrics(),
+    ]
+    smtp_server.shutdown()
+    if all(results):
+        print("🎉 Hàng đợi email hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra template email dùng chung: EmailService một thể hiện cho cả tiến trình,
+template được ghi/biên dịch một lần, bytecode Jinja được lưu cho tiến trình sau,
+bản text được dựng từ template đã biên dịch và tốc độ dựng một lô nhắc nhở.
+
+    python test_email_templates.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CACHE_DIR = tempfile.mkdtemp()
+os.environ["EMAIL_TEMPLATE_CACHE_DIR"] = CACHE_DIR
+
+import app.services.email_service as email_service_module
+from app.services.email_service import EmailService, get_email_service, get_email_templates
+
+ORDERS = [{"parent_email": "ph@example.com", "parent_name": "Phụ huynh A", "student_name": "Học sinh B",
+           "class_name": "5A", "description": "Học phí tháng 9", "amount": 1250000.0, "due_date": "05/09/2026"}]
+
+
+def test_bootstrap_once():
+    """Template được ghi ra đĩa và biên dịch đúng một lần; tạo service không còn chạm đĩa"""
+    print("🧩 Đang kiểm tra nạp template một lần...")
+    service = get_email_service()
+    assert get_email_service() is service
+    assert EmailService().jinja_env is service.jinja_env is get_email_templates()
+
+    calls = []
+    real_ensure, real_makedirs = EmailService._ensure_email_templates, os.makedirs
+    EmailService._ensure_email_templates = staticmethod(lambda: calls.append("ensure"))
+    email_service_module.os.makedirs = lambda *a, **k: calls.append("makedirs")
+    try:
+        started = time.perf_counter()
+        for _ in range(1000):
+            EmailService()
+        elapsed = time.perf_counter() - started
+    finally:
+        EmailService._ensure_email_templates = real_ensure
+        email_service_module.os.makedirs = real_makedirs
+    print(f"   1000 lần tạo EmailService: {elapsed * 1000:.1f}ms, thao tác đĩa: {len(calls)}")
+    assert not calls
+
+    templates = sorted(service.jinja_env.list_templates())
+    assert "payment_reminder.txt" in templates and "password_reset.html" in templates
+    # Đã biên dịch sẵn: get_template lấy từ cache của Environment
+    assert service.jinja_env.get_template("payment_reminder.txt") is service.jinja_env.get_template("payment_reminder.txt")
+    print("✅ Nạp template một lần OK")
+    return True
+
+
+def test_bytecode_cache():
+    """Bytecode được lưu vào EMAIL_TEMPLATE_CACHE_DIR; tiến trình khác nạp lại từ cache"""
+    print("💾 Đang kiểm tra bytecode cache...")
+    cached = [f for f in os.listdir(CACHE_DIR) if f.endswith(".cache")]
+    print(f"   {len(cached)} template trong cache")
+    assert len(cached) == len(get_email_templates().list_templates())
+
+    mtimes = {f: os.path.getmtime(os.path.join(CACHE_DIR, f)) for f in cached}
+    code = "from app.services.email_service import get_email_service; get_email_service()"
+    subprocess.run([sys.executable, "-c", code], check=True, env={**os.environ, "EMAIL_TEMPLATE_CACHE_DIR": CACHE_DIR})
+    assert all(os.path.getmtime(os.path.join(CACHE_DIR, f)) == m for f, m in mtimes.items()), "Tiến trình sau phải dùng lại bytecode"
+    print("✅ Bytecode cache OK")
+    return True
+
+
+def test_text_variants():
+    """Mỗi email có bản text và HTML dựng từ template"""
+    print("📝 Đang kiểm tra bản text...")
+    service = get_email_service()
+    reminder = service.build_payment_reminder("ph@example.com", ORDERS)
+    text, html = (part.get_payload(decode=True).decode() for part in reminder.get_payload())
+    assert "Kính gửi Phụ huynh A" in text and "Học sinh B (5A): Học phí tháng 9, 1,250,000 VNĐ, hạn 05/09/2026" in text
+    assert "<td>1,250,000 VNĐ</td>" in html and "Trường Tiểu học ABC" in html
+
+    reset = service.build_password_reset("ph@example.com", "Phụ huynh A", "http://localhost/reset?token=abc")
+    text, html = (part.get_payload(decode=True).decode() for part in reset.get_payload())
+    assert "http://localhost/reset?token=abc" in text and 'href="http://localhost/reset?token=abc"' in html
+
+    confirmation = service.build_payment_confirmation("ph@example.com", "Phụ huynh A", {
+        "payment_code": "TXN-1", "amount": 300000.0, "student_name": "Học sinh B", "description": "Học phí", "paid_at": None
+    })
+    text = confirmation.get_payload()[0].get_payload(decode=True).decode()
+    assert "Mã giao dịch: TXN-1" in text and "300,000 VNĐ" in text and "Thời gian: N/A" in text
+    print("✅ Bản text OK")
+    return True
+
+
+def test_batch_render_speed():
+    """Dựng một lô 2000 email nhắc nhở chỉ còn chi phí thay biến"""
+    print("⏱️ Đang đo tốc độ dựng lô nhắc nhở...")
+    service = get_email_service()
+    started = time.perf_counter()
+    for i in range(2000):
+        service.build_payment_reminder(f"parent{i}@example.com", ORDERS)
+    elapsed = time.perf_counter() - started
+    print(f"   2000 email: {elapsed:.2f}s ({2000 / elapsed:.0f} email/giây)")
+    print("✅ Tốc độ dựng lô OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_bootstrap_once(),
+        test_bytecode_cache(),
+        test_text_variants(),
+        test_batch_render_speed(),
+    ]
+    if all(results):
+        print("🎉 Template email hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra phân trang keyset (cursor), các chế độ đếm tổng và xuất file stream
+Chạy trên SQLite tạm
+
+    python test_pagination.py
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "pagination.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("PAGINATION_COUNT_CAP", "10")
+os.environ.setdefault("MAX_PAGE_SIZE", "20")
+os.environ.setdefault("EXPORT_BATCH_SIZE", "4")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.main import app
+from app.database import engine, SessionLocal
+from app.models import User, Student, UserRole
+
+client = TestClient(app)
+STUDENT_COUNT = 23
+
+
+@contextmanager
+def capture_student_queries():
+    """Ghi lại các câu SELECT trên bảng students"""
+    statements = []
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM students" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_execute)
+
+
+def seed():
+    db = SessionLocal()
+    try:
+        parent = User(name="Phụ huynh", email="pagination@example.com", role=UserRole.PARENT, hashed_password="x")
+        db.add(parent)
+        db.add_all([
+            Student(parent=parent, name=f"Học sinh {i}", student_code=f"HS{i:03d}", class_name="1A")
+            for i in range(STUDENT_COUNT)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    response = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"})
+    return {"Authorization": f"Bearer {response.json()['data']['access_token']}"}
+
+
+def test_keyset_walk(headers):
+    """Duyệt hết danh sách bằng cursor: không trùng, không sót, id giảm dần, tìm theo id"""
+    print("📜 Đang kiểm tra phân trang keyset...")
+    seen, cursor, pages = [], None, 0
+    with capture_student_queries() as statements:
+        while True:
+            params = {"limit": 5, "count": "none"}
+            params.update({"after": cursor} if cursor else {"keyset": "true"})
+            response = client.get("/api/v1/students/", params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            body = response.json()
+            seen += [s["id"] for s in body["data"]]
+            pages += 1
+            assert body["meta"]["total"] is None and body["meta"]["page"] is None
+            assert body["meta"]["has_prev"] == (cursor is not None)
+            cursor = body["meta"].get("next_cursor")
+            if not body["meta"]["has_next"]:
+                assert cursor is None
+                break
+
+    print(f"   {pages} trang, {len(seen)} học sinh, {len(statements)} truy vấn")
+    assert len(seen) == STUDENT_COUNT and len(set(seen)) == STUDENT_COUNT
+    assert seen == sorted(seen, reverse=True)
+    assert len(statements) == pages, "count=none vẫn chạy COUNT"
+    # Từ trang 2 trở đi tìm theo id < cursor thay vì bỏ qua N dòng
+    assert all("students.id < ?" in s for s in statements[1:]), "Trang keyset phải tìm theo id"
+
+    print("✅ Phân trang keyset OK")
+    return True
+
+
+def test_count_modes(headers):
+    """exact đếm đủ, estimate dừng ở PAGINATION_COUNT_CAP, none bỏ đếm"""
+    print("🔢 Đang kiểm tra chế độ đếm tổng...")
+    meta = client.get("/api/v1/students/", params={"limit": 5}, headers=headers).json()["meta"]
+    assert meta["total"] == STUDENT_COUNT and meta["total_pages"] == 5 and meta["has_next"]
+    assert meta["total_is_estimate"] is False and meta["next_cursor"] is None
+
+    meta = client.get("/api/v1/students/", params={"limit": 5, "count": "estimate"}, headers=headers).json()["meta"]
+    assert meta["total"] == 10 and meta["total_is_estimate"] is True
+
+    meta = client.get("/api/v1/students/", params={"skip": 20, "limit": 5, "count": "none"}, headers=headers).json()["meta"]
+    assert meta["total"] is None and meta["page"] == 5 and not meta["has_next"]
+
+    for params in ({"after": "không-phải-cursor"}, {"count": "all"}):
+        response = client.get("/api/v1/students/", params=params, headers=headers)
+        assert response.status_code in (400, 422), response.text
+
+    for path in ("/api/v1/orders/", "/api/v1/payments/", "/api/v1/invoices/", "/api/v1/users/"):
+        response = client.get(path, params={"keyset": "true", "count": "estimate"}, headers=headers)
+        assert response.status_code == 200, f"{path}: {response.text}"
+
+    print("✅ Chế độ đếm tổng OK")
+    return True
+
+
+def test_typed_items(headers):
+    """Danh sách chỉ trả và chỉ truy vấn các cột của schema response"""
+    print("🧾 Đang kiểm tra response model của danh sách...")
+    statements = []
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    try:
+        users = client.get("/api/v1/users/", headers=headers).json()["data"]
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_execute)
+    assert users and set(users[0]) == {"id", "name", "email", "phone", "role", "is_active", "created_at"}
+    assert not any("hashed_password" in s for s in statements[-1:]), "Danh sách users không được đọc mật khẩu"
+
+    student = client.get("/api/v1/students/", params={"limit": 1}, headers=headers).json()["data"][0]
+    assert set(student) == {"id", "name", "student_code", "class_name", "grade", "user_id", "created_at"}
+
+    print("✅ Response model OK")
+    return True
+
+
+def test_page_size_limit(headers):
+    """limit lớn hơn MAX_PAGE_SIZE bị từ chối"""
+    print("📏 Đang kiểm tra giới hạn kích thước trang...")
+    assert client.get("/api/v1/students/", params={"limit": 20}, headers=headers).status_code == 200
+    for path in ("/api/v1/students/", "/api/v1/orders/", "/api/v1/payments/", "/api/v1/invoices/", "/api/v1/users/"):
+        response = client.get(path, params={"limit": 21}, headers=headers)
+        assert response.status_code == 422, f"{path}: {response.status_code}"
+    print("✅ Giới hạn kích thước trang OK")
+    return True
+
+
+def test_export(headers):
+    """Xuất NDJSON/CSV trả đủ dòng dù vượt MAX_PAGE_SIZE và EXPORT_BATCH_SIZE"""
+    print("📤 Đang kiểm tra xuất file...")
+    response = client.get("/api/v1/students/export", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == STUDENT_COUNT
+    assert [r["id"] for r in rows] == sorted(r["id"] for r in rows)
+    assert rows[0]["student_code"] == "HS000" and rows[0]["class_name"] == "1A"
+
+    response = client.get("/api/v1/students/export", params={"format": "csv", "q": "HS01"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert 'filename="students.csv"' in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text.lstrip("\ufeff"))))
+    assert rows[0][:3] == ["id", "student_code", "name"]
+    assert len(rows) == 1 + 10, f"{len(rows)} dòng"
+
+    for path in ("/api/v1/orders/export", "/api/v1/payments/export", "/api/v1/invoices/export"):
+        for fmt in ("ndjson", "csv"):
+            response = client.get(path, params={"format": fmt}, headers=headers)
+            assert response.status_code == 200, f"{path}: {response.text}"
+    assert client.get("/api/v1/students/export", params={"format": "xlsx"}, headers=headers).status_code == 422
+
+    print("✅ Xuất file OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    headers = seed()
+    results = [
+        test_keyset_walk(headers),
+        test_count_modes(headers),
+        test_typed_items(headers),
+        test_page_size_limit(headers),
+        test_export(headers),
+    ]
+    if all(results):
+        print("🎉 Phân trang hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra pool hash mật khẩu: giới hạn số luồng bcrypt, hàng đợi có giới hạn,
+và tự hash lại mật khẩu khi đăng nhập sau khi đổi BCRYPT_ROUNDS. Chạy trên SQLite tạm
+
+    python test_password_hashing.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "password_hashing.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("BCRYPT_ROUNDS", "5")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "2")
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from passlib.hash import bcrypt
+
+from app.main import app
+from app.database import SessionLocal
+from app.models import User, UserRole
+from app.core.password_hasher import PasswordHasher
+from app.core.security import password_hasher, verify_password_async, get_password_hash_async
+
+client = TestClient(app)
+
+
+def login(email, password):
+    return client.post("/api/v1/auth/login", json={"email": email, "password": password})
+
+
+def stored_hash(email):
+    db = SessionLocal()
+    try:
+        return db.query(User).filter(User.email == email).first().hashed_password
+    finally:
+        db.close()
+
+
+def test_rehash_on_login():
+    """Hash tạo với cost cũ được thay bằng cost BCRYPT_ROUNDS ở lần đăng nhập đúng đầu tiên"""
+    print("🔁 Đang kiểm tra hash lại khi đăng nhập...")
+    db = SessionLocal()
+    try:
+        db.add(User(name="Admin cũ", email="old-cost@example.com", role=UserRole.ADMIN,
+                    hashed_password=bcrypt.using(rounds=4).hash("Secret@123")))
+        db.commit()
+    finally:
+        db.close()
+
+    assert login("old-cost@example.com", "sai-mat-khau").status_code == 401
+    assert stored_hash("old-cost@example.com").startswith("$2b$04$"), "Sai mật khẩu không được đổi hash"
+
+    assert login("old-cost@example.com", "Secret@123").status_code == 200
+    upgraded = stored_hash("old-cost@example.com")
+    assert upgraded.startswith("$2b$05$"), upgraded
+
+    assert login("old-cost@example.com", "Secret@123").status_code == 200
+    assert stored_hash("old-cost@example.com") == upgraded, "Hash đúng cost không được hash lại"
+
+    print("✅ Hash lại khi đăng nhập OK")
+    return True
+
+
+def test_bounded_workers():
+    """Không quá PASSWORD_HASH_WORKERS tác vụ chạy cùng lúc dù nhiều luồng request gọi đồng thời"""
+    print("🧵 Đang kiểm tra giới hạn số luồng hash...")
+    state = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+
+    threads = [threading.Thread(target=password_hasher.run, args=(work,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"   Tối đa {state['peak']} tác vụ chạy cùng lúc (workers={password_hasher.workers})")
+    assert state["peak"] == password_hasher.workers == 2
+
+    assert asyncio.run(verify_password_async("Admin@123", asyncio.run(get_password_hash_async("Admin@123"))))
+    print("✅ Giới hạn số luồng hash OK")
+    return True
+
+
+def test_queue_limit():
+    """Hàng đợi đầy thì trả 503 ngay thay vì xếp hàng vô hạn"""
+    print("🚦 Đang kiểm tra giới hạn hàng đợi...")
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+    running = hasher.submit(release.wait)
+    queued = hasher.submit(lambda: "xong")
+    time.sleep(0.05)
+    assert hasher.stats()["queue_depth"] == 1 and hasher.stats()["running"] == 1
+
+    try:
+        hasher.submit(lambda: None)
+        raise AssertionError("Hàng đợi đầy phải trả 503")
+    except HTTPException as e:
+        assert e.status_code == 503
+
+    release.set()
+    assert running.result(timeout=1) and queued.result(timeout=1) == "xong"
+    stats = hasher.stats()
+    print(f"   {stats}")
+    assert stats["rejected"] == 1 and stats["completed"] == 2 and stats["queue_depth"] == 0
+    hasher.submit(lambda: None).result(timeout=1)
+
+    print("✅ Giới hạn hàng đợi OK")
+    return True
+
+
+def test_cancelled_while_queued():
+    """Client ngắt kết nối khi hash còn trong hàng đợi: chỗ trong hàng đợi được trả lại"""
+    print("🔌 Đang kiểm tra hủy khi còn trong hàng đợi...")
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+    running = hasher.submit(release.wait)
+
+    async def disconnect():
+        for _ in range(5):
+            task = asyncio.ensure_future(hasher.run_async(lambda: "xong"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    try:
+        asyncio.run(disconnect())
+        stats = hasher.stats()
+        assert stats["queue_depth"] == 0 and stats["rejected"] == 0, stats
+    finally:
+        release.set()
+    assert running.result(timeout=1)
+    assert hasher.submit(lambda: "xong").result(timeout=1) == "xong"
+    print("✅ Hủy khi còn trong hàng đợi OK")
+    return True
+
+
+def test_monitoring():
+    """/monitoring/auth có số liệu hàng đợi hash"""
+    headers = {"Authorization": f"Bearer {login('admin@example.com', 'Admin@123').json()['data']['access_token']}"}
+    stats = client.get("/api/v1/monitoring/auth", headers=headers).json()["password_hashing"]
+    assert stats["bcrypt_rounds"] == 5 and stats["workers"] == 2 and stats["completed"] > 0
+    print(f"📈 {stats}")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_rehash_on_login(),
+        test_bounded_workers(),
+        test_queue_limit(),
+        test_cancelled_while_queued(),
+        test_monitoring(),
+    ]
+    if all(results):
+        print("🎉 Pool hash mật khẩu hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra cache ảnh QR và dùng lại giao dịch QR đang chờ: gọi create-qr nhiều lần cho
+cùng đơn/số tiền trả về cùng payment và không vẽ lại QR; LRU có giới hạn; tầng đĩa dùng chung
+giữa các tiến trình. Chạy trên SQLite tạm
+
+    python test_qr_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "qr_cache.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import SessionLocal
+from app.core.qr_cache import QRImageCache, qr_image_cache
+from app.models import User, Student, Order, Payment, UserRole, OrderStatus, PaymentStatus
+from app.services.payment_service import PaymentGatewayService
+
+client = TestClient(app)
+
+
+def seed():
+    db = SessionLocal()
+    try:
+        parent = User(name="Phụ huynh", email="qr@example.com", role=UserRole.PARENT, hashed_password="x")
+        student = Student(parent=parent, name="Học sinh", student_code="HS-QR", class_name="1A")
+        order = Order(student=student, order_code="ORD-QR", description="Học phí",
+                      amount=Decimal("500000"), status=OrderStatus.PENDING)
+        db.add(order)
+        db.commit()
+        return order.id
+    finally:
+        db.close()
+
+
+def payments(order_id):
+    db = SessionLocal()
+    try:
+        return db.query(Payment).filter(Payment.order_id == order_id).order_by(Payment.id).all()
+    finally:
+        db.close()
+
+
+def create_qr(headers, order_id, amount):
+    response = client.post("/api/v1/payments/create-qr", json={"order_id": order_id, "amount": amount}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_reuse_pending_payment(headers, order_id):
+    """Mở lại trang thanh toán: cùng payment, cùng ảnh QR, không vẽ lại"""
+    print("🔁 Đang kiểm tra dùng lại giao dịch QR...")
+    qr_image_cache.clear()
+    qr_image_cache.reset_stats()
+    started = time.perf_counter()
+    first = create_qr(headers, order_id, 500000)
+    first_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    for _ in range(10):
+        again = create_qr(headers, order_id, 500000)
+        assert again["payment_id"] == first["payment_id"] and again["qr_code_data"] == first["qr_code_data"]
+    repeat_ms = (time.perf_counter() - started) * 100
+    stats = qr_image_cache.stats()
+    print(f"   Lần đầu {first_ms:.1f}ms, mỗi lần gọi lại {repeat_ms:.1f}ms; cache: {stats}")
+    assert len(payments(order_id)) == 1
+    assert stats["renders"] == 1 and stats["hits"] == 10
+
+    # Giao dịch mới và giao dịch được dùng lại báo cùng thời điểm hết hạn (giờ database)
+    from app.services.payment_service import PaymentService
+    db = SessionLocal()
+    try:
+        created = PaymentService(db).create_payment_request(order_id, Decimal("320000"))
+        reused = PaymentService(db).create_payment_request(order_id, Decimal("320000"))
+    finally:
+        db.close()
+    assert reused["payment_id"] == created["payment_id"] and reused["expires_at"] == created["expires_at"]
+
+    # Số tiền khác: giao dịch mới
+    other = create_qr(headers, order_id, 250000)
+    assert other["payment_id"] != first["payment_id"] and len(payments(order_id)) == 3
+    print("✅ Dùng lại giao dịch QR OK")
+    return True
+
+
+def test_expired_or_settled_payment_not_reused(headers, order_id):
+    """Giao dịch quá PAYMENT_QR_TTL_MINUTES hoặc không còn PENDING thì tạo giao dịch mới"""
+    print("⌛ Đang kiểm tra giao dịch hết hạn...")
+    from app.core.config import settings
+    reused = create_qr(headers, order_id, 500000)["payment_id"]
+
+    db = SessionLocal()
+    try:
+        payment = db.get(Payment, reused)
+        payment.created_at = payment.created_at - timedelta(minutes=settings.PAYMENT_QR_TTL_MINUTES + 1)
+        db.commit()
+    finally:
+        db.close()
+    fresh = create_qr(headers, order_id, 500000)["payment_id"]
+    assert fresh != reused
+
+    db = SessionLocal()
+    try:
+        db.get(Payment, fresh).status = PaymentStatus.FAILED
+        db.commit()
+    finally:
+        db.close()
+    newest = create_qr(headers, order_id, 500000)["payment_id"]
+    assert newest not in (reused, fresh) and len(payments(order_id)) == 5
+    print("✅ Giao dịch hết hạn OK")
+    return True
+
+
+def test_lru_bound():
+    """Cache bộ nhớ giữ tối đa max_entries ảnh, bỏ ảnh ít dùng nhất"""
+    print("📦 Đang kiểm tra giới hạn LRU...")
+    gateway = PaymentGatewayService()
+    cache = QRImageCache(max_entries=3)
+    for i in range(5):
+        cache.get_or_render(f"VIETQR|m|TXN-{i}|1000|VND|x", gateway.render_qr_png)
+    cache.get_or_render("VIETQR|m|TXN-4|1000|VND|x", gateway.render_qr_png)
+    cache.get_or_render("VIETQR|m|TXN-0|1000|VND|x", gateway.render_qr_png)
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["renders"] == 6 and stats["hits"] == 1
+    print("✅ Giới hạn LRU OK")
+    return True
+
+
+def test_disk_tier():
+    """Ảnh đã vẽ được ghi ra đĩa theo sha256; tiến trình khác (cache mới) đọc lại thay vì vẽ"""
+    print("💾 Đang kiểm tra tầng đĩa...")
+    gateway = PaymentGatewayService()
+    directory = tempfile.mkdtemp()
+    qr_data = "VIETQR|demo-merchant|TXN-DISK|500000|VND|Học phí"
+    image = QRImageCache(directory=directory).get_or_render(qr_data, gateway.render_qr_png)
+
+    import hashlib
+    key = hashlib.sha256(qr_data.encode()).hexdigest()
+    assert os.path.exists(os.path.join(directory, key[:2], f"{key}.png"))
+
+    def fail(_):
+        raise AssertionError("Không được vẽ lại khi đã có trên đĩa")
+
+    other_process = QRImageCache(directory=directory)
+    assert other_process.get_or_render(qr_data, fail) == image
+    assert other_process.stats()["disk_hits"] == 1
+
+    # Thư mục không ghi được: vẫn trả ảnh, chỉ mất tầng đĩa
+    blocked = os.path.join(directory, "blocked")
+    open(blocked, "w").close()
+    assert QRImageCache(directory=blocked).get_or_render(qr_data, gateway.render_qr_png) == image
+    print("✅ Tầng đĩa OK")
+    return True
+
+
+def test_metrics(headers):
+    """/monitoring/qr-cache báo số lần hit và số lần vẽ"""
+    response = client.get("/api/v1/monitoring/qr-cache", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["hits"] >= 10 and response.json()["hit_ratio"] > 0.5
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    order_id = seed()
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    results = [
+        test_reuse_pending_payment(headers, order_id),
+        test_expired_or_settled_payment_not_reused(headers, order_id),
+        test_lru_bound(),
+        test_disk_tier(),
+        test_metrics(headers),
+    ]
+    if all(results):
+        print("🎉 Cache ảnh QR hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
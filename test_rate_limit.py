@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra rate limit (sliding window counter): giới hạn bộ nhớ, xóa IP không hoạt động,
+backend dùng chung giữa nhiều worker (Redis giả lập) và áp dụng cho login/forgot-password/webhook
+
+    python test_rate_limit.py
+"""
+
+import fnmatch
+import os
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "rate_limit.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("LOGIN_RATE_LIMIT", "3")
+os.environ.setdefault("FORGOT_PASSWORD_RATE_LIMIT", "2")
+os.environ.setdefault("WEBHOOK_RATE_LIMIT", "2")
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core.rate_limit import (
+    InMemoryRateLimitBackend, RedisRateLimitBackend, RateLimiter, limiter, _sliding_window
+)
+
+client = TestClient(app)
+
+
+class FakeRedis:
+    """Client giả lập các lệnh Redis mà RedisRateLimitBackend sử dụng"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        return str(value).encode("utf-8") if value is not None else None
+
+    def incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+        return self.data[key]
+
+    def decr(self, key):
+        self.data[key] = self.data.get(key, 0) - 1
+        return self.data[key]
+
+    def expire(self, key, seconds):
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+def allowed(rate_limiter, identity, limit, window):
+    try:
+        rate_limiter.check("test", identity, limit, window)
+        return True
+    except HTTPException as e:
+        assert e.status_code == 429 and int(e.headers["Retry-After"]) >= 1
+        return False
+
+
+def test_sliding_window():
+    """Cửa sổ trước được tính theo tỷ lệ còn chồng lên cửa sổ trượt"""
+    print("🪟 Đang kiểm tra công thức sliding window...")
+    assert _sliding_window(current=0, previous=0, elapsed=0, window=60, limit=1) == 0
+    assert _sliding_window(current=1, previous=0, elapsed=10, window=60, limit=1) == 50
+    # 10 request ở cửa sổ trước, mới qua 1/2 cửa sổ: ước tính 5 + 4 = 9, thêm 1 vẫn <= 10
+    assert _sliding_window(current=4, previous=10, elapsed=30, window=60, limit=10) == 0
+    # Ước tính 5 + 5 = 10: phải chờ phần cửa sổ trước giảm bớt 1 request (6 giây)
+    assert abs(_sliding_window(current=5, previous=10, elapsed=30, window=60, limit=10) - 6) < 1e-6
+    print("✅ Công thức sliding window OK")
+    return True
+
+
+def test_memory_backend():
+    """Chặn khi vượt giới hạn, bộ nhớ bị chặn trên và IP không hoạt động được xóa"""
+    print("🧮 Đang kiểm tra backend trong bộ nhớ...")
+    backend = InMemoryRateLimitBackend(max_keys=5)
+    rate_limiter = RateLimiter(backend)
+
+    assert [allowed(rate_limiter, "1.1.1.1", 3, 60) for _ in range(4)] == [True, True, True, False]
+    assert allowed(rate_limiter, "2.2.2.2", 3, 60), "Mỗi IP có bộ đếm riêng"
+
+    for i in range(20):
+        allowed(rate_limiter, f"10.0.0.{i}", 3, 60)
+    assert len(backend) == 5, f"Số key phải bị giới hạn, hiện có {len(backend)}"
+
+    idle = InMemoryRateLimitBackend()
+    idle.hit("test:idle", 3, 1)
+    time.sleep(2.1)
+    idle.hit("test:active", 3, 1)
+    assert len(idle) == 1, "IP không hoạt động phải bị xóa"
+
+    stats = rate_limiter.stats()
+    print(f"   {stats}")
+    assert stats["scopes"]["test"]["rejected"] >= 1 and stats["tracked_keys"] == 5
+    print("✅ Backend trong bộ nhớ OK")
+    return True
+
+
+def test_shared_backend():
+    """Hai worker dùng chung backend Redis thì giới hạn không bị nhân đôi"""
+    print("🔗 Đang kiểm tra backend dùng chung...")
+    redis = FakeRedis()
+    worker_1 = RateLimiter(RedisRateLimitBackend(redis))
+    worker_2 = RateLimiter(RedisRateLimitBackend(redis))
+
+    results = [allowed(worker, "3.3.3.3", 4, 60) for worker in (worker_1, worker_2) * 3]
+    assert results.count(True) == 4, results
+    assert results[-2:] == [False, False]
+
+    worker_1.reset()
+    assert not redis.data and allowed(worker_2, "3.3.3.3", 4, 60)
+    print("✅ Backend dùng chung OK")
+    return True
+
+
+def test_endpoints():
+    """login, forgot-password và webhook trả 429 khi vượt giới hạn"""
+    print("🚦 Đang kiểm tra rate limit trên endpoint...")
+    limiter.reset()
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    codes = [client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "sai"}).status_code for _ in range(3)]
+    assert codes == [401, 401, 429], codes
+
+    codes = [client.post("/api/v1/auth/forgot-password", json={"email": "nobody@example.com"}).status_code for _ in range(3)]
+    assert codes == [200, 200, 429], codes
+
+    codes = [client.post("/api/v1/payments/webhook", json={}, headers=headers).status_code for _ in range(3)]
+    assert codes[-1] == 429 and 429 not in codes[:2], codes
+    assert "retry-after" in client.post("/api/v1/payments/webhook", json={}, headers=headers).headers
+
+    stats = client.get("/api/v1/monitoring/rate-limit", headers=headers).json()
+    print(f"   {stats}")
+    assert stats["scopes"]["login"] == {"allowed": 3, "rejected": 1, "errors": 0}
+    print("✅ Rate limit trên endpoint OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_sliding_window(),
+        test_memory_backend(),
+        test_shared_backend(),
+        test_endpoints(),
+    ]
+    if all(results):
+        print("🎉 Rate limit hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra định tuyến đọc sang read replica
+Primary và replica là hai file SQLite tạm khác nhau để biết request đọc từ đâu
+
+    python test_read_replica.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PRIMARY_DIR = tempfile.mkdtemp()
+REPLICA_DIR = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(PRIMARY_DIR, 'primary.db')}")
+os.environ.setdefault("DATABASE_REPLICA_URL", f"sqlite:///{os.path.join(REPLICA_DIR, 'replica.db')}")
+os.environ.setdefault("READ_YOUR_WRITES_SECONDS", "1")
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.main import app
+from app.database import Base, replica_engine, ReplicaSessionLocal
+from app.core.read_routing import read_router
+from app.models import User, Student, UserRole
+
+client = TestClient(app)
+
+
+def seed_replica():
+    """Replica có một học sinh không tồn tại ở primary"""
+    Base.metadata.create_all(bind=replica_engine)
+    db = sessionmaker(bind=replica_engine)()
+    try:
+        parent = User(name="PH replica", email="replica@example.com", role=UserRole.PARENT, hashed_password="x")
+        db.add_all([parent, Student(parent=parent, name="Chỉ có ở replica", student_code="HS-REPLICA", class_name="1A")])
+        db.commit()
+    finally:
+        db.close()
+
+
+def student_codes(headers):
+    response = client.get("/api/v1/students/", headers=headers)
+    assert response.status_code == 200, response.text
+    return {s["student_code"] for s in response.json()["data"]}
+
+
+def test_read_routing():
+    """Đọc từ replica, đọc từ primary ngay sau khi ghi, quay lại replica khi hết thời gian"""
+    print("🔀 Đang kiểm tra định tuyến đọc...")
+    seed_replica()
+    login = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"})
+    headers = {"Authorization": f"Bearer {login.json()['data']['access_token']}"}
+
+    assert "HS-REPLICA" in student_codes(headers), "Danh sách học sinh phải đọc từ replica"
+
+    parent = client.post("/api/v1/auth/register", json={
+        "name": "PH primary", "email": "primary@example.com", "phone": "0900000000",
+        "password": "Secret@123", "role": "parent"
+    }).json()["data"]
+    response = client.post("/api/v1/students/", headers=headers, json={
+        "name": "Học sinh mới", "student_code": "HS-PRIMARY", "class_name": "1A", "user_id": parent["id"]
+    })
+    assert response.status_code == 200, response.text
+
+    codes = student_codes(headers)
+    assert "HS-PRIMARY" in codes and "HS-REPLICA" not in codes, "Ngay sau khi ghi phải đọc từ primary"
+
+    time.sleep(1.2)
+    assert "HS-REPLICA" in student_codes(headers), "Hết thời gian read-your-writes phải đọc lại từ replica"
+
+    stats = read_router.stats()
+    print(f"   {stats}")
+    assert stats["replica_reads"] == 2 and stats["primary_reads_recent_write"] == 1
+
+    print("✅ Định tuyến đọc OK")
+    return headers
+
+
+def test_replica_fallback(headers):
+    """Replica không kết nối được thì đọc từ primary, không lỗi request"""
+    print("🩺 Đang kiểm tra fallback khi replica lỗi...")
+    replica_engine.dispose()
+    shutil.rmtree(REPLICA_DIR)
+
+    codes = student_codes(headers)
+    assert "HS-PRIMARY" in codes and "HS-REPLICA" not in codes
+
+    stats = read_router.stats()
+    print(f"   {stats}")
+    assert stats["replica_failures"] == 1 and not stats["replica_available"]
+
+    # Trong thời gian chờ thử lại, không kết nối lại replica
+    student_codes(headers)
+    assert read_router.stats()["replica_failures"] == 1
+
+    # Session replica không cho phép ghi
+    db = ReplicaSessionLocal()
+    try:
+        db.add(User(name="x", email="x@example.com", role=UserRole.PARENT, hashed_password="x"))
+        db.flush()
+        raise AssertionError("Replica session phải từ chối ghi")
+    except RuntimeError:
+        pass
+    finally:
+        db.close()
+
+    print("✅ Fallback OK")
+    return True
+
+
+def test_shared_marker():
+    """Hai worker dùng chung backend: ghi ở worker này thì worker kia cũng đọc từ primary"""
+    print("🤝 Đang kiểm tra đánh dấu ghi dùng chung giữa các worker...")
+    from app.core.cache import InMemoryCacheBackend
+    from app.core.read_routing import ReadRouter
+    shared = InMemoryCacheBackend()  # Thay cho Redis dùng chung
+    worker_a = ReadRouter(retry_seconds=30, read_your_writes_seconds=1, backend=shared)
+    worker_b = ReadRouter(retry_seconds=30, read_your_writes_seconds=1, backend=shared)
+    worker_a.mark_write("admin@example.com")
+    assert worker_b.wrote_recently("admin@example.com") and not worker_b.wrote_recently("other@example.com")
+    time.sleep(1.1)
+    assert not worker_b.wrote_recently("admin@example.com")
+
+    class DownBackend(InMemoryCacheBackend):
+        def get(self, key):
+            raise ConnectionError("redis down")
+
+    # Backend lỗi: đọc từ primary (luôn nhất quán)
+    assert ReadRouter(retry_seconds=30, read_your_writes_seconds=1, backend=DownBackend()).wrote_recently("x")
+    print("✅ Đánh dấu ghi dùng chung OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    headers = test_read_routing()
+    results = [
+        bool(headers),
+        test_replica_fallback(headers),
+        test_shared_marker(),
+    ]
+    if all(results):
+        print("🎉 Read replica hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
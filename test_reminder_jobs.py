@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra job nhắc nhở quá hạn: endpoint trả job id ngay, job đọc đơn theo luồng và
+gom mỗi phụ huynh một email tổng hợp, nhiều worker xếp email song song qua bộ đệm có giới hạn,
+endpoint tiến độ và chống nhắc trùng trong cửa sổ thời gian. Chạy trên SQLite tạm
+
+    python test_reminder_jobs.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "reminder_jobs.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import SessionLocal
+from app.core.security import create_access_token
+from app.models import (
+    EmailOutbox, JobState, Order, OrderStatus, ReminderJob, ReminderLog, ReminderRecipient, Student, User, UserRole
+)
+from app.core.outbox import utcnow
+from app.services.reminder_service import ReminderEngine, reminder_engine
+
+client = TestClient(app)
+PARENTS = 250
+
+
+def seed():
+    """PARENTS phụ huynh lớp 6A, mỗi người 2 con: 3 đơn quá hạn, 1 đơn chưa đến hạn, 1 đơn đã thanh toán"""
+    db = SessionLocal()
+    try:
+        overdue, upcoming = datetime.now() - timedelta(days=5), datetime.now() + timedelta(days=5)
+        for i in range(PARENTS):
+            parent = User(name=f"PH {i}", email=f"digest{i}@example.com", role=UserRole.PARENT, hashed_password="x")
+            first = Student(parent=parent, name=f"HS {i}a", student_code=f"HS-DG-{i}a", class_name="6A")
+            second = Student(parent=parent, name=f"HS {i}b", student_code=f"HS-DG-{i}b", class_name="6A")
+            for n, (student, status, due) in enumerate([
+                (first, OrderStatus.PENDING, overdue), (first, OrderStatus.PENDING, overdue - timedelta(days=1)),
+                (second, OrderStatus.PENDING, overdue), (second, OrderStatus.PENDING, upcoming),
+                (second, OrderStatus.PAID, overdue),
+            ]):
+                db.add(Order(student=student, order_code=f"ORD-DG-{i}-{n}", description=f"Khoản {n}",
+                             amount=Decimal("100000"), status=status, due_date=due))
+        db.commit()
+    finally:
+        db.close()
+
+
+def login():
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def start_job(headers):
+    response = client.post("/api/v1/orders/reminders?class_name=6A", headers=headers)
+    assert response.status_code == 202, response.text
+    assert response.json()["state"] == "pending"
+    return response.json()["job_id"]
+
+
+def test_job_and_progress(headers):
+    """Endpoint trả job id ngay; job xếp một email tổng hợp cho mỗi phụ huynh; tiến độ đầy đủ"""
+    print("🚀 Đang kiểm tra job nhắc nhở và tiến độ...")
+    started = time.perf_counter()
+    job_id = start_job(headers)
+    print(f"   Endpoint trả lời sau {(time.perf_counter() - started) * 1000:.1f}ms")
+    reminder_engine.wait(job_id, timeout=60)
+    print(f"   Job xong sau {time.perf_counter() - started:.2f}s")
+
+    progress = client.get(f"/api/v1/orders/reminders/{job_id}", headers=headers).json()
+    print(f"   Tiến độ: {progress}")
+    assert progress["state"] == "done" and progress["error"] is None
+    assert progress["parents_total"] == progress["parents_processed"] == progress["parents_queued"] == PARENTS
+    assert progress["orders_total"] == PARENTS * 3 and progress["progress_percent"] == 100.0
+    assert progress["emails"]["pending"] == PARENTS and progress["finished_at"]
+
+    db = SessionLocal()
+    try:
+        emails = db.query(EmailOutbox).filter(EmailOutbox.kind == "payment_reminder").all()
+        assert sorted(e.recipient for e in emails) == sorted(f"digest{i}@example.com" for i in range(PARENTS))
+        logs = db.query(ReminderLog).filter(ReminderLog.job_id == job_id).all()
+        assert len(logs) == PARENTS and all(log.order_count == 3 and log.email_id for log in logs)
+    finally:
+        db.close()
+
+    assert client.get("/api/v1/orders/reminders/999999", headers=headers).status_code == 404
+    print("✅ Job nhắc nhở và tiến độ OK")
+    return True
+
+
+def test_dedup_window(headers):
+    """Phụ huynh vừa được nhắc thì bỏ qua; hết cửa sổ chống trùng thì nhắc lại"""
+    print("🔂 Đang kiểm tra chống nhắc trùng...")
+    job_id = start_job(headers)
+    reminder_engine.wait(job_id, timeout=60)
+    progress = client.get(f"/api/v1/orders/reminders/{job_id}", headers=headers).json()
+    assert progress["state"] == "done" and progress["parents_queued"] == 0 and progress["parents_skipped"] == PARENTS
+
+    # Lùi lần nhắc trước ra ngoài cửa sổ (REMINDER_DEDUP_HOURS) cho 10 phụ huynh
+    db = SessionLocal()
+    try:
+        old = db.query(ReminderRecipient).order_by(ReminderRecipient.user_id).limit(10).all()
+        for recipient in old:
+            recipient.last_reminded_at -= timedelta(hours=reminder_engine.dedup_hours + 1)
+        db.commit()
+    finally:
+        db.close()
+    job_id = start_job(headers)
+    reminder_engine.wait(job_id, timeout=60)
+    progress = client.get(f"/api/v1/orders/reminders/{job_id}", headers=headers).json()
+    assert progress["parents_queued"] == 10 and progress["parents_skipped"] == PARENTS - 10
+    print("✅ Chống nhắc trùng OK")
+    return True
+
+
+def test_bounded_buffer_and_workers():
+    """Luồng đọc không chạy trước quá bộ đệm; các lô được nhiều worker xử lý song song"""
+    print("🧵 Đang kiểm tra bộ đệm và nhóm worker...")
+    lock = threading.Lock()
+    state = {"produced": 0, "dispatched": 0, "ahead": 0, "threads": set()}
+
+    class SlowEngine(ReminderEngine):
+        def digests(self, class_name=None):
+            for batch in super().digests(class_name):
+                with lock:
+                    state["produced"] += 1
+                    state["ahead"] = max(state["ahead"], state["produced"] - state["dispatched"])
+                yield batch
+
+        def dispatch(self, job_id, batch):
+            time.sleep(0.02)
+            with lock:
+                state["dispatched"] += 1
+                state["threads"].add(threading.current_thread().name)
+            return len(batch)
+
+    engine = SlowEngine(SessionLocal, workers=3, batch_size=10, buffer_size=2, dedup_hours=0)
+    db = SessionLocal()
+    try:
+        job_id = engine.submit(db, class_name="6A")
+    finally:
+        db.close()
+    engine.wait(job_id, timeout=60)
+    engine.shutdown()
+    print(f"   {state['produced']} lô, đọc trước tối đa {state['ahead']} lô, {len(state['threads'])} worker")
+    assert state["produced"] == state["dispatched"] == PARENTS // 10
+    # Bộ đệm 2 lô + 3 lô đang xử lý + 1 lô luồng đọc đang chờ đưa vào
+    assert state["ahead"] <= 2 + 3 + 1
+    assert len(state["threads"]) > 1
+    print("✅ Bộ đệm và nhóm worker OK")
+    return True
+
+
+def test_failed_batch():
+    """Một lô lỗi: các lô khác vẫn được xếp, job kết thúc FAILED kèm lỗi"""
+    print("💥 Đang kiểm tra lô lỗi...")
+
+    class FlakyEngine(ReminderEngine):
+        calls = 0
+
+        def dispatch(self, job_id, batch):
+            FlakyEngine.calls += 1
+            if FlakyEngine.calls == 1:
+                raise RuntimeError("mất kết nối")
+            return super().dispatch(job_id, batch)
+
+    engine = FlakyEngine(SessionLocal, workers=1, batch_size=50, dedup_hours=0)
+    db = SessionLocal()
+    try:
+        job_id = engine.submit(db, class_name="6A")
+        engine.wait(job_id, timeout=60)
+        progress = engine.progress(db, job_id)
+    finally:
+        db.close()
+    engine.shutdown()
+    assert progress["state"] == JobState.FAILED.value and "mất kết nối" in progress["error"]
+    assert progress["parents_processed"] == progress["parents_queued"] == PARENTS - 50
+    print("✅ Lô lỗi OK")
+    return True
+
+
+def test_concurrent_engines():
+    """Hai tiến trình (hai engine) chạy job cùng lớp cùng lúc: mỗi phụ huynh chỉ được nhắc một lần"""
+    print("⚔️ Đang kiểm tra hai job chạy song song...")
+    db = SessionLocal()
+    try:
+        overdue = datetime.now() - timedelta(days=3)
+        for i in range(60):
+            parent = User(name=f"PH 7B {i}", email=f"race{i}@example.com", role=UserRole.PARENT, hashed_password="x")
+            student = Student(parent=parent, name=f"HS 7B {i}", student_code=f"HS-RACE-{i}", class_name="7B")
+            db.add(Order(student=student, order_code=f"ORD-RACE-{i}", description="Học phí",
+                         amount=Decimal("100000"), status=OrderStatus.PENDING, due_date=overdue))
+        db.commit()
+    finally:
+        db.close()
+
+    engines = [ReminderEngine(SessionLocal, workers=3, batch_size=5) for _ in range(2)]
+    assert engines[0].owner != engines[1].owner
+    db = SessionLocal()
+    try:
+        job_ids = [engine.submit(db, class_name="7B") for engine in engines]
+    finally:
+        db.close()
+    for engine, job_id in zip(engines, job_ids):
+        engine.wait(job_id, timeout=60)
+        engine.shutdown()
+
+    db = SessionLocal()
+    try:
+        progress = [engines[0].progress(db, job_id) for job_id in job_ids]
+        reminded = db.query(ReminderLog.user_id).filter(ReminderLog.job_id.in_(job_ids)).all()
+    finally:
+        db.close()
+    print(f"   Job 1 xếp {progress[0]['parents_queued']}, job 2 xếp {progress[1]['parents_queued']}")
+    assert all(p["state"] == "done" for p in progress)
+    assert progress[0]["parents_queued"] + progress[1]["parents_queued"] == 60
+    assert len(reminded) == len(set(reminded)) == 60
+    print("✅ Hai job chạy song song OK")
+    return True
+
+
+def test_orphaned_jobs():
+    """Job của tiến trình đã dừng bị đánh dấu FAILED; job đã nhận không chạy lại; job bị hủy khi dừng là FAILED"""
+    print("🧟 Đang kiểm tra job mồ côi...")
+    engine = ReminderEngine(SessionLocal, workers=1, lease_seconds=60)
+    old = utcnow() - timedelta(seconds=120)
+    db = SessionLocal()
+    try:
+        dead_running = ReminderJob(state=JobState.RUNNING, owner="host:1:dead", created_at=old, heartbeat_at=old)
+        dead_pending = ReminderJob(state=JobState.PENDING, owner="host:1:dead", created_at=old)
+        # Tiến trình khác còn sống (job đang chạy có heartbeat mới): job chờ của nó giữ nguyên
+        alive_running = ReminderJob(state=JobState.RUNNING, owner="host:2:alive", created_at=old, heartbeat_at=utcnow())
+        alive_pending = ReminderJob(state=JobState.PENDING, owner="host:2:alive", created_at=old)
+        db.add_all([dead_running, dead_pending, alive_running, alive_pending])
+        db.commit()
+        assert engine.fail_orphans(db) == 2
+        db.expire_all()
+        assert dead_running.state == dead_pending.state == JobState.FAILED and dead_running.error
+        assert alive_running.state == JobState.RUNNING and alive_pending.state == JobState.PENDING
+
+        # Job đã FAILED (hoặc đã được tiến trình khác nhận) thì run() không chạy
+        engine.run(dead_pending.id)
+        db.expire_all()
+        assert dead_pending.state == JobState.FAILED and dead_pending.started_at is None
+        alive_running.state = alive_pending.state = JobState.DONE
+        db.commit()
+    finally:
+        db.close()
+
+    # Dừng tiến trình: job còn chờ trong hàng bị hủy và đánh dấu FAILED
+    started = threading.Event()
+
+    class SlowEngine(ReminderEngine):
+        def _start(self, job_id):
+            started.set()
+            time.sleep(0.3)
+            return super()._start(job_id)
+
+    engine = SlowEngine(SessionLocal, workers=1, dedup_hours=0)
+    db = SessionLocal()
+    try:
+        first = engine.submit(db, class_name="không-có-lớp-này")
+        second = engine.submit(db, class_name="không-có-lớp-này")
+        started.wait(5)
+        engine.shutdown()
+        engine.wait(first, timeout=10)
+        db.expire_all()
+        assert db.get(ReminderJob, first).state == JobState.DONE
+        assert db.get(ReminderJob, second).state == JobState.FAILED
+    finally:
+        db.close()
+    print("✅ Job mồ côi OK")
+    return True
+
+
+def test_parent_forbidden():
+    """Phụ huynh không được tạo hoặc xem job nhắc nhở"""
+    print("🔒 Đang kiểm tra quyền...")
+    db = SessionLocal()
+    try:
+        parent = db.query(User).filter(User.email == "digest0@example.com").one()
+        token = create_access_token({"sub": parent.email, "user_id": parent.id, "role": parent.role.value})
+    finally:
+        db.close()
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/api/v1/orders/reminders", headers=headers).status_code == 403
+    assert client.get("/api/v1/orders/reminders/1", headers=headers).status_code == 403
+    print("✅ Quyền OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    seed()
+    headers = login()
+    results = [
+        test_job_and_progress(headers),
+        test_dedup_window(headers),
+        test_bounded_buffer_and_workers(),
+        test_failed_batch(),
+        test_concurrent_engines(),
+        test_orphaned_jobs(),
+        test_parent_forbidden(),
+    ]
+    reminder_engine.shutdown()
+    if all(results):
+        print("🎉 Job nhắc nhở hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
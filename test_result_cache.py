@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra cache kết quả dashboard (LRU + TTL, backend kiểu Redis, xóa cache khi commit)
+Chạy trên SQLite in-memory, không cần server hay Redis thật
+
+    python test_result_cache.py
+"""
+
+import fnmatch
+import os
+import sys
+import time
+from decimal import Decimal
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from app.database import Base, SessionLocal, engine
+from app.models import User, Student, Order, UserRole, OrderStatus
+from app.core.cache import (
+    InMemoryCacheBackend, RedisCacheBackend, ResultCache, invalidate_on_commit
+)
+
+
+class FakeRedis:
+    """Client giả lập các lệnh Redis mà RedisCacheBackend sử dụng"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value.encode("utf-8"), time.monotonic() + ex if ex else None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[key] = (str(value).encode("utf-8"), None)
+        return value
+
+    def scan_iter(self, match="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+def test_lru_and_ttl():
+    """LRU loại bỏ phần tử ít dùng nhất, TTL làm hết hạn phần tử"""
+    print("🧪 Đang kiểm tra LRU + TTL...")
+    backend = InMemoryCacheBackend(max_entries=2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    backend.get("a")
+    backend.set("c", 3, ttl=60)
+    assert backend.get("b") is None, "Phần tử ít dùng nhất phải bị loại"
+    assert backend.get("a") == 1 and backend.get("c") == 3
+
+    backend.set("short", 1, ttl=1)
+    time.sleep(1.1)
+    assert backend.get("short") is None, "Phần tử phải hết hạn sau TTL"
+
+    # Bộ đếm thế hệ không bị LRU loại bỏ
+    backend.incr("__generation__:x")
+    for i in range(5):
+        backend.set(f"k{i}", i, ttl=60)
+    assert backend.get("__generation__:x") == 1
+
+    print("✅ LRU + TTL OK")
+    return True
+
+
+def test_result_cache(backend):
+    """Hit/miss và invalidate theo namespace"""
+    print(f"🧪 Đang kiểm tra ResultCache với {type(backend).__name__}...")
+    cache = ResultCache(backend, default_ttl=60)
+    calls = {"count": 0}
+
+    def compute():
+        calls["count"] += 1
+        return {"value": calls["count"]}
+
+    key = cache.make_key("revenue", group_by="day", start_date="2024-01-01")
+    assert key == cache.make_key("revenue", start_date="2024-01-01", group_by="day")
+
+    assert cache.get_or_set("dashboard", key, compute) == {"value": 1}
+    assert cache.get_or_set("dashboard", key, compute) == {"value": 1}
+    cache.invalidate("dashboard")
+    assert cache.get_or_set("dashboard", key, compute) == {"value": 2}
+
+    # Kết quả rỗng (service lỗi) không được cache
+    cache.get_or_set("dashboard", "empty", lambda: {})
+    assert cache.get_or_set("dashboard", "empty", compute) == {"value": 3}
+
+    stats = cache.stats()["namespaces"]["dashboard"]
+    assert stats["hits"] == 1 and stats["misses"] == 4 and stats["invalidations"] == 1
+    print(f"   {stats}")
+
+    print("✅ ResultCache OK")
+    return True
+
+
+def test_invalidate_on_commit():
+    """Commit thay đổi orders phải xóa cache; rollback và savepoint thì không"""
+    print("🧪 Đang kiểm tra xóa cache khi commit...")
+    Base.metadata.create_all(bind=engine)
+    cache = ResultCache(InMemoryCacheBackend(), default_ttl=60)
+    invalidate_on_commit(cache, "test", Order)
+    db = SessionLocal()
+    try:
+        parent = User(name="PH", email="ph@cache.local", role=UserRole.PARENT, hashed_password="x")
+        student = Student(parent=parent, name="HS", student_code="HS-CACHE", class_name="1A")
+        db.add_all([parent, student])
+        db.commit()
+
+        def invalidations():
+            return cache.stats()["namespaces"].get("test", {}).get("invalidations", 0)
+
+        assert invalidations() == 0, "Commit không liên quan đến orders không được xóa cache"
+
+        order = Order(student=student, order_code="ORD-CACHE", description="Học phí",
+                      amount=Decimal("100000"), status=OrderStatus.PENDING)
+        db.add(order)
+        db.flush()
+        assert invalidations() == 0, "Chưa commit thì chưa xóa cache"
+        db.commit()
+        assert invalidations() == 1
+
+        order.status = OrderStatus.PAID
+        db.flush()
+        db.rollback()
+        db.commit()
+        assert invalidations() == 1, "Rollback không được xóa cache"
+
+        order.status = OrderStatus.PAID
+        with db.begin_nested():
+            db.flush()
+        assert invalidations() == 1, "Release savepoint chưa phải commit thật"
+        db.commit()
+        assert invalidations() == 2
+    finally:
+        db.close()
+
+    print("✅ Xóa cache khi commit OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_lru_and_ttl(),
+        test_result_cache(InMemoryCacheBackend()),
+        test_result_cache(RedisCacheBackend(FakeRedis())),
+        test_invalidate_on_commit(),
+    ]
+    if all(results):
+        print("🎉 Cache hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
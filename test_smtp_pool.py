@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra pool phiên SMTP của EmailService trên một SMTP server giả lập cục bộ
+(thay cho aiosmtpd): tái sử dụng kết nối, gửi theo lô, kết nối lại khi server ngắt,
+và số liệu tốc độ gửi. Chạy trên SQLite tạm
+
+    python test_smtp_pool.py
+"""
+
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    """SMTP server tối giản: nhận thư vào bộ nhớ, đếm kết nối, có thể ngắt mọi phiên"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.refused = set()
+        self.close_at = None  # trả 421 và đóng phiên khi nhận MAIL của thư thứ close_at + 1
+        self.sockets = []
+        self.lock = threading.Lock()
+
+    def drop_all(self):
+        """Ngắt mọi phiên đang mở (giống server đóng kết nối idle)"""
+        with self.lock:
+            sockets, self.sockets = self.sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(2)
+            except OSError:
+                pass
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            server.sockets.append(self.connection)
+        self.reply("220 stand-in ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.reply("250-stand-in")
+                self.reply("250 8BITMIME")
+            elif verb in ("HELO", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "MAIL":
+                if server.close_at is not None and len(server.messages) == server.close_at:
+                    server.close_at = None
+                    self.reply("421 Service closing transmission channel")
+                    return
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip().strip("<>")
+                if address in server.refused:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    server.messages.extend(recipients)
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+smtp_server = StandInSMTPServer()
+threading.Thread(target=smtp_server.serve_forever, daemon=True).start()
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "smtp_pool.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ["SMTP_SERVER"] = "127.0.0.1"
+os.environ["SMTP_PORT"] = str(smtp_server.server_address[1])
+os.environ["SMTP_USE_TLS"] = "false"
+os.environ["SMTP_USERNAME"] = ""
+os.environ["SENDER_EMAIL"] = "school@example.com"
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import SessionLocal
+from app.models import User, Student, Order, UserRole, OrderStatus
+from app.services.email_service import EmailService
+from app.services.email_worker import email_worker
+from app.services.reminder_service import reminder_engine
+
+client = TestClient(app)
+
+
+def confirmation(i):
+    return {
+        "recipient_email": f"parent{i}@example.com",
+        "recipient_name": f"Phụ huynh {i}",
+        "payment_data": {"payment_code": f"TXN-{i}", "amount": Decimal("100000"), "student_name": "Học sinh",
+                         "description": "Học phí", "paid_at": "01/09/2026 08:00"}
+    }
+
+
+def reset(pool):
+    pool.close()
+    pool.reset_stats()
+    with smtp_server.lock:
+        smtp_server.messages.clear()
+        smtp_server.connections = 0
+        smtp_server.refused.clear()
+        smtp_server.close_at = None
+
+
+def test_connection_reuse():
+    """Nhiều email liên tiếp (kể cả từ các EmailService khác nhau) dùng chung một kết nối"""
+    print("🔌 Đang kiểm tra tái sử dụng kết nối...")
+    pool = EmailService().smtp_pool
+    reset(pool)
+    for i in range(5):
+        assert EmailService().send_payment_confirmation(**confirmation(i))
+    stats = pool.stats()
+    print(f"   5 email: {smtp_server.connections} kết nối, {stats['reused']} lần tái sử dụng")
+    assert len(smtp_server.messages) == 5
+    assert smtp_server.connections == 1 and stats["connections_opened"] == 1 and stats["reused"] == 4
+    print("✅ Tái sử dụng kết nối OK")
+    return True
+
+
+def test_reconnect():
+    """Server ngắt phiên đang mở: lần gửi tiếp theo tự kết nối lại, không mất email"""
+    print("🔁 Đang kiểm tra kết nối lại...")
+    service = EmailService()
+    reset(service.smtp_pool)
+    assert service.send_payment_confirmation(**confirmation(1))
+    smtp_server.drop_all()
+    assert service.send_payment_confirmation(**confirmation(2))
+    stats = service.smtp_pool.stats()
+    assert smtp_server.messages == ["parent1@example.com", "parent2@example.com"]
+    assert stats["reconnects"] == 1 and stats["connections_opened"] == 2 and stats["messages_failed"] == 0
+
+    # Kết nối rỗi quá lâu được thay trước khi gửi
+    service.smtp_pool.max_idle_seconds = 0
+    assert service.send_payment_confirmation(**confirmation(3))
+    service.smtp_pool.max_idle_seconds = 60
+    assert service.smtp_pool.stats()["connections_opened"] == 3 and len(smtp_server.messages) == 3
+    print("✅ Kết nối lại OK")
+    return True
+
+
+def test_batch_send():
+    """Gửi nhắc nhở theo lô qua một phiên; người nhận bị từ chối không làm hỏng cả lô; ngắt giữa lô thì gửi tiếp"""
+    print("📦 Đang kiểm tra gửi theo lô...")
+    service = EmailService()
+    pool = service.smtp_pool
+    reset(pool)
+    emails = [f"parent{i}@example.com" for i in range(200)]
+    orders = [{"parent_email": e, "parent_name": "PH", "student_name": "HS", "class_name": "1A",
+               "description": "Học phí", "amount": 100000.0, "due_date": "01/09/2026"} for e in emails]
+    smtp_server.refused.add("parent7@example.com")
+
+    result = service.send_payment_reminders(emails, orders)
+    print(f"   Lô 200 email: {result['messages_per_second']} email/giây, {smtp_server.connections} kết nối")
+    assert result["size"] == 200 and result["sent"] == 199 and result["failed"] == 1
+    assert result["errors"][0][0] == "parent7@example.com"
+    # SMTP_MAX_MESSAGES_PER_CONNECTION=100: 200 thư dùng 2 phiên
+    assert len(smtp_server.messages) == 199 and smtp_server.connections == 2
+
+    # Server cắt phiên theo số thư tối đa: pool tự đổi phiên giữa lô
+    reset(pool)
+    pool.max_messages_per_connection = 50
+    try:
+        result = service.send_payment_reminders(emails, orders)
+    finally:
+        pool.max_messages_per_connection = 100
+    assert result["sent"] == 200 and smtp_server.connections == 4
+
+    # Server đóng phiên giữa lô (421): kết nối lại và gửi tiếp, không mất/trùng thư
+    reset(pool)
+    smtp_server.close_at = 30
+    result = service.send_payment_reminders(emails[:60], orders)
+    assert result["sent"] == 60 and result["failed"] == 0 and result["reconnects"] == 1
+    assert smtp_server.messages == emails[:60] and smtp_server.connections == 2
+
+    stats = pool.stats()
+    assert stats["batches"] == 1 and stats["last_batch"]["sent"] == 60 and stats["batch_messages_per_second"] > 0
+    print("✅ Gửi theo lô OK")
+    return True
+
+
+def test_server_down():
+    """Không kết nối được server: lô thất bại nhanh, hàm cũ trả False thay vì ném lỗi"""
+    print("🚫 Đang kiểm tra server không truy cập được...")
+    service = EmailService()
+    pool = service.smtp_pool
+    reset(pool)
+    pool.port, real_port = 1, pool.port
+    try:
+        result = service.send_payment_reminders(["a@example.com", "b@example.com"], [
+            {"parent_email": "a@example.com", "student_name": "HS", "class_name": "1A", "description": "x", "amount": 1.0, "due_date": "-"},
+            {"parent_email": "b@example.com", "student_name": "HS", "class_name": "1A", "description": "x", "amount": 1.0, "due_date": "-"},
+        ])
+        assert result["sent"] == 0 and result["failed"] == 2
+        assert service.send_payment_confirmation(**confirmation(1)) is False
+    finally:
+        pool.port = real_port
+    print("✅ Server không truy cập được OK")
+    return True
+
+
+def test_reminders_endpoint():
+    """/orders/reminders xếp email cho mọi phụ huynh; worker gửi qua một kết nối"""
+    print("⏰ Đang kiểm tra endpoint nhắc nhở...")
+    db = SessionLocal()
+    try:
+        for i in range(30):
+            parent = User(name=f"PH {i}", email=f"reminder{i}@example.com", role=UserRole.PARENT, hashed_password="x")
+            student = Student(parent=parent, name=f"HS {i}", student_code=f"HS-RM-{i}", class_name="3A")
+            db.add(Order(student=student, order_code=f"ORD-RM-{i}", description="Học phí", amount=Decimal("100000"),
+                         status=OrderStatus.PENDING, due_date=datetime.now() - timedelta(days=3)))
+        db.commit()
+    finally:
+        db.close()
+
+    reset(EmailService().smtp_pool)
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post("/api/v1/orders/reminders?class_name=3A", headers=headers)
+    assert response.status_code == 202, response.text
+    reminder_engine.wait(response.json()["job_id"])
+    assert not smtp_server.messages, "Job chỉ xếp email vào hàng đợi"
+
+    assert email_worker.run_once() == 30
+    assert len(smtp_server.messages) == 30 and smtp_server.connections == 1
+
+    stats = client.get("/api/v1/monitoring/email", headers=headers).json()
+    assert stats["smtp_pools"][0]["messages_sent"] == 30 and stats["smtp_pools"][0]["connections_opened"] == 1
+    assert stats["outbox"]["queue"]["done"] == 30
+    print("✅ Endpoint nhắc nhở OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    results = [
+        test_connection_reuse(),
+        test_reconnect(),
+        test_batch_send(),
+        test_server_down(),
+        test_reminders_endpoint(),
+    ]
+    smtp_server.shutdown()
+    if all(results):
+        print("🎉 Pool SMTP hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
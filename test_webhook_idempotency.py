@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra webhook thanh toán idempotent: gửi lại và gửi đồng thời cùng một sự kiện
+chỉ được ghi vào outbox và xử lý (cập nhật đơn hàng, tổng hợp, email xác nhận) đúng một lần. Chạy trên SQLite tạm
+
+    python test_webhook_idempotency.py
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+from decimal import Decimal
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "webhook.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("WEBHOOK_RATE_LIMIT", "1000")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+
+from app.main import app
+import app.database as database
+from app.database import SessionLocal
+from app.models import EmailOutbox, User, Student, Order, Payment, DailyRollup, WebhookEvent, UserRole, OrderStatus, PaymentStatus
+from app.services.payment_service import PaymentService, WebhookResult
+from app.services.webhook_worker import webhook_worker
+
+client = TestClient(app)
+
+
+def sent_emails():
+    """Người nhận các email xác nhận thanh toán worker đã xếp vào hàng đợi"""
+    db = SessionLocal()
+    try:
+        return db.scalars(
+            select(EmailOutbox.recipient).where(EmailOutbox.kind == "payment_confirmation").order_by(EmailOutbox.id)
+        ).all()
+    finally:
+        db.close()
+
+
+def seed(codes):
+    db = SessionLocal()
+    try:
+        parent = User(name="Phụ huynh", email="webhook@example.com", role=UserRole.PARENT, hashed_password="x")
+        student = Student(parent=parent, name="Học sinh", student_code="HS-WH", class_name="1A")
+        for i, code in enumerate(codes):
+            order = Order(student=student, order_code=f"ORD-WH-{i}", description="Học phí",
+                          amount=Decimal("500000"), status=OrderStatus.PENDING)
+            db.add(Payment(order=order, payment_code=code, amount=Decimal("500000"), status=PaymentStatus.PENDING))
+        db.add_all([parent, student])
+        db.commit()
+    finally:
+        db.close()
+
+
+def signed(body):
+    signature = hmac.new(b"dev-secret", json.dumps(body, separators=(",", ":")).encode(), hashlib.sha256).hexdigest()
+    return {"X-Signature": signature}
+
+
+def paid_count():
+    db = SessionLocal()
+    try:
+        return sum(r.payment_count for r in db.query(DailyRollup).filter(DailyRollup.status == OrderStatus.PAID))
+    finally:
+        db.close()
+
+
+def test_retry_is_acknowledged(headers):
+    """Gửi lại sự kiện đã xử lý: trả duplicate, không gửi email lần hai, chỉ một truy vấn"""
+    print("🔁 Đang kiểm tra webhook gửi lại...")
+    body = {"transaction_id": "TXN-RETRY", "status": "success"}
+    response = client.post("/api/v1/payments/webhook", json=body, headers={**headers, **signed(body)})
+    assert response.status_code == 200 and response.json()["result"] == "queued", response.text
+    assert webhook_worker.run_once() == 1
+    assert len(sent_emails()) == 1 and sent_emails()[0] == "webhook@example.com"
+
+    statements = []
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if "users" not in statement:
+            statements.append(statement)
+
+    # Endpoint async (ASYNC_DB_ENABLED) chạy trên engine riêng
+    engine = database.async_engine.sync_engine if database.async_engine is not None else database.engine
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    try:
+        response = client.post("/api/v1/payments/webhook", json=body, headers={**headers, **signed(body)})
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_execute)
+    assert response.status_code == 200 and response.json()["result"] == "duplicate", response.text
+    print(f"   Lần gửi lại: {len(statements)} truy vấn")
+    assert len(statements) == 1 and "webhook_events" in statements[0]
+    assert webhook_worker.run_once() == 0
+    assert len(sent_emails()) == 1, "Webhook gửi lại không được gửi email lần hai"
+    assert paid_count() == 1
+
+    # Sự kiện khác của cùng giao dịch (status khác) vẫn được xử lý
+    body = {"transaction_id": "TXN-RETRY", "status": "failed"}
+    assert client.post("/api/v1/payments/webhook", json=body, headers={**headers, **signed(body)}).json()["result"] == "queued"
+    assert webhook_worker.run_once() == 1
+
+    print("✅ Webhook gửi lại OK")
+    return True
+
+
+def test_rejected(headers):
+    """Thiếu dữ liệu: 400; sai chữ ký: 401; cả hai không ghi gì vào outbox"""
+    print("🚫 Đang kiểm tra webhook bị từ chối...")
+    body = {"transaction_id": "TXN-UNKNOWN"}
+    assert client.post("/api/v1/payments/webhook", json=body, headers={**headers, **signed(body)}).status_code == 400
+    body = {"transaction_id": "TXN-UNKNOWN", "status": "success"}
+    assert client.post("/api/v1/payments/webhook", json=body, headers={**headers, "X-Signature": "sai"}).status_code == 401
+    db = SessionLocal()
+    try:
+        assert db.query(WebhookEvent).filter(WebhookEvent.transaction_id == "TXN-UNKNOWN").count() == 0
+    finally:
+        db.close()
+    print("✅ Webhook bị từ chối OK")
+    return True
+
+
+def test_concurrent_deliveries():
+    """Nhiều lần gửi đồng thời cùng sự kiện: đúng một lần QUEUED, xử lý một lần"""
+    print("🏁 Đang kiểm tra webhook gửi đồng thời...")
+    before = paid_count()
+    barrier = threading.Barrier(5)
+    results, errors = [], []
+
+    def deliver():
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            results.append(PaymentService(db).enqueue_webhook({"transaction_id": "TXN-RACE", "status": "success"}))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=deliver) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"   Kết quả: {[r.value for r in results]}, lỗi: {errors}")
+    assert not errors
+    assert results.count(WebhookResult.QUEUED) == 1 and results.count(WebhookResult.DUPLICATE) == 4
+    assert webhook_worker.run_once() == 1
+    assert paid_count() == before + 1
+    print("✅ Webhook gửi đồng thời OK")
+    return True
+
+
+def test_manual_confirm_and_refund(headers):
+    """Xác nhận thủ công và webhook cùng giao dịch chỉ cộng một lần; hoàn tiền trả đơn về PENDING"""
+    print("🧾 Đang kiểm tra xác nhận thủ công / hoàn tiền...")
+    db = SessionLocal()
+    try:
+        payment = db.query(Payment).filter(Payment.payment_code == "TXN-MANUAL").one()
+        payment_id, order_id = payment.id, payment.order_id
+    finally:
+        db.close()
+    before = paid_count()
+
+    # Webhook đã xếp hàng nhưng kế toán xác nhận trước: worker thấy SUCCESS trên dòng đã khóa
+    body = {"transaction_id": "TXN-MANUAL", "status": "success"}
+    assert client.post("/api/v1/payments/webhook", json=body, headers={**headers, **signed(body)}).json()["result"] == "queued"
+    response = client.post(f"/api/v1/payments/{payment_id}/confirm", headers=headers)
+    assert response.status_code == 200, response.text
+    assert webhook_worker.run_once() == 1
+    assert client.post(f"/api/v1/payments/{payment_id}/confirm", headers=headers).json()["message"] == "Giao dịch đã ở trạng thái thành công"
+    assert paid_count() == before + 1, "Xác nhận thủ công và webhook không được cộng doanh thu hai lần"
+
+    response = client.post(f"/api/v1/payments/{payment_id}/refund", headers=headers)
+    assert response.status_code == 200, response.text
+    db = SessionLocal()
+    try:
+        assert db.get(Payment, payment_id).status == PaymentStatus.FAILED
+        assert db.get(Order, order_id).status == OrderStatus.PENDING, "Hoàn tiền phải đưa đơn về PENDING như webhook failed"
+    finally:
+        db.close()
+    assert paid_count() == before
+    print("✅ Xác nhận thủ công / hoàn tiền OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    seed(["TXN-RETRY", "TXN-RACE", "TXN-MANUAL"])
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    results = [
+        test_retry_is_acknowledged(headers),
+        test_rejected(headers),
+        test_concurrent_deliveries(),
+        test_manual_confirm_and_refund(headers),
+    ]
+    if all(results):
+        print("🎉 Webhook idempotent hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Script kiểm tra hàng đợi webhook (outbox): endpoint chỉ ghi sự kiện và trả 200 ngay,
+worker nền cập nhật đơn hàng, thử lại với backoff, lấy lại sự kiện bị bỏ dở và báo độ trễ.
+Chạy trên SQLite tạm
+
+    python test_webhook_outbox.py
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "webhook_outbox.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("WEBHOOK_RATE_LIMIT", "1000")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+
+import app.database as database
+from app.main import app
+from app.database import SessionLocal
+from app.core.outbox import utcnow
+from app.models import EmailOutbox, User, Student, Order, Payment, DailyRollup, WebhookEvent, UserRole, OrderStatus, OutboxState, PaymentStatus
+from app.services.webhook_worker import WebhookWorker, webhook_worker
+
+client = TestClient(app)
+
+
+def sent_emails():
+    """Người nhận các email xác nhận thanh toán worker đã xếp vào hàng đợi"""
+    db = SessionLocal()
+    try:
+        return db.scalars(
+            select(EmailOutbox.recipient).where(EmailOutbox.kind == "payment_confirmation").order_by(EmailOutbox.id)
+        ).all()
+    finally:
+        db.close()
+
+
+def seed(codes):
+    db = SessionLocal()
+    try:
+        parent = db.query(User).filter(User.email == "outbox@example.com").first() or User(
+            name="Phụ huynh", email="outbox@example.com", role=UserRole.PARENT, hashed_password="x")
+        student = Student(parent=parent, name="Học sinh", student_code=f"HS-{codes[0]}", class_name="2A")
+        for code in codes:
+            order = Order(student=student, order_code=f"ORD-{code}", description="Học phí",
+                          amount=Decimal("300000"), status=OrderStatus.PENDING)
+            db.add(Payment(order=order, payment_code=code, amount=Decimal("300000"), status=PaymentStatus.PENDING))
+        db.add_all([parent, student])
+        db.commit()
+    finally:
+        db.close()
+
+
+def post_webhook(headers, transaction_id, status="success"):
+    body = {"transaction_id": transaction_id, "status": status}
+    signature = hmac.new(b"dev-secret", json.dumps(body, separators=(",", ":")).encode(), hashlib.sha256).hexdigest()
+    return client.post("/api/v1/payments/webhook", json=body, headers={**headers, "X-Signature": signature})
+
+
+def order_status(code):
+    db = SessionLocal()
+    try:
+        return db.query(Order.status).filter(Order.order_code == f"ORD-{code}").scalar()
+    finally:
+        db.close()
+
+
+def load_event(transaction_id):
+    db = SessionLocal()
+    try:
+        return db.query(WebhookEvent).filter(WebhookEvent.transaction_id == transaction_id).one()
+    finally:
+        db.close()
+
+
+def test_fast_ack(headers):
+    """Endpoint chỉ ghi outbox (không đụng payments/orders); worker cập nhật đơn hàng và gửi email"""
+    print("⚡ Đang kiểm tra webhook trả lời ngay...")
+    statements = []
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = database.async_engine.sync_engine if database.async_engine is not None else database.engine
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    try:
+        response = post_webhook(headers, "TXN-OB-FAST")
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_execute)
+    assert response.status_code == 200 and response.json()["result"] == "queued", response.text
+    touched = [s for s in statements if "payments" in s or "orders" in s]
+    print(f"   Webhook: {len(statements)} truy vấn, {len(touched)} truy vấn payments/orders")
+    assert not touched, touched
+    assert order_status("TXN-OB-FAST") == OrderStatus.PENDING and not sent_emails()
+
+    assert webhook_worker.run_once() == 1
+    assert order_status("TXN-OB-FAST") == OrderStatus.PAID
+    assert len(sent_emails()) == 1 and sent_emails()[0] == "outbox@example.com"
+    processed = load_event("TXN-OB-FAST")
+    assert processed.state == OutboxState.DONE and processed.attempts == 1 and processed.payment_id
+    print("✅ Webhook trả lời ngay OK")
+    return True
+
+
+def test_retry_and_dead_letter(headers):
+    """Sự kiện lỗi được thử lại theo backoff, hết lượt thì FAILED; gửi lại sau đó được xếp hàng lại"""
+    print("🔁 Đang kiểm tra thử lại và thất bại...")
+    worker = WebhookWorker(SessionLocal, max_attempts=2, retry_base_seconds=30)
+    assert post_webhook(headers, "TXN-OB-LATE").json()["result"] == "queued"
+
+    assert worker.run_once() == 1
+    failed_once = load_event("TXN-OB-LATE")
+    assert failed_once.state == OutboxState.PENDING and failed_once.attempts == 1
+    assert "TXN-OB-LATE" in failed_once.last_error
+    assert failed_once.available_at > utcnow() + timedelta(seconds=25), "Lần thử tiếp phải chờ backoff"
+    assert worker.run_once() == 0, "Sự kiện chưa tới hạn thử lại"
+
+    _make_due("TXN-OB-LATE")
+    assert worker.run_once() == 1
+    dead = load_event("TXN-OB-LATE")
+    assert dead.state == OutboxState.FAILED and dead.attempts == 2
+    assert worker.stats()["retried"] == 1 and worker.stats()["failed"] == 1
+
+    # Giao dịch được tạo muộn; cổng thanh toán gửi lại -> xếp hàng lại và xử lý được
+    seed(["TXN-OB-LATE"])
+    assert post_webhook(headers, "TXN-OB-LATE").json()["result"] == "queued"
+    assert worker.run_once() == 1
+    assert load_event("TXN-OB-LATE").state == OutboxState.DONE
+    assert order_status("TXN-OB-LATE") == OrderStatus.PAID
+    print("✅ Thử lại và thất bại OK")
+    return True
+
+
+def _make_due(transaction_id):
+    db = SessionLocal()
+    try:
+        db.query(WebhookEvent).filter(WebhookEvent.transaction_id == transaction_id).update(
+            {"available_at": utcnow() - timedelta(seconds=1)}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_expired_lease(headers):
+    """Sự kiện PROCESSING của worker đã chết được lấy lại khi hết lease, còn lease thì không"""
+    print("⏱️ Đang kiểm tra lease...")
+    assert post_webhook(headers, "TXN-OB-LEASE").json()["result"] == "queued"
+    db = SessionLocal()
+    try:
+        db.query(WebhookEvent).filter(WebhookEvent.transaction_id == "TXN-OB-LEASE").update(
+            {"state": OutboxState.PROCESSING, "attempts": 1, "available_at": utcnow() + timedelta(seconds=60)}
+        )
+        db.commit()
+    finally:
+        db.close()
+    assert webhook_worker.run_once() == 0, "Sự kiện còn lease không được xử lý lại"
+
+    _make_due("TXN-OB-LEASE")
+    assert webhook_worker.run_once() == 1
+    assert load_event("TXN-OB-LEASE").state == OutboxState.DONE
+    assert order_status("TXN-OB-LEASE") == OrderStatus.PAID
+    print("✅ Lease OK")
+    return True
+
+
+def test_parallel_workers(headers):
+    """Nhiều worker cùng quét outbox: mỗi sự kiện được xử lý đúng một lần"""
+    print("🏁 Đang kiểm tra nhiều worker song song...")
+    codes = [f"TXN-OB-PAR-{i}" for i in range(20)]
+    seed(codes)
+    for code in codes:
+        assert post_webhook(headers, code).json()["result"] == "queued"
+    emails_before = len(sent_emails())
+
+    workers = [WebhookWorker(SessionLocal, batch_size=20) for _ in range(4)]
+    barrier = threading.Barrier(len(workers))
+    handled, errors = [], []
+
+    def run(worker):
+        try:
+            barrier.wait()
+            handled.append(worker.run_once())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"   Số sự kiện mỗi worker: {handled}, lỗi: {errors}")
+    assert not errors and sum(handled) == len(codes)
+    assert len(sent_emails()) - emails_before == len(codes)
+    db = SessionLocal()
+    try:
+        paid = sum(r.payment_count for r in db.query(DailyRollup).filter(DailyRollup.class_name == "2A", DailyRollup.status == OrderStatus.PAID))
+        assert db.query(WebhookEvent).filter(WebhookEvent.transaction_id.in_(codes), WebhookEvent.attempts == 1).count() == len(codes)
+    finally:
+        db.close()
+    # TXN-OB-FAST, TXN-OB-LATE, TXN-OB-LEASE + 20 sự kiện song song
+    assert paid == len(codes) + 3, paid
+    print("✅ Nhiều worker song song OK")
+    return True
+
+
+def test_background_thread_and_metrics(headers):
+    """Worker chạy nền được đánh thức ngay khi có webhook; /monitoring/webhooks báo hàng đợi và độ trễ"""
+    print("📈 Đang kiểm tra worker nền và số liệu...")
+    seed(["TXN-OB-BG"])
+    webhook_worker.poll_seconds = 30
+    webhook_worker.start()
+    try:
+        started = time.perf_counter()
+        assert post_webhook(headers, "TXN-OB-BG").json()["result"] == "queued"
+        while order_status("TXN-OB-BG") != OrderStatus.PAID and time.perf_counter() - started < 5:
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - started
+    finally:
+        webhook_worker.stop()
+    print(f"   Đơn hàng được cập nhật sau {elapsed * 1000:.0f} ms")
+    assert order_status("TXN-OB-BG") == OrderStatus.PAID and elapsed < 5
+
+    assert post_webhook(headers, "TXN-OB-WAITING").json()["result"] == "queued"
+    response = client.get("/api/v1/monitoring/webhooks", headers=headers)
+    assert response.status_code == 200, response.text
+    stats = response.json()
+    print(f"   Số liệu: {stats}")
+    # Worker toàn cục đã xử lý TXN-OB-FAST, TXN-OB-LEASE và TXN-OB-BG
+    assert stats["processed"] == 3 and stats["lag_max_seconds"] >= 0 and stats["running"] is False
+    assert stats["queue"]["pending"] == 1 and stats["queue"]["failed"] == 0
+    assert stats["queue"]["oldest_pending_age_seconds"] >= 0
+    print("✅ Worker nền và số liệu OK")
+    return True
+
+
+def main():
+    """Chạy toàn bộ kiểm tra"""
+    seed(["TXN-OB-FAST", "TXN-OB-LEASE"])
+    token = client.post("/api/v1/auth/login", json={"email": "admin@example.com", "password": "Admin@123"}).json()["data"]["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    results = [
+        test_fast_ack(headers),
+        test_retry_and_dead_letter(headers),
+        test_expired_lease(headers),
+        test_parallel_workers(headers),
+        test_background_thread_and_metrics(headers),
+    ]
+    if all(results):
+        print("🎉 Hàng đợi webhook hoạt động đúng")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())